@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import warnings
+from contextlib import contextmanager
+
+from loguru import logger
+from omegaconf import DictConfig, OmegaConf
+
+from pipeline_tabular.config_manager import ConfigManager
+from pipeline_tabular.data_handler.data_handler import DataHandler
+from pipeline_tabular.utils.instrumentation import Instrumentation, cpu_time
+from pipeline_tabular.utils.memory import peak_rss, reset_peak_rss
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_settings(settings_file: str = None) -> DictConfig:
+    """Benchmark settings, benchmarks/benchmark.yaml by default"""
+    settings_file = settings_file or os.path.join(REPO_DIR, 'benchmarks', 'benchmark.yaml')
+    logger.info(f'Loading benchmark settings -> {settings_file}')
+    return OmegaConf.load(settings_file)
+
+
+def pipeline_config(settings: DictConfig, experiment: str, models: list, **overrides) -> DictConfig:
+    """Pipeline config of a benchmark experiment, config.yaml of the repository with the overlay of the settings
+
+    Only the given models are enabled, overrides are dotted config keys, e.g. **{'meta.workers': 4}.
+    """
+    config = OmegaConf.load(os.path.join(REPO_DIR, 'config.yaml'))
+    overlay = settings.pipeline
+    config = OmegaConf.merge(config, OmegaConf.masked_copy(overlay, [key for key in overlay if key != 'verification']))
+    for key, value in overlay.verification.items():
+        if key != 'param_grids':
+            OmegaConf.update(config, f'verification.{key}', value, merge=True)
+    for model, param_grid in overlay.verification.param_grids.items():  # replace, not merge the grids
+        OmegaConf.update(config, f'verification.param_grids.{model}', param_grid, merge=False)
+    config.meta.output_dir = os.path.abspath(settings.output_dir)
+    config.meta.experiment = experiment
+    config.meta.learn_task = settings.synthetic.learn_task
+    config.verification.models = {model: model in models for model in config.verification.models}
+    for key, value in overrides.items():
+        OmegaConf.update(config, key, value, merge=False)
+    ConfigManager.expand_threshold_sweeps(config)
+    experiment_dir = os.path.join(config.meta.output_dir, experiment)
+    os.makedirs(experiment_dir, exist_ok=True)
+    OmegaConf.save(config, os.path.join(experiment_dir, 'job_config.yaml'))  # as main.py, read by CollectResults
+    return config
+
+
+def setup_logging(config: DictConfig) -> None:
+    logger.remove()
+    logger.add(sys.stderr, level=config.meta.logging_level)
+    if config.meta.ignore_warnings:
+        warnings.simplefilter('ignore')
+        os.environ['PYTHONWARNINGS'] = 'ignore'
+
+
+def reset_stores() -> None:
+    """Empty the stores shared by all DataHandler instances, e.g. between benchmarked sizes"""
+    for name in ['_frame_store', '_feature_store', '_feature_score_store', '_score_store']:
+        DataHandler.shared_state[name].clear()
+
+
+@contextmanager
+def measure(record: dict):
+    """Add wall time, CPU time (incl. finished child processes), model fits and peak RSS of the enclosed code"""
+    reset_peak_rss()
+    start, cpu_start, fits_start = time.perf_counter(), cpu_time(), Instrumentation.n_fits
+    yield record
+    record.update(
+        {
+            'wall': time.perf_counter() - start,
+            'cpu': cpu_time() - cpu_start,
+            'n_fits': Instrumentation.n_fits - fits_start,
+            'peak_rss': peak_rss(),
+        }
+    )
@@ -0,0 +1,231 @@
+import argparse
+import itertools
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from loguru import logger
+from omegaconf import DictConfig
+
+from benchmarks.helpers import load_settings, measure, pipeline_config, reset_stores, setup_logging
+from benchmarks.synthetic import SyntheticData
+from collect_results import CollectResults
+from pipeline_tabular.data_handler.data_handler import DataHandler, NestedDefaultDict
+from pipeline_tabular.run.run import Run
+from pipeline_tabular.utils.data_split import FoldCache
+from pipeline_tabular.utils.inspections import CleanUp
+from pipeline_tabular.utils.instrumentation import Instrumentation
+from pipeline_tabular.utils.selections import Selection
+
+
+class StageScaling:
+    """Time the pipeline stages on synthetic tables of increasing size and fit their scaling curves
+
+    Every combination of stage_scaling.n_samples and n_features is benchmarked: CleanUp, each imputer, each selection
+    step (on the imputed and normalised training frame, independently of each other), the verification of each model
+    on the top n_top features and CollectResults on a small experiment. Caches of the seed (folds, threshold
+    independent selection results) are released before every repetition. Results are written to
+    <output_dir>/stage_scaling: raw timings, medians per size, scaling exponents (slope of log time over log size) and
+    log-log scaling curves per stage group.
+    """
+
+    groups = ['clean_up', 'impute', 'selection', 'verification', 'collect_results']
+
+    def __init__(self, settings: DictConfig) -> None:
+        self.settings = settings
+        self.scaling = settings.stage_scaling
+        self.repeats = settings.repeats
+        self.out_dir = os.path.join(os.path.abspath(settings.output_dir), 'stage_scaling')
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.plot_format = settings.pipeline.meta.get('plot_format', 'png')
+        self.records = []
+        self.store = DataHandler()  # not a DataHandler itself, its attributes would be shared with the pipeline
+
+    def __call__(self) -> None:
+        sizes = list(itertools.product(self.scaling.n_samples, self.scaling.n_features))
+        for size_iter, (n_samples, n_features) in enumerate(sizes):
+            logger.info(f'Benchmarking size {size_iter+1}/{len(sizes)}: {n_samples} samples, {n_features} features...')
+            self.benchmark_size(n_samples, n_features)
+            pd.DataFrame(self.records).to_csv(os.path.join(self.out_dir, 'stage_scaling.csv'), index=False)
+        summary = self.summarise()
+        self.scaling_exponents(summary)
+        for group in self.groups:
+            self.plot_scaling(summary[summary['group'] == group], group)
+        logger.info(f'Stage scaling results written to {self.out_dir}')
+
+    def benchmark_size(self, n_samples: int, n_features: int) -> None:
+        experiment = f'scaling_n{n_samples}_p{n_features}'
+        config = pipeline_config(
+            self.settings,
+            experiment,
+            list(self.scaling.models),
+            **{'verification.use_n_top_features': [self.scaling.n_top]},
+        )
+        setup_logging(config)
+        frame = SyntheticData(
+            n_samples=n_samples,
+            n_features=n_features,
+            target_label=config.meta.target_label,
+            index_label=config.inspection.label_as_index,
+            seed=config.data_split.init_seed,
+            **self.settings.synthetic,
+        )()
+        self.size = {'n_samples': n_samples, 'n_features': n_features}
+        reset_stores()
+        run = Run(config)  # sets up the executor and random streams shared by the stages
+        with run.resources.limit(run.cpu_layout, **run.executor.backend_config()):
+            self.time_clean_up(config, frame)
+            seed = run.streams.seeds(1)[0]
+            boot_seed = run.streams.boot_seeds(seed, 1)[0]
+            self.time_imputers(run, config, seed, boot_seed)
+            self.time_selection(run, config, seed)
+            self.time_verification(run, seed)
+            run.executor.release(seed)
+            FoldCache.release(seed)
+            Selection.release_cache(seed)
+        run.executor.shutdown()
+        if self.scaling.collect_results:
+            self.time_collect_results(frame)
+
+    def time(self, group: str, stage: str, func, *args, before=None) -> None:
+        """Time func(*args) repeats times, before() is called (untimed) before every repetition"""
+        for repeat in range(self.repeats):
+            if before is not None:
+                before()
+            with measure({'group': group, 'stage': stage, **self.size, 'repeat': repeat}) as record:
+                func(*args)
+            self.records.append(record)
+
+    def time_clean_up(self, config: DictConfig, frame: pd.DataFrame) -> None:
+        self.time('clean_up', 'clean_up', lambda: CleanUp(config)(), before=lambda: self.store.set_frame(frame.copy()))
+
+    def time_imputers(self, run: Run, config: DictConfig, seed, boot_seed) -> None:
+        """Time each imputer on the same split, then impute the split with the configured method for the next stages"""
+        for method in self.scaling.imputers:
+            if method == 'drop_nan_impute':  # not available, see Imputer
+                logger.warning(f'Skipping {method}, it is not implemented')
+                continue
+            run.imputation.impute_method = method
+            self.time('impute', method, run.imputation, seed, before=lambda: run.data_split(seed, boot_seed))
+        run.imputation.impute_method = config.impute.method
+        run.data_split(seed, boot_seed)
+        run.imputation(seed)
+
+    def time_selection(self, run: Run, config: DictConfig, seed) -> None:
+        """Time each selection step on the normalised training frame"""
+        train, _ = run.z_score_norm(run.get_store('frame', seed, 'train').copy())  # as the first step of a job
+        run.selection.job_name = 'benchmark'
+        run.selection.job_dir = os.path.join(config.meta.output_dir, config.meta.experiment, 'benchmark')
+        os.makedirs(run.selection.job_dir, exist_ok=True)
+        for step in self.scaling.steps:
+            self.time(
+                'selection',
+                step,
+                lambda: run.selection.process_job(step, train.copy(), seed),
+                before=lambda: (Selection.release_cache(seed), FoldCache.release(seed)),
+            )
+
+    def time_verification(self, run: Run, seed) -> None:
+        """Time the verification of each model on the first n_top features"""
+        target_label = run.config.meta.target_label
+        features = [column for column in run.get_store('frame', seed, 'train').columns if column != target_label]
+        run.set_store('feature', seed, 'benchmark', features, 0)
+        run.verification.job_norms['benchmark'] = 'z_score_norm'
+        n_top = run.verification.valid_n_top(features)[0]
+        for model in self.scaling.models:
+
+            def init_scores():  # empty score container of the cell, as initialised by Run
+                scores = NestedDefaultDict()
+                scores[model] = {score: [] for score in run.scores_to_init + ['probas', 'true', 'pred']}
+                run.set_store('score', seed, f'benchmark_{n_top}', scores)
+                FoldCache.release(seed)
+
+            self.time(
+                'verification',
+                model,
+                lambda: run.verification(seed, 0, 'benchmark', None, model=[model]),
+                before=init_scores,
+            )
+
+    def time_collect_results(self, frame: pd.DataFrame) -> None:
+        """Run a small experiment on the table and time CollectResults on it"""
+        experiment = f'collect_n{self.size["n_samples"]}_p{self.size["n_features"]}'
+        config = pipeline_config(
+            self.settings,
+            experiment,
+            list(self.scaling.models),
+            **{
+                'data_split.n_seeds': self.scaling.collect_seeds,
+                'collect_results.experiments': {experiment: f'{self.size["n_samples"]}x{self.size["n_features"]}'},
+            },
+        )
+        reset_stores()
+        self.store.set_frame(frame.copy())
+        CleanUp(config)()
+        Run(config)()
+        Instrumentation.out_file = None  # do not record the stages of the next sizes in the timings of this run
+        self.time('collect_results', 'collect_results', lambda: CollectResults(config)())
+
+    def summarise(self) -> pd.DataFrame:
+        """Median over the repetitions per stage and size"""
+        records = pd.DataFrame(self.records)
+        summary = records.groupby(['group', 'stage', 'n_samples', 'n_features'], sort=False)
+        summary = summary[['wall', 'cpu', 'n_fits', 'peak_rss']].median().reset_index()
+        summary.to_csv(os.path.join(self.out_dir, 'stage_scaling_summary.csv'), index=False)
+        return summary
+
+    def scaling_exponents(self, summary: pd.DataFrame) -> None:
+        """Slope of log wall time over log n_samples (at the largest n_features) and vice versa per stage
+
+        An exponent of 1 means linear scaling, 2 quadratic, etc. Exponents of stages taking only a few milliseconds
+        are dominated by overhead.
+        """
+        exponents = []
+        for (group, stage), stage_summary in summary.groupby(['group', 'stage'], sort=False):
+            exponent = {'group': group, 'stage': stage}
+            for size, other in [('n_samples', 'n_features'), ('n_features', 'n_samples')]:
+                curve = stage_summary[stage_summary[other] == stage_summary[other].max()]
+                curve = curve[curve['wall'] > 0]
+                if curve[size].nunique() > 1:
+                    exponent[size] = np.polyfit(np.log(curve[size]), np.log(curve['wall']), 1)[0]
+            exponents.append(exponent)
+        exponents = pd.DataFrame(exponents).round(2)
+        exponents.to_csv(os.path.join(self.out_dir, 'scaling_exponents.csv'), index=False)
+        logger.info(f'Scaling exponents of the wall time:\n{exponents.to_string(index=False)}')
+
+    def plot_scaling(self, summary: pd.DataFrame, group: str) -> None:
+        """Wall time over n_samples (one line per n_features) and over n_features (one line per n_samples)"""
+        stages = list(summary['stage'].unique())
+        if not stages:
+            return
+        fig, axes = plt.subplots(len(stages), 2, figsize=(10, 3.5 * len(stages)), squeeze=False)
+        for row, stage in enumerate(stages):
+            stage_summary = summary[summary['stage'] == stage]
+            for col, (size, other) in enumerate([('n_samples', 'n_features'), ('n_features', 'n_samples')]):
+                ax = axes[row, col]
+                for other_value, curve in stage_summary.groupby(other):
+                    curve = curve.sort_values(size)
+                    ax.plot(curve[size], curve['wall'], marker='o', label=f'{other}={other_value}')
+                ax.set_xscale('log')
+                ax.set_yscale('log')
+                ax.set_xlabel(size)
+                ax.set_ylabel('wall time [s]')
+                ax.set_title(stage)
+                ax.grid(alpha=0.5, which='both')
+                ax.legend(fontsize='small')
+        plt.tight_layout()
+        plt.savefig(os.path.join(self.out_dir, f'scaling_{group}.{self.plot_format}'), dpi=150)
+        plt.close(fig)
+
+
+def stage_scaling() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default=None, help='benchmark settings, default: benchmarks/benchmark.yaml')
+    args = parser.parse_args()
+
+    StageScaling(load_settings(args.settings))()
+
+
+if __name__ == '__main__':
+    stage_scaling()
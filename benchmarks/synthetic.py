@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+class SyntheticData:
+    """Synthetic clinical/radiomics-like table with an id column, a target and n_features feature columns
+
+    Continuous features come in blocks of correlated features sharing a latent factor (like radiomics features of the
+    same region or filter), skewed and strictly positive (CleanUp treats zeros of continuous columns as missing).
+    Categorical features are integer coded with n_levels levels. The target depends on the first feature of the first
+    n_informative blocks and the first categorical feature, for binary_classification it is thresholded such that
+    pos_rate of the samples are positive. missing_frac of the feature values are missing completely at random.
+    """
+
+    def __init__(
+        self,
+        n_samples: int = 200,
+        n_features: int = 50,
+        n_informative: int = 5,
+        block_size: int = 10,
+        block_corr: float = 0.8,
+        missing_frac: float = 0.1,
+        pos_rate: float = 0.3,
+        n_categorical: int = 5,
+        n_levels: int = 3,
+        learn_task: str = 'binary_classification',
+        target_label: str = 'target',
+        index_label: str = 'id',
+        seed: int = 0,
+    ) -> None:
+        if learn_task not in ['binary_classification', 'regression']:
+            raise ValueError(f'Synthetic data is available for binary_classification and regression, not {learn_task}')
+        if not 0.0 < pos_rate < 1.0:
+            raise ValueError('"pos_rate" is invalid, must be float in (0.0, 1.0)')
+        self.n_samples = n_samples
+        self.n_categorical = min(n_categorical, n_features - 1)  # at least one continuous feature
+        self.n_continuous = n_features - self.n_categorical
+        self.n_informative = n_informative
+        self.block_size = max(block_size, 1)
+        self.block_corr = block_corr
+        self.missing_frac = missing_frac
+        self.pos_rate = pos_rate
+        self.n_levels = n_levels
+        self.learn_task = learn_task
+        self.target_label = target_label
+        self.index_label = index_label
+        self.seed = seed
+
+    def __call__(self) -> pd.DataFrame:
+        rng = np.random.default_rng(self.seed)
+        continuous, informative = self.continuous_features(rng)
+        categorical = self.categorical_features(rng)
+        if self.n_categorical:
+            informative.append(categorical.iloc[:, 0] - (self.n_levels - 1) / 2)
+        informative = np.column_stack(informative) if informative else np.zeros((self.n_samples, 1))  # pure noise
+        target = self.target(informative, rng)
+
+        features = pd.concat([continuous, categorical], axis=1)
+        features = features.mask(rng.random(features.shape) < self.missing_frac)  # missing completely at random
+        frame = pd.concat([features, pd.Series(target, name=self.target_label)], axis=1)
+        frame.insert(0, self.index_label, [f'S{i:06d}' for i in range(self.n_samples)])
+        return frame
+
+    def continuous_features(self, rng) -> tuple:
+        """Blocks of features loading on one latent factor each, return features and standardised informative ones"""
+        columns, informative = {}, []
+        n_blocks = int(np.ceil(self.n_continuous / self.block_size))
+        for block in range(n_blocks):
+            latent = rng.standard_normal(self.n_samples)
+            for i in range(min(self.block_size, self.n_continuous - block * self.block_size)):
+                values = np.sqrt(self.block_corr) * latent + np.sqrt(1 - self.block_corr) * rng.standard_normal(
+                    self.n_samples
+                )  # pairwise correlation of block_corr within the block
+                if i == 0 and block < self.n_informative:
+                    informative.append(values)
+                scale = rng.uniform(0.5, 100)  # features on very different scales, e.g. volumes and ratios
+                columns[f'block{block}_feature{i}'] = scale * np.exp(0.5 * values)  # right-skewed, positive
+        return pd.DataFrame(columns), informative
+
+    def categorical_features(self, rng) -> pd.DataFrame:
+        columns = {}
+        for i in range(self.n_categorical):
+            weights = rng.dirichlet(np.ones(self.n_levels))  # unbalanced levels
+            columns[f'categorical{i}'] = rng.choice(self.n_levels, size=self.n_samples, p=weights).astype(float)
+        return pd.DataFrame(columns)
+
+    def target(self, informative: np.ndarray, rng) -> np.ndarray:
+        """Logistic (binary) or linear (regression) target of the informative features"""
+        weights = rng.choice([-1, 1], size=informative.shape[1]) * rng.uniform(0.5, 1.5, size=informative.shape[1])
+        score = informative @ weights
+        if self.learn_task == 'regression':
+            return score + rng.standard_normal(self.n_samples)
+        score = score + rng.logistic(size=self.n_samples)  # latent score of a logistic model
+        return (score > np.quantile(score, 1 - self.pos_rate)).astype(int)
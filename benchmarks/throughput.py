@@ -0,0 +1,239 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pandas as pd
+from joblib.externals.loky import get_reusable_executor
+from loguru import logger
+from omegaconf import DictConfig, OmegaConf
+
+from benchmarks.helpers import load_settings, pipeline_config, setup_logging
+from benchmarks.synthetic import SyntheticData
+from pipeline_tabular.data_handler.data_handler import DataHandler
+from pipeline_tabular.run.run import Run
+from pipeline_tabular.utils.inspections import CleanUp, DataExploration
+from pipeline_tabular.utils.instrumentation import Instrumentation, cpu_time, load_records
+from pipeline_tabular.utils.memory import peak_rss, reset_peak_rss
+
+
+class Throughput:
+    """End-to-end throughput of the seed loop for a matrix of jobs, models, n_seeds, workers and parallel seeds
+
+    Every combination of throughput.matrix is run like main.py (CleanUp, DataExploration, Run) on the same synthetic
+    table, each in a fresh process such that the stores, class level counters and peak memory of one run do not affect
+    the next. Reported per run: seeds per hour and model fits per second of the seed loop, CPU utilisation (CPU time
+    of the run and its finished child processes per available worker second) and the peak RSS of the main process and
+    of the largest child process (forked tasks and fits, joblib workers). Results are written to
+    <output_dir>/throughput and compared against the stored baseline, runs are matched by name. Runs differing only in
+    the number of parallel seeds must produce the same scores.json, i.e. scheduled tasks give the results of the
+    sequential seed loop.
+    """
+
+    higher_is_better = ['seeds_per_hour', 'fits_per_s']
+    lower_is_better = ['peak_rss', 'peak_rss_children']
+
+    def __init__(self, settings: DictConfig, baseline_file: str = None) -> None:
+        self.settings = settings
+        self.throughput = settings.throughput
+        self.out_dir = os.path.join(os.path.abspath(settings.output_dir), 'throughput')
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.baseline_file = baseline_file or self.throughput.baseline
+        self.tolerance = self.throughput.tolerance
+
+    def __call__(self, save_baseline: bool = False) -> bool:
+        """Run the matrix, return False if a run regressed against the baseline"""
+        cells = self.cells()
+        results = []
+        for cell_iter, cell in enumerate(cells):
+            logger.info(f'Running {cell["name"]} ({cell_iter+1}/{len(cells)})...')
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                results.append(pool.submit(run_cell, OmegaConf.to_container(self.settings), cell).result())
+            pd.DataFrame(results).to_csv(os.path.join(self.out_dir, 'throughput.csv'), index=False)
+        results = pd.DataFrame(results)
+        logger.info(f'Throughput:\n{results.drop(columns=["jobs"]).round(3).to_string(index=False)}')
+        equivalent = self.check_equivalence(results)
+        if save_baseline:
+            self.save_baseline(results)
+            return equivalent
+        return self.compare(results) and equivalent
+
+    def cells(self) -> list:
+        matrix = self.throughput.matrix
+        cells = []
+        for (jobs_iter, jobs), models, n_seeds, workers, parallel_seeds in itertools.product(
+            enumerate(matrix.jobs), matrix.models, matrix.n_seeds, matrix.workers, matrix.parallel_seeds
+        ):
+            if parallel_seeds > workers:
+                continue
+            name = f'jobs{jobs_iter}_{"+".join(models)}_seeds{n_seeds}_workers{workers}_parallel{parallel_seeds}'
+            cells.append(
+                {
+                    'name': name,
+                    'jobs': OmegaConf.to_container(jobs),
+                    'models': list(models),
+                    'n_seeds': n_seeds,
+                    'workers': workers,
+                    'parallel_seeds': parallel_seeds,
+                }
+            )
+        return cells
+
+    def check_equivalence(self, results: pd.DataFrame) -> bool:
+        """Compare the scores.json of runs differing only in parallel_seeds with the run of the fewest parallel seeds"""
+        equivalent = True
+        results = results.assign(group=results['name'].str.replace(r'_parallel\d+$', '', regex=True))
+        for _, runs in results.sort_values('parallel_seeds').groupby('group', sort=False):
+            reference, *others = runs['name']
+            reference_scores = load_scores(self.settings, reference)
+            for name in others:
+                if load_scores(self.settings, name) != reference_scores:
+                    logger.warning(f'{name}: scores.json differs from {reference}')
+                    equivalent = False
+        logger.info(f'Scores of sequential and scheduled runs are {"" if equivalent else "not "}equivalent')
+        return equivalent
+
+    def save_baseline(self, results: pd.DataFrame) -> None:
+        baseline = {
+            'machine': machine(),
+            'runs': results.set_index('name')[self.higher_is_better + self.lower_is_better].to_dict('index'),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.baseline_file)), exist_ok=True)
+        with open(self.baseline_file, 'w') as file:
+            json.dump(baseline, file, indent=2)
+        logger.info(f'Baseline of {len(results)} runs written to {self.baseline_file}')
+
+    def compare(self, results: pd.DataFrame) -> bool:
+        """Ratio of each metric to the baseline, flag regressions beyond the tolerance"""
+        try:
+            with open(self.baseline_file, 'r') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            logger.warning(f'No baseline found at {self.baseline_file}, store one with --save-baseline')
+            return True
+        if baseline['machine'] != machine():
+            logger.warning(f'Baseline was measured on another machine -> {baseline["machine"]}')
+        comparison = []
+        for result in results.to_dict('records'):
+            stored = baseline['runs'].get(result['name'])
+            if stored is None:
+                continue
+            for metric in self.higher_is_better + self.lower_is_better:
+                if not stored[metric] or pd.isna(result[metric]):
+                    continue
+                ratio = result[metric] / stored[metric]
+                if metric in self.higher_is_better:
+                    regressed = ratio < 1 - self.tolerance
+                else:
+                    regressed = ratio > 1 + self.tolerance
+                comparison.append(
+                    {
+                        'name': result['name'],
+                        'metric': metric,
+                        'baseline': stored[metric],
+                        'current': result[metric],
+                        'ratio': ratio,
+                        'regressed': regressed,
+                    }
+                )
+        comparison = pd.DataFrame(comparison, columns=['name', 'metric', 'baseline', 'current', 'ratio', 'regressed'])
+        comparison.to_csv(os.path.join(self.out_dir, 'throughput_comparison.csv'), index=False)
+        regressions = comparison[comparison['regressed']]
+        for regression in regressions.to_dict('records'):
+            logger.warning(
+                f'{regression["name"]}: {regression["metric"]} regressed to {regression["ratio"]:.2f}x of the baseline'
+            )
+        logger.info(f'{len(comparison)} metrics compared against the baseline, {len(regressions)} regressed')
+        return regressions.empty
+
+
+def run_cell(settings: dict, cell: dict) -> dict:
+    """Run one combination of the matrix as main.py does, in a fresh process"""
+    settings = OmegaConf.create(settings)
+    config = pipeline_config(
+        settings,
+        f'throughput_{cell["name"]}',
+        cell['models'],
+        **{
+            'selection.jobs': cell['jobs'],
+            'data_split.n_seeds': cell['n_seeds'],
+            'meta.workers': cell['workers'],
+            'meta.cpu_layout.seeds': cell['parallel_seeds'],
+            'meta.plots': settings.throughput.plots,
+        },
+    )
+    setup_logging(config)
+    frame = SyntheticData(
+        n_samples=settings.throughput.n_samples,
+        n_features=settings.throughput.n_features,
+        target_label=config.meta.target_label,
+        index_label=config.inspection.label_as_index,
+        seed=config.data_split.init_seed,
+        **settings.synthetic,
+    )()
+    DataHandler().set_frame(frame)
+    start = time.perf_counter()
+    CleanUp(config)()
+    DataExploration(config)()
+    run = Run(config)
+    reset_peak_rss()
+    run_start, cpu_start = time.perf_counter(), cpu_time()
+    run()
+    get_reusable_executor().shutdown(wait=True)  # reap the joblib workers, their CPU time counts once they are joined
+    run_wall, run_cpu = time.perf_counter() - run_start, cpu_time() - cpu_start
+
+    records = load_records(Instrumentation.out_file)
+    n_fits = 0
+    if not records.empty and 'n_fits' in records:
+        records = records[(records['run'] == Instrumentation.run_id) & records['parent'].isna()]
+        n_fits = int(records['n_fits'].sum())  # top level stages of the main process and of the forked tasks
+    return {
+        **cell,
+        'n_jobs': len(cell['jobs']),
+        'wall': time.perf_counter() - start,
+        'run_wall': run_wall,
+        'run_cpu': run_cpu,
+        'n_fits': n_fits,
+        'seeds_per_hour': cell['n_seeds'] / run_wall * 3600,
+        'fits_per_s': n_fits / run_wall,
+        'cpu_utilisation': run_cpu / (run_wall * cell['workers']),
+        'peak_rss': peak_rss(),
+        'peak_rss_children': children_peak_rss(),
+    }
+
+
+def load_scores(settings: DictConfig, name: str) -> dict:
+    """scores.json of a run of the matrix"""
+    with open(os.path.join(os.path.abspath(settings.output_dir), f'throughput_{name}', 'scores.json'), 'r') as file:
+        return json.load(file)
+
+
+def children_peak_rss() -> int:
+    """Largest peak RSS of the finished child processes"""
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, in KB on Linux
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+
+
+def machine() -> dict:
+    return {'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def throughput() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', default=None, help='benchmark settings, default: benchmarks/benchmark.yaml')
+    parser.add_argument('--baseline', default=None, help='baseline file, default: throughput.baseline of the settings')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as baseline, do not compare')
+    args = parser.parse_args()
+
+    passed = Throughput(load_settings(args.settings), args.baseline)(save_baseline=args.save_baseline)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    throughput()
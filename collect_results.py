@@ -6,9 +6,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
-import pingouin as pg
 import sklearn.metrics as metrics
-import imblearn.metrics as imb_metrics
 from loguru import logger
 from omegaconf import OmegaConf
 from roc_utils import plot_mean_roc
@@ -16,10 +14,14 @@ from scipy.special import expit
 
 from pipeline_tabular.utils.roc_utils.roc_utils import compute_roc_aucopt
 from pipeline_tabular.config_manager import ConfigManager
-from pipeline_tabular.utils.helpers import generate_seeds, job_name_cleaner
+from pipeline_tabular.utils import plots
+from pipeline_tabular.utils.helpers import job_name_cleaner
+from pipeline_tabular.utils.instrumentation import load_records
+from pipeline_tabular.utils.plots import PlotRenderer
+from pipeline_tabular.utils.plugins import check_plugins, load_plugin
 from pipeline_tabular.data_handler.data_handler import DataHandler
 from pipeline_tabular.utils.data_split import DataSplit
-from pipeline_tabular.utils.explain.explain import Explain  # import here to avoid circular imports
+from pipeline_tabular.utils.random_streams import RandomStreams
 
 
 class CollectResults(DataHandler):
@@ -31,11 +33,11 @@ class CollectResults(DataHandler):
         os.makedirs(self.results_dir, exist_ok=True)
         self.plot_format = config.meta.plot_format
         self.learn_task = config.meta.learn_task
-        init_seed = config.data_split.init_seed
-        np.random.seed(init_seed)
+        self.init_seed = config.data_split.init_seed
         n_seeds = config.data_split.n_seeds
         self.n_bootstraps = config.data_split.n_bootstraps
-        self.seeds = generate_seeds(init_seed, n_seeds)
+        self.streams = RandomStreams(config)
+        self.seeds = self.streams.seeds(n_seeds)
         self.opt_scoring = config.selection.scoring[self.learn_task]
         models_dict = config.verification.models
         self.rep_models = [model for model in models_dict if models_dict[model]]
@@ -44,6 +46,10 @@ class CollectResults(DataHandler):
         if len(self.rep_models) < 2:  # ensemble methods need at least two models to combine their results
             self.ensemble = []
         self.explain = config.collect_results.explain
+        self.statistics = config.collect_results.get('statistics', 'pingouin')
+        check_plugins('statistics', [self.statistics])
+        if self.explain:
+            check_plugins('explainer', ['kernel_shap'])
         experiments_dict = config.collect_results.experiments
         self.to_collect = list(experiments_dict.keys())
         self.clean_experiment_names = list(experiments_dict.values())
@@ -57,10 +63,11 @@ class CollectResults(DataHandler):
         self.metrics_to_plot = [metric for metric in self.metrics_to_collect if metric not in ['roc']]
 
         plt.rcParams.update({'font.size': config.collect_results.font_size})
+        PlotRenderer.configure(config)
 
     def __call__(self) -> None:
-        self.explainer = Explain(self.config)
         self.collect_results()
+        PlotRenderer.flush()
 
     def collect_results(self):
         """Collect results over all experiments, jobs, models, seeds and bootstraps and summarise them"""
@@ -85,15 +92,23 @@ class CollectResults(DataHandler):
                 del self.to_collect[experiment_index]
                 del self.clean_experiment_names[experiment_index]
                 continue
+            experiment_config.meta.output_dir = self.out_dir  # experiments may have been moved since
+            self.experiment_config = experiment_config  # settings the experiment was run with, e.g. the backends
             self.job_names = job_name_cleaner(experiment_config.selection.jobs)
+            n_seeds = experiment_config.data_split.get('realised_seeds', experiment_config.data_split.n_seeds)
+            self.streams = RandomStreams(experiment_config)  # legacy for experiments run before data_split.rng
+            self.seeds = self.streams.seeds(n_seeds)  # adaptive runs may stop before n_seeds
             self.n_top_features = experiment_config.verification.use_n_top_features
             self.load_intermediate_results(experiment_dir)
             self.summarise_selection(experiment_name)
             self.summarise_verification(experiment_index, experiment_name)
+            self.summarise_timings(experiment_dir)
 
         self.summarise_experiments()
-        self.roc_ax.set_title('Best mean ROC')
-        self.roc_plot.savefig(os.path.join(self.results_dir, f'ROC_experiments.{self.plot_format}'), dpi=300)
+        if PlotRenderer.enabled():
+            self.roc_ax.set_title('Best mean ROC')
+            self.roc_plot.savefig(os.path.join(self.results_dir, f'ROC_experiments.{self.plot_format}'), dpi=300)
+        plt.close(self.roc_plot)
 
     def summarise_selection(self, experiment_name) -> None:
         """Summarise selection results over all seeds"""
@@ -105,32 +120,34 @@ class CollectResults(DataHandler):
             job_scores = job_scores.sort_values(by='score', ascending=True).reset_index(drop=True)
             job_scores['score'] = job_scores['score'] / job_scores['score'].sum()
 
-            try:
-                ax = job_scores.plot.barh(x='feature', y='score', figsize=(10, 10), color='green')
-            except TypeError:  # no data is available to plot, i.e. collect_results flag set to True by accident
+            if job_scores.empty:  # no data is available to plot, i.e. collect_results flag set to True by accident
                 logger.error(f'No results found to collect for job {job_name}.')
                 raise SystemExit(0)
-            fig = ax.get_figure()
-            plt.title(f'Average feature ranking')
-            plt.xlabel('Average feature ranking')
-            plt.tight_layout()
-            plt.gca().legend_.remove()
-            plt.savefig(os.path.join(out_dir, f'avg_feature_ranking_all.{self.plot_format}'), dpi=300)
-            plt.close(fig)
+            PlotRenderer.submit(
+                'minimal',
+                plots.barh,
+                os.path.join(out_dir, f'avg_feature_ranking_all.{self.plot_format}'),
+                job_scores,
+                'Average feature ranking',
+                'Average feature ranking',
+                x='feature',
+                y='score',
+                figsize=(10, 10),
+                color='green',
+            )
 
             for n_top in range(5, max(self.n_top_features), 10):
-                job_scores_n_top = job_scores.iloc[-n_top:, :]
-                ax = job_scores_n_top.plot.barh(x='feature', y='score', color='green')
-                fig = ax.get_figure()
-                plt.title(f'Average feature ranking')
-                plt.xlabel('Average feature ranking')
-                plt.tight_layout()
-                plt.gca().legend_.remove()
-                plt.savefig(
+                PlotRenderer.submit(
+                    'minimal',
+                    plots.barh,
                     os.path.join(out_dir, f'avg_feature_ranking_top{n_top}.{self.plot_format}'),
-                    dpi=300,
+                    job_scores.iloc[-n_top:, :],
+                    'Average feature ranking',
+                    'Average feature ranking',
+                    x='feature',
+                    y='score',
+                    color='green',
                 )
-                plt.close(fig)
 
     def summarise_verification(self, experiment_index, experiment_name) -> None:
         """Summarise verification results over all seeds and bootstraps"""
@@ -146,8 +163,9 @@ class CollectResults(DataHandler):
         mean_opt_scores = mean_verification_scores[f'{self.opt_scoring}_score']
         best_models = {job_name: mean_opt_scores[job_name].idxmax() for job_name in self.job_names}
         self.load_frame(os.path.join(self.out_dir, experiment_name))
-        if self.explain:
-            self.explainer(
+        if self.explain:  # re-fits the best models, hence with the estimators and splits of the experiment
+            explainer = load_plugin('explainer', 'kernel_shap')(self.experiment_config)
+            explainer(
                 experiment_name,
                 verification_scores,
                 self.opt_scoring,
@@ -169,7 +187,7 @@ class CollectResults(DataHandler):
         clean_job_name = f'Strat. {best_job_index+1}'
         best_model, best_job = mean_opt_scores.index[best_model_index], mean_opt_scores.columns[best_job_index]
 
-        if 'roc' in self.metrics_to_collect:
+        if 'roc' in self.metrics_to_collect and PlotRenderer.enabled():  # shared axes, rendered in place
             self.plot_rocs(verification_scores['roc'], best_models)
             best_roc_exp = verification_scores['roc'].loc[best_model, best_job]
             plot_mean_roc(
@@ -191,6 +209,34 @@ class CollectResults(DataHandler):
         ] + [verification_scores[metric].loc[best_model][best_job] for metric in ['n_top'] + self.metrics_to_plot]
         self.get_predictions_with_id(verification_scores, best_job, best_model, experiment_name)
 
+    def summarise_timings(self, experiment_dir) -> None:
+        """Summarise wall time, CPU time and fits per stage, job and model across seeds (see timings.jsonl)"""
+        records = load_records(os.path.join(experiment_dir, 'timings.jsonl'))
+        if records.empty:
+            logger.info(f'No timings found in {experiment_dir}, skipping timing summary')
+            return
+        for column in ['seed', 'job', 'model', 'n_top']:
+            if column not in records:
+                records[column] = None
+        records[['job', 'model']] = records[['job', 'model']].fillna('-')
+        summary = records.groupby(['stage', 'job', 'model'], dropna=False).agg(
+            n_calls=('wall', 'size'),
+            n_seeds=('seed', 'nunique'),
+            wall_total=('wall', 'sum'),
+            wall_mean=('wall', 'mean'),
+            cpu_total=('cpu', 'sum'),
+            n_fits=('n_fits', 'sum'),
+        )
+        summary['wall_share'] = summary['wall_total'] / records.loc[records['parent'].isna(), 'wall'].sum()
+        summary = summary.sort_values('wall_total', ascending=False)
+        summary.round(3).to_csv(os.path.join(self.report_dir, 'timings.csv'))
+        logger.info(f'Most expensive stages:\n{summary.head(10).round(2).to_string()}')
+
+        order = list(summary.groupby('stage')['wall_total'].sum().sort_values(ascending=False).index)
+        PlotRenderer.submit(
+            'minimal', plots.timings, os.path.join(self.report_dir, f'timings.{self.plot_format}'), records, order
+        )
+
     def summarise_experiments(self) -> None:
         """Summarise results across experiments"""
         self.compute_statistics()
@@ -198,15 +244,18 @@ class CollectResults(DataHandler):
         results_to_plot = self.results.explode(self.metrics_to_plot)  # expand lists into columns
         plt.rcParams.update({'font.size': self.config.collect_results.font_size - 5})
         for metric in self.metrics_to_plot:
-            fig = plt.figure()
-            sns.boxplot(data=results_to_plot, x='experiment', y=metric)
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            fig.savefig(os.path.join(self.results_dir, f'{metric}_boxplot.{self.plot_format}'), dpi=300)
-            plt.close(fig)
+            PlotRenderer.submit(
+                'minimal',
+                plots.boxplot,
+                os.path.join(self.results_dir, f'{metric}_boxplot.{self.plot_format}'),
+                results_to_plot[['experiment', metric]],
+                'experiment',
+                metric,
+            )
         plt.rcParams.update({'font.size': self.config.collect_results.font_size})
 
     def compute_statistics(self):
+        mwu = load_plugin('statistics', self.statistics)
         for metric in self.metrics_to_plot:
             data = self.metrics_for_stats[metric]
             if not data:  # empty dict
@@ -224,42 +273,51 @@ class CollectResults(DataHandler):
                     for j, job_2 in enumerate(exp_jobs):
                         if i >= j:  # only compute upper triangle
                             continue
-                        stats_all_jobs.iloc[i, j] = pg.mwu(
-                            best_scores_all_jobs.loc[self.best_models_per_job[experiment_name][job_1]][job_1],
-                            best_scores_all_jobs.loc[self.best_models_per_job[experiment_name][job_2]][job_2],
-                        ).round(2)['p-val'][0]
-                fig = plt.figure()
+                        stats_all_jobs.iloc[i, j] = round(
+                            mwu(
+                                best_scores_all_jobs.loc[self.best_models_per_job[experiment_name][job_1]][job_1],
+                                best_scores_all_jobs.loc[self.best_models_per_job[experiment_name][job_2]][job_2],
+                            ),
+                            2,
+                        )
                 stats_all_jobs = stats_all_jobs.dropna(axis=1, how='all').dropna(axis=0, how='all')
                 if not stats_all_jobs.empty:  # will be empty for one job
-                    sns.heatmap(stats_all_jobs.astype(float), annot=True, cmap='PuBuGn', fmt='.2f')
-                    plt.title(f'Mann-Whitney U test p-values for best {metric}')
-                    plt.xticks(rotation=45, ha='right')
-                    plt.yticks(rotation=0)
-                    plt.tight_layout()
-                    fig.savefig(
+                    PlotRenderer.submit(
+                        'minimal',
+                        plots.heatmap,
                         os.path.join(self.results_dir, f'mwu_pvals_{metric}_{experiment_name}.{self.plot_format}'),
-                        dpi=300,
+                        stats_all_jobs.astype(float),
+                        title=f'Mann-Whitney U test p-values for best {metric}',
+                        rotation=45,
+                        ha='right',
+                        annot=True,
+                        cmap='PuBuGn',
+                        fmt='.2f',
                     )
-                    plt.close(fig)
 
             stats_all_exp = pd.DataFrame(index=self.to_collect, columns=self.to_collect)
             for i, exp_1 in enumerate(self.to_collect):
                 for j, exp_2 in enumerate(self.to_collect):
                     if i >= j:  # only compute upper triangle
                         continue
-                    stats_all_exp.loc[exp_1, exp_2] = pg.mwu(best_scores[exp_1], best_scores[exp_2]).round(2)['p-val'][
-                        0
-                    ]
-            fig = plt.figure(figsize=(15, 15))
+                    stats_all_exp.loc[exp_1, exp_2] = round(mwu(best_scores[exp_1], best_scores[exp_2]), 2)
             stats_all_exp = stats_all_exp.dropna(axis=1, how='all').dropna(axis=0, how='all')
             if not stats_all_exp.empty:  # will be empty for one experiment
-                sns.heatmap(stats_all_exp.astype(float), annot=True, cmap='PuBuGn', fmt='.2f')
-                plt.title(f'Mann-Whitney U test p-values for best {metric}')
-                plt.xticks(ticks=plt.xticks()[0], labels=self.clean_experiment_names[1:], rotation=45, ha='right')
-                plt.yticks(ticks=plt.yticks()[0], labels=self.clean_experiment_names[:-1], rotation=0)
-                plt.tight_layout()
-                fig.savefig(os.path.join(self.results_dir, f'mwu_pvals_{metric}.{self.plot_format}'), dpi=300)
-                plt.close(fig)
+                PlotRenderer.submit(
+                    'minimal',
+                    plots.heatmap,
+                    os.path.join(self.results_dir, f'mwu_pvals_{metric}.{self.plot_format}'),
+                    stats_all_exp.astype(float),
+                    title=f'Mann-Whitney U test p-values for best {metric}',
+                    figsize=(15, 15),
+                    rotation=45,
+                    ha='right',
+                    xticklabels=self.clean_experiment_names[1:],
+                    yticklabels=self.clean_experiment_names[:-1],
+                    annot=True,
+                    cmap='PuBuGn',
+                    fmt='.2f',
+                )
 
     def save_mean_results(self):
         mean_results = pd.DataFrame(index=self.results.index, columns=self.results.columns)
@@ -275,7 +333,10 @@ class CollectResults(DataHandler):
         for job_index, job_name in enumerate(self.job_names):
             for model in self.rep_models + self.ensemble:
                 best_mean_opt_score, self.higher_is_better = self.init_scoring()
-                for n_top in self.n_top_features:  # find best number of features for each job/model combination
+                raced_n_top = [
+                    n_top for n_top in self.n_top_features if not self.is_pruned(f'{job_name}_{n_top}', model)
+                ]
+                for n_top in raced_n_top or self.n_top_features:  # find best number of features for each job/model
                     all_scores, roc, conf_matrix = self.collect_scores(f'{job_name}_{n_top}', model)
                     mean_opt_score = np.mean(all_scores[f'{self.opt_scoring}_score'])
                     if (self.higher_is_better and mean_opt_score > best_mean_opt_score) or (
@@ -298,6 +359,10 @@ class CollectResults(DataHandler):
 
         return verification_scores
 
+    def is_pruned(self, job_name, model) -> bool:
+        """Whether racing stopped evaluating the job/model combination, i.e. it is only scored on the first seeds"""
+        return any(self.get_store('score', seed, job_name).get(model, {}).get('pruned', False) for seed in self.seeds)
+
     def collect_scores(self, job_name, model) -> None:
         """Collect results over all seeds and bootstraps"""
         all_scores = {score: [] for score in self.metrics_to_collect}
@@ -365,6 +430,8 @@ class CollectResults(DataHandler):
                 for boot_iter in range(self.n_bootstraps)
             ]
         except AttributeError:  # try imbalanced learn metrics (e.g. for specificity)
+            import imblearn.metrics as imb_metrics
+
             scores[score] = [
                 getattr(imb_metrics, score)(
                     scores['true'][boot_iter],
@@ -418,19 +485,22 @@ class CollectResults(DataHandler):
         roc_plot.savefig(os.path.join(self.report_dir, f'ROC_best_per_strat.{self.plot_format}'), dpi=300)
 
     def plot_conf_matrix(self, conf_matrix, job_index):
-        plt.figure()
-        plt.tight_layout()
-        conf_matrix = metrics.ConfusionMatrixDisplay(conf_matrix)
-        conf_matrix.plot(cmap='Blues', values_format='.2f')
-        plt.savefig(os.path.join(self.report_dir, f'confusion_matrix_strat_{job_index}.{self.plot_format}'), dpi=300)
-        plt.clf()
+        PlotRenderer.submit(
+            'minimal',
+            plots.confusion_matrix,
+            os.path.join(self.report_dir, f'confusion_matrix_strat_{job_index}.{self.plot_format}'),
+            conf_matrix,
+        )
 
     def plot_heatmaps(self, mean_scores):
         cmaps = ['Blues', 'Greens', 'Reds', 'Purples', 'Oranges', 'Greys', 'YlGnBu', 'YlOrRd', 'PuBu', 'PuRd']
         for i, score in enumerate(self.metrics_to_plot):
-            fig = plt.figure()
-            sns.heatmap(
+            PlotRenderer.submit(
+                'minimal',
+                plots.heatmap,
+                os.path.join(self.report_dir, f'results_heatmap_{self.metrics_to_plot[i]}.{self.plot_format}'),
                 mean_scores[score],
+                rotation=45,
                 annot=True,
                 xticklabels=[f'Strat. {i+1}' for i in range(len(self.job_names))],
                 yticklabels=True,
@@ -439,13 +509,6 @@ class CollectResults(DataHandler):
                 cmap=cmaps[i],
                 fmt='.2g',
             )
-            plt.xticks(rotation=45)
-            plt.yticks(rotation=0)
-            plt.tight_layout()
-            plt.savefig(
-                os.path.join(self.report_dir, f'results_heatmap_{self.metrics_to_plot[i]}.{self.plot_format}'), dpi=300
-            )
-            plt.close(fig)
 
     def init_scoring(self):
         """Find value corresponding to a bad score given the scoring metric, and return whether higher is better"""
@@ -473,7 +536,7 @@ class CollectResults(DataHandler):
         predictions_with_id = pd.DataFrame(index=all_ids, columns=self.seeds)
         best_n_top = verification_scores['n_top'].loc[best_model, best_job]
         best_job = f'{best_job}_{best_n_top}'
-        data_splitter = DataSplit(self.config)
+        data_splitter = DataSplit(self.experiment_config)
         for seed in self.seeds:
             data_splitter(seed, 0)
             test_set = data_splitter.get_store('frame', seed, 'test')
@@ -489,12 +552,9 @@ class CollectResults(DataHandler):
             predictions_with_id, index=predictions_with_id.index, columns=['probability']
         )
         predictions_with_id['redcap_id'] = predictions_with_id.index
-        if best_model in [
-            'logistic_regression',
-            'svm',
-            'adaboost',
-            'xgboost',
-        ]:  # models with decision_function -> logits
+        backend = self.experiment_config.verification.backends.get(best_model, 'sklearn')
+        logit_models = ['logistic_regression', 'svm', 'adaboost', 'xgboost']  # models with decision_function
+        if best_model in logit_models and backend in ['sklearn', 'hist']:  # -> logits
             predictions_with_id['probability'] = expit(
                 predictions_with_id['probability'].astype(float).values
             )  # convert logits to probabilities
@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 import warnings
@@ -6,12 +7,19 @@ from loguru import logger
 
 from pipeline_tabular.config_manager import ConfigManager
 from pipeline_tabular.utils.inspections import CleanUp, DataExploration
+from pipeline_tabular.run.batch import BatchRun
 from pipeline_tabular.run.data_reader import DataReader
+from pipeline_tabular.run.planner import Planner
 from pipeline_tabular.run.run import Run
 
 
 def main() -> None:
-    config = ConfigManager()()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plan', action='store_true', help='count model fits and estimate run time, do not run')
+    parser.add_argument('--batch', action='store_true', help='run all experiments of batch.experiments')
+    args = parser.parse_args()
+
+    config = ConfigManager()(save=not (args.plan or args.batch), expand=not args.batch)
     logger.remove()
     logger.add(sys.stderr, level=config.meta.logging_level)
     if config.meta.ignore_warnings:
@@ -19,7 +27,14 @@ def main() -> None:
         os.environ["PYTHONWARNINGS"] = "ignore"
 
     DataReader(config)()
+    multi_target = not isinstance(config.meta.target_label, str)
+    if args.batch or multi_target:  # cleaning is shared by the experiments/targets, each is planned on its own frame
+        BatchRun(config, batch=args.batch)(plan=args.plan)
+        return
     CleanUp(config)()
+    if args.plan:
+        Planner(config)()
+        return
     DataExploration(config)()
     Run(config)()
 
@@ -3,19 +3,28 @@ import shutil
 import sys
 
 from loguru import logger
-from omegaconf import DictConfig, OmegaConf
+from omegaconf import DictConfig, ListConfig, OmegaConf
 
 
 class ConfigManager:
+    threshold_steps = {  # selection steps whose threshold can be swept by giving a list
+        'variance_threshold': 'variance_thresh',
+        'correlation': 'corr_thresh',
+        'feature_wiz': 'corr_thresh',
+        'univariate_ranking': 'univariate_thresh',
+    }
+
     def __init__(self) -> None:
         self.config = None
         self.cwd = os.path.abspath(os.getcwd())
         logger.remove()
         logger.add(sys.stderr, level='INFO')
 
-    def __call__(self, save=True) -> DictConfig:
+    def __call__(self, save=True, expand=True) -> DictConfig:
         self.load_config_file()
         self.range_to_list()
+        if expand:  # batch runs expand the sweeps per experiment, after merging the overlays
+            self.expand_threshold_sweeps(self.config)
         experiment_dir = os.path.join(self.config.meta.output_dir, self.config.meta.experiment)
         os.makedirs(experiment_dir, exist_ok=True)
         if save:
@@ -43,4 +52,28 @@ class ConfigManager:
     def range_to_list(self):
         """Convert range string to list"""
         if isinstance(self.config.verification.use_n_top_features, str):
-            self.config.verification.use_n_top_features = list(eval(self.config.verification.use_n_top_features))
\ No newline at end of file
+            self.config.verification.use_n_top_features = list(eval(self.config.verification.use_n_top_features))
+
+    @classmethod
+    def expand_threshold_sweeps(cls, config: DictConfig) -> None:
+        """Expand jobs with a step whose threshold is a list into one virtual job per threshold, e.g. correlation@0.9
+
+        Steps reading the same threshold (correlation and feature_wiz) get the same value within a job.
+        """
+        jobs = [list(job) for job in config.selection.jobs]
+        for threshold in dict.fromkeys(cls.threshold_steps.values()):
+            values = config.selection[threshold]
+            if not isinstance(values, ListConfig):
+                continue
+            steps = [step for step, step_threshold in cls.threshold_steps.items() if step_threshold == threshold]
+            expanded = []
+            for job in jobs:
+                if any(step in job for step in steps):
+                    expanded += [
+                        [f'{job_step}@{value}' if job_step in steps else job_step for job_step in job]
+                        for value in values
+                    ]
+                else:
+                    expanded.append(job)
+            jobs = expanded
+        config.selection.jobs = jobs
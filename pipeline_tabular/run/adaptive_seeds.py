@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from omegaconf import DictConfig, OmegaConf
+from scipy.stats import t as student_t
+
+from pipeline_tabular.utils.helpers import job_name_cleaner, opt_metric
+from pipeline_tabular.data_handler.data_handler import DataHandler
+
+
+class AdaptiveSeeds(DataHandler):
+    """Report the precision of the best job/n_top/model cell per seed and decide when to stop drawing seeds
+
+    With data_split.target_ci_width, seeds are drawn until the 95% confidence interval of the mean optimisation
+    score of the current best cell is narrower than the target (at least min_seeds, at most max_seeds). Otherwise
+    the configured n_seeds are run and the precision is only reported.
+    """
+
+    def __init__(self, config: DictConfig) -> None:
+        super().__init__()
+        self.experiment_dir = os.path.join(config.meta.output_dir, config.meta.experiment)
+        self.target_ci_width = config.data_split.target_ci_width
+        self.min_seeds = max(2, config.data_split.min_seeds)  # generate_seeds treats a single seed differently
+        self.max_seeds = config.data_split.max_seeds
+        self.n_seeds = config.data_split.n_seeds
+        self.job_names = job_name_cleaner(config.selection.jobs)
+        self.n_top_features = config.verification.use_n_top_features
+        models_dict = config.verification.models
+        self.report_models = [model for model in models_dict if models_dict[model]]
+        self.metric, self.higher_is_better = opt_metric(config.selection.scoring[config.meta.learn_task])
+        self.progress = []
+
+    @property
+    def active(self) -> bool:
+        return self.target_ci_width is not None
+
+    def seeds_to_draw(self) -> int:
+        """Number of seeds to generate, in adaptive mode the run usually stops earlier"""
+        return self.max_seeds if self.active else self.n_seeds
+
+    def __call__(self, seeds: list, n_done: int) -> bool:
+        """Report precision of the best cell after n_done seeds, return whether to stop drawing seeds"""
+        best_cell, mean_score, ci_width = self.best_cell(seeds[:n_done])
+        if best_cell is None:
+            return False
+        self.progress.append(
+            {
+                'n_seeds': n_done,
+                'best_cell': f'{best_cell[2]} on {best_cell[0]}_{best_cell[1]}',
+                f'mean_{self.metric}': mean_score,
+                'ci_width': ci_width,
+            }
+        )
+        pd.DataFrame(self.progress).to_csv(os.path.join(self.experiment_dir, 'seed_progress.csv'), index=False)
+        target = f' (target {self.target_ci_width})' if self.active else ''
+        logger.info(
+            f'Seed {n_done}: best {best_cell[2]} on {best_cell[0]}_{best_cell[1]}, '
+            f'mean {self.metric} {mean_score:.3f}, 95% CI width {ci_width:.3f}{target}'
+        )
+
+        if not self.active or n_done < self.min_seeds:
+            return False
+        if ci_width < self.target_ci_width:
+            logger.info(f'Target CI width reached after {n_done} seeds, stop drawing seeds')
+            return True
+        if n_done >= self.max_seeds:
+            logger.warning(f'Target CI width not reached within max_seeds={self.max_seeds}')
+        return False
+
+    def best_cell(self, seeds: list) -> tuple:
+        """Cell with best mean score among cells evaluated on the latest seed, its mean and 95% CI width"""
+        cell_means = {}
+        for job_name in self.job_names:
+            for n_top in self.n_top_features:
+                for model in self.report_models:
+                    scores = [self.seed_score(seed, f'{job_name}_{n_top}', model) for seed in seeds]
+                    if scores[-1] is None:  # not evaluated (anymore), e.g. pruned or n_top > available features
+                        continue
+                    cell_means[(job_name, n_top, model)] = [score for score in scores if score is not None]
+        if not cell_means:
+            return None, None, None
+
+        direction = 1 if self.higher_is_better else -1
+        best_cell = max(cell_means, key=lambda cell: direction * np.mean(cell_means[cell]))
+        scores = cell_means[best_cell]
+        if len(scores) < 2:
+            return best_cell, np.mean(scores), np.inf
+        half_width = student_t.ppf(0.975, len(scores) - 1) * np.std(scores, ddof=1) / np.sqrt(len(scores))
+        return best_cell, np.mean(scores), 2 * half_width
+
+    def seed_score(self, seed, job_name: str, model: str) -> float or None:
+        """Mean score over bootstraps of the optimisation metric, None if not evaluated"""
+        scores = self.get_store('score', seed, job_name).get(model, {}).get(self.metric, [])
+        return np.mean(scores) if scores else None
+
+    def save(self, n_done: int) -> None:
+        """Write the realised number of seeds to job_config.yaml, used by CollectResults"""
+        config_file = os.path.join(self.experiment_dir, 'job_config.yaml')
+        job_config = OmegaConf.load(config_file)
+        job_config.data_split.realised_seeds = n_done
+        OmegaConf.save(job_config, config_file)
@@ -0,0 +1,124 @@
+import copy
+import multiprocessing
+import os
+import traceback
+from multiprocessing.connection import wait
+
+from loguru import logger
+from omegaconf import DictConfig, OmegaConf
+
+from pipeline_tabular.config_manager import ConfigManager
+from pipeline_tabular.utils.inspections import CleanUp, DataExploration
+from pipeline_tabular.utils.plots import PlotRenderer
+from pipeline_tabular.run.planner import Planner
+from pipeline_tabular.run.run import Run
+from pipeline_tabular.data_handler.data_handler import DataHandler
+
+
+class BatchRun(DataHandler):
+    """Run several experiments defined as overlays of one base config and/or several targets, sharing ingestion and
+    cleaning
+
+    The input file is read (by DataReader) and cleaned once, column regexes of the experiments, the columns of the
+    other targets and the rows with missing target are dropped from the shared cleaned frame afterwards, followed by
+    the cleaning steps that depend on the rows (see CleanUp.clean_columns), which gives the same frame as cleaning per
+    experiment. Every experiment/target runs its imputation, selection and verification in a process forked from the
+    parent, batch.parallel at a time with the workers split between them, and writes to its own experiment directory
+    (suffixed by the target if meta.target_label is a list). With plan=True, every experiment/target is planned on its
+    frame instead (see Planner). Overlays must not change the data or the splits, hence all experiments share the same
+    patients and seed splits.
+    """
+
+    shared_keys = ['meta.input_file', 'meta.target_label', 'inspection.label_as_index', 'data_split']
+
+    def __init__(self, config: DictConfig, batch: bool = True) -> None:
+        super().__init__()
+        self.config = config
+        target_label = config.meta.target_label
+        self.targets = [target_label] if isinstance(target_label, str) else list(target_label)
+        experiments = (config.batch.experiments or {}) if batch else {config.meta.experiment: None}
+        self.experiments = {}  # experiment name -> (overlay, target)
+        for name, overlay in experiments.items():
+            for target in self.targets:
+                self.experiments[name if len(self.targets) == 1 else f'{name}_{target}'] = (overlay, target)
+        self.parallel = max(1, min(config.batch.parallel, len(self.experiments)))
+        self.experiment_configs = {
+            name: self.experiment_config(name, overlay, target) for name, (overlay, target) in self.experiments.items()
+        }
+
+    def __call__(self, plan: bool = False) -> None:
+        if not self.experiments:
+            logger.warning('No experiments found in batch.experiments, nothing to run')
+            return
+        clean_config = copy.deepcopy(self.config)
+        clean_config.inspection.manual_clean = False  # column regexes differ between experiments -> applied later
+        CleanUp(clean_config)()
+        if plan:
+            self.plan()
+            return
+        DataExploration(self.config)()  # shared frame, written once instead of once per experiment
+
+        context = multiprocessing.get_context('fork')
+        pending = list(self.experiment_configs)
+        running, failed = {}, []
+        logger.info(f'Running {len(pending)} experiments, {self.parallel} at a time')
+        while pending or running:
+            while pending and len(running) < self.parallel:
+                name = pending.pop(0)
+                process = context.Process(target=self.run_experiment, args=(self.experiment_configs[name],))
+                process.start()
+                running[process.sentinel] = (name, process)
+            for sentinel in wait(list(running)):
+                name, process = running.pop(sentinel)
+                process.join()
+                if process.exitcode != 0:
+                    logger.error(f'Experiment {name} failed with exit code {process.exitcode}')
+                    failed.append(name)
+                else:
+                    logger.info(f'Experiment {name} finished')
+        PlotRenderer.flush()  # plots of the data exploration, rendered while the experiments ran
+        if failed:
+            raise RuntimeError(f'Experiments failed: {", ".join(failed)}')
+
+    def plan(self) -> None:
+        """Plan the experiments one after another, each on its own frame"""
+        shared_frame = self.get_frame()
+        for name, config in self.experiment_configs.items():
+            logger.info(f'Planning {name}...')
+            self.set_frame(shared_frame)
+            self.experiment_frame(config)
+            Planner(config)()
+
+    def experiment_config(self, name: str, overlay: DictConfig, target: str) -> DictConfig:
+        """Base config merged with the overlay and target of the experiment, saved as its job_config.yaml"""
+        overlay = overlay or OmegaConf.create({})
+        for key in self.shared_keys:
+            if OmegaConf.select(overlay, key) is not None:
+                raise ValueError(f'Experiment {name} overlays {key}, which needs to be shared by all experiments')
+        config = OmegaConf.merge(self.config, overlay)
+        ConfigManager.expand_threshold_sweeps(config)  # jobs of the base config are not expanded in batch mode
+        config.meta.experiment = name
+        config.meta.target_label = target
+        config.meta.workers = max(1, self.config.meta.workers // self.parallel)
+        del config.batch  # experiment configs are regular run configs
+        experiment_dir = os.path.join(config.meta.output_dir, name)
+        os.makedirs(experiment_dir, exist_ok=True)
+        OmegaConf.save(config, os.path.join(experiment_dir, 'job_config.yaml'))
+        return config
+
+    def run_experiment(self, config: DictConfig) -> None:
+        """Entry point of the forked process of one experiment"""
+        try:
+            self.experiment_frame(config)
+            self.save_frame(os.path.join(config.meta.output_dir, config.meta.experiment))
+            Run(config)()
+        except BaseException:
+            logger.error(f'Experiment {config.meta.experiment} failed:\n{traceback.format_exc()}')
+            os._exit(1)
+        os._exit(0)  # skip atexit handlers and finalizers inherited from the parent
+
+    def experiment_frame(self, config: DictConfig) -> None:
+        """Replace the shared cleaned frame by the frame of the experiment"""
+        clean_up = CleanUp(config)
+        clean_up.experiment_frame(drop_columns=[target for target in self.targets if target != clean_up.target_label])
+        self.set_frame(clean_up.frame)
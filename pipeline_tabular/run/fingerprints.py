@@ -0,0 +1,163 @@
+import json
+import os
+
+from joblib import hash as joblib_hash
+from loguru import logger
+from omegaconf import DictConfig, OmegaConf
+
+from pipeline_tabular.config_manager import ConfigManager
+from pipeline_tabular.utils.helpers import job_name_cleaner
+from pipeline_tabular.utils.verifications.nested_sweep import NestedFeatureSweep
+from pipeline_tabular.data_handler.data_handler import DataHandler
+
+
+class Fingerprints(DataHandler):
+    """Fingerprints of the config subtrees and inputs each stored artefact depends on, saved as fingerprints.json
+
+    Splits and imputations depend on the cleaned frame and the data_split/impute settings, the selected features of a
+    job on these plus the settings of its steps, and the scores of a model on the features of the job plus the
+    settings of the model. Stored features and scores whose fingerprint changed since they were computed are dropped
+    before a run is resumed, hence only they are recomputed, e.g. after changing corr_thresh or the param_grid of a
+    single model. Splits and imputations are not stored, they are recomputed by every run. Cells pruned by racing keep
+    their scores if the racing settings changed, but lose their pruned flags, hence they are evaluated again.
+    """
+
+    split_keys = ['init_seed', 'rng', 'n_bootstraps', 'test_frac', 'oversample', 'oversample_method']
+
+    def __init__(self, config: DictConfig) -> None:
+        super().__init__()
+        self.config = config
+        self.fingerprint_file = os.path.join(config.meta.output_dir, config.meta.experiment, 'fingerprints.json')
+        self.fingerprints = self.compute()
+
+    def compute(self) -> dict:
+        """Current fingerprints of the data, the features per job and the scores per job and model"""
+        config = self.config
+        data_split = OmegaConf.masked_copy(config.data_split, self.split_keys)  # not e.g. n_seeds
+        data = self.digest(
+            joblib_hash(self.get_frame()), config.meta.target_label, config.meta.learn_task, data_split, config.impute
+        )
+        models_dict = config.verification.models
+        models = [model for model in models_dict if models_dict[model] and 'ensemble' not in model]
+        ensemble = [model for model in models_dict if models_dict[model] and 'ensemble' in model]
+        racing = self.digest(config.verification.racing, config.selection.scoring[config.meta.learn_task])
+        fingerprints = {'data': data, 'racing': racing, 'features': {}, 'scores': {}}
+        for job, job_name in zip(config.selection.jobs, job_name_cleaner(config.selection.jobs)):
+            features = self.feature_fingerprint(data, job)
+            scores = {model: self.score_fingerprint(features, model) for model in models}
+            for model in ensemble:  # combines the best estimators of all models
+                scores[model] = self.digest(model, sorted(scores.values()))
+            fingerprints['features'][job_name] = features
+            fingerprints['scores'][job_name] = scores
+        return fingerprints
+
+    def feature_fingerprint(self, data: str, job: list) -> str:
+        """Selected features of a job depend on its steps and the settings used by them"""
+        selection = self.config.selection
+        parts = [data, list(job), selection.scoring[self.config.meta.learn_task], selection.class_weight]
+        for step in job:
+            name, _, threshold = step.partition('@')
+            if name in ConfigManager.threshold_steps and not threshold:  # swept thresholds are part of the name
+                parts.append(selection[ConfigManager.threshold_steps[name]])
+            if name == 'correlation':
+                parts += [selection.corr_method, selection.corr_ranking]
+            elif name == 'mrmr':
+                parts.append(max(self.config.verification.use_n_top_features))
+            elif name == 'hand_picked':
+                parts.append(self.config.meta.hand_picked)
+            if name == 'univariate_ranking':
+                parts.append(self.model_settings('logistic_regression'))
+            elif name.startswith('fr_'):
+                parts.append(self.model_settings(name[len('fr_') :]))
+        return self.digest(*parts)
+
+    def score_fingerprint(self, features: str, model: str) -> str:
+        """Scores of a model depend on the selected features, its settings and the collected metrics"""
+        verification = self.config.verification
+        swept = model in NestedFeatureSweep.swept_models(verification)
+        metrics = self.config.collect_results.metrics_to_collect[self.config.meta.learn_task]
+        return self.digest(features, self.model_settings(model), swept, metrics)
+
+    def model_settings(self, model: str) -> list:
+        verification = self.config.verification
+        return [
+            model,
+            verification.param_grids[model],
+            verification.backends.get(model, 'sklearn'),
+            verification.time_budget,
+        ]
+
+    @staticmethod
+    def digest(*parts) -> str:
+        """Hash of config nodes and plain values, config nodes are hashed by their content"""
+        return joblib_hash(OmegaConf.to_container(OmegaConf.create(list(parts))))
+
+    def invalidate(self) -> None:
+        """Drop stored features and scores computed with a different fingerprint than the current one"""
+        try:
+            with open(self.fingerprint_file, 'r') as file:
+                stored = json.load(file)
+        except FileNotFoundError:
+            if self._score_store:
+                logger.warning('Stored results have no fingerprints, they are reused without checking the config')
+            return
+        if stored.get('racing') != self.fingerprints['racing']:
+            self.clear_pruned()
+        for job_name, fingerprint in self.fingerprints['features'].items():
+            if stored['features'].get(job_name, fingerprint) != fingerprint:  # new jobs have nothing stored
+                logger.info(f'Data or selection settings of {job_name} changed, recomputing its features and scores')
+                self.drop_features(job_name)
+                continue
+            stored_scores = stored['scores'].get(job_name, {})
+            fingerprints = self.fingerprints['scores'][job_name]
+            stale = [
+                model
+                for model, fingerprint in fingerprints.items()
+                if stored_scores
+                and stored_scores.get(model, None if 'ensemble' in model else fingerprint) != fingerprint
+            ]
+            if any('ensemble' in model for model in stale):  # ensembles need the best estimators of all models
+                stale = list(fingerprints)
+            if stale:
+                logger.info(f'Settings of {", ".join(stale)} changed, recomputing their scores of {job_name}')
+                self.drop_scores(job_name, stale)
+
+    def clear_pruned(self) -> None:
+        """Remove the pruned flags set by racing with other settings"""
+        n_cleared = 0
+        for cells in self._score_store.values():
+            for scores in cells.values():
+                for model_scores in scores.values():
+                    n_cleared += bool(model_scores.pop('pruned', False))
+        if n_cleared:
+            logger.info(f'Racing settings changed, {n_cleared} pruned cells are evaluated again')
+
+    def drop_features(self, job_name: str) -> None:
+        for boot_features in self._feature_store.values():
+            for features in boot_features.values():
+                features.pop(job_name, None)
+        self._feature_score_store.pop(job_name, None)
+        self.drop_scores(job_name)
+
+    def drop_scores(self, job_name: str, models: list = None) -> None:
+        """Drop the scores of the given models (all if None) in all seeds and n_top of a job"""
+        for cells in self._score_store.values():
+            for cell, scores in cells.items():
+                if cell.rpartition('_')[0] == job_name:
+                    for model in models or list(scores):
+                        scores.pop(model, None)
+
+    def save(self) -> None:
+        """Merge the current fingerprints into fingerprints.json, jobs no longer configured keep theirs"""
+        try:
+            with open(self.fingerprint_file, 'r') as file:
+                stored = json.load(file)
+        except FileNotFoundError:
+            stored = {'features': {}, 'scores': {}}
+        stored['data'] = self.fingerprints['data']
+        stored['racing'] = self.fingerprints['racing']
+        stored['features'].update(self.fingerprints['features'])
+        for job_name, fingerprints in self.fingerprints['scores'].items():
+            stored['scores'].setdefault(job_name, {}).update(fingerprints)
+        with open(self.fingerprint_file, 'w') as file:
+            json.dump(stored, file, indent=2)
@@ -0,0 +1,177 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from omegaconf import DictConfig
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from pipeline_tabular.utils.helpers import init_estimator, job_name_cleaner, translate_param_grid
+from pipeline_tabular.utils.resources import ResourceManager
+from pipeline_tabular.utils.verifications.grid_compiler import GridCompiler
+from pipeline_tabular.utils.verifications.nested_sweep import NestedFeatureSweep
+from pipeline_tabular.data_handler.data_handler import DataHandler
+
+
+class Planner(DataHandler):
+    """Dry run of a config: count the model fits per stage and estimate the wall-clock time of the run
+
+    Fits are counted from the compiled parameter grids and the CV splitter of init_estimator. Times per fit are
+    calibrated by fitting a few candidates of every estimator on the actual data shape (one training fold). The
+    number of features after variance/correlation filtering is unknown before the run, hence selection counts are
+    upper bounds, as are all counts if racing or an adaptive seed count is used.
+    """
+
+    n_calibration_candidates = 3  # candidates timed per estimator and data shape
+
+    def __init__(self, config: DictConfig) -> None:
+        super().__init__()
+        self.config = config
+        self.out_dir = os.path.join(config.meta.output_dir, config.meta.experiment)
+        self.learn_task = config.meta.learn_task
+        self.target_label = config.meta.target_label
+        self.seed = config.data_split.init_seed
+        self.scoring = config.selection.scoring
+        self.class_weight = config.selection.class_weight
+        self.jobs = config.selection.jobs
+        self.job_names = job_name_cleaner(self.jobs)
+        self.n_top_features = config.verification.use_n_top_features
+        self.swept_models = NestedFeatureSweep.swept_models(config.verification)
+        self.param_grids = config.verification.param_grids
+        self.backends = config.verification.backends
+        models_dict = config.verification.models
+        self.models = [model for model in models_dict if models_dict[model] and 'ensemble' not in model]
+        n_seeds = config.data_split.n_seeds
+        if config.data_split.target_ci_width is not None:  # adaptive seed count -> plan for the worst case
+            n_seeds = config.data_split.max_seeds
+        self.n_runs = n_seeds * config.data_split.n_bootstraps
+        cpu_layout = ResourceManager(config)()
+        self.parallel_fits = cpu_layout['seeds'] * cpu_layout['search']
+        self.fit_times = {}
+
+    def __call__(self) -> pd.DataFrame:
+        """Log the fits and estimated time per stage and the top cost drivers, save plan.csv"""
+        self.x_train, self.y_train = self.calibration_data()
+        rows = []
+        for job, job_name in zip(self.jobs, self.job_names):
+            n_features = len(self.config.meta.hand_picked) if 'hand_picked' in job else self.x_train.shape[1]
+            for step in job:
+                rows += self.selection_rows(job_name, step)
+            rows += self.verification_rows(job_name, n_features)
+
+        plan = pd.DataFrame(rows)
+        plan['fits'] = plan['fits_per_seed'] * self.n_runs
+        plan['est_hours'] = plan['fits'] * plan['seconds_per_fit'] / self.parallel_fits / 3600
+        plan = plan.sort_values('est_hours', ascending=False).reset_index(drop=True)
+        os.makedirs(self.out_dir, exist_ok=True)
+        plan.to_csv(os.path.join(self.out_dir, 'plan.csv'), index=False, float_format='%.4g')
+
+        per_stage = plan.groupby('stage')[['fits', 'est_hours']].sum()
+        logger.info(
+            f'Plan for {self.n_runs} seeds/bootstraps on {self.x_train.shape[0]} training samples x '
+            f'{self.x_train.shape[1]} features, {self.parallel_fits} parallel fits:\n{per_stage.round(2).to_string()}'
+            f'\nTotal: {int(plan["fits"].sum())} fits, ~{plan["est_hours"].sum():.2f} h'
+        )
+        drivers = plan.groupby(['stage', 'step', 'model'])[['fits', 'est_hours']].sum()
+        drivers['share'] = (drivers['est_hours'] / drivers['est_hours'].sum()).round(3)
+        drivers = drivers.sort_values('est_hours', ascending=False).head(10)
+        logger.info(f'Top cost drivers (all jobs and n_top):\n{drivers.round(2).to_string()}')
+        return plan
+
+    def calibration_data(self) -> tuple:
+        """Training split of the cleaned data, imputed with medians and z-scored, used to time the estimators"""
+        frame = self.get_frame()
+        frame = frame.fillna(frame.median())
+        stratify = frame[self.target_label] if self.learn_task == 'binary_classification' else None
+        train, _ = train_test_split(
+            frame, test_size=self.config.data_split.test_frac, stratify=stratify, random_state=self.seed
+        )
+        y_train = train[self.target_label]
+        x_train = train.drop(self.target_label, axis=1)
+        x_train = pd.DataFrame(StandardScaler().fit_transform(x_train), index=x_train.index, columns=x_train.columns)
+        return x_train, y_train
+
+    def selection_rows(self, job_name: str, step: str) -> list:
+        """Fits of one selection step per seed"""
+        n_features = self.x_train.shape[1]
+        step = step.partition('@')[0]
+        if step == 'univariate_ranking':  # one grid search per feature
+            n_candidates, n_splits = self.search_size('logistic_regression', 1)
+            fits = n_features * (n_candidates * n_splits + 1)
+            return [self.row('selection', job_name, step, 'logistic_regression', None, fits, 1)]
+        if step.startswith('fr_'):  # grid search on all features followed by RFECV with step 1
+            model = step[len('fr_') :]
+            n_candidates, n_splits = self.search_size(model, n_features)
+            rfe_fits = (n_splits + 1) * (n_features - 1) + 1
+            return [
+                self.row('selection', job_name, f'{step} (grid)', model, None, n_candidates * n_splits + 1, n_features),
+                self.row('selection', job_name, f'{step} (RFECV)', model, None, rfe_fits, max(1, n_features // 2)),
+            ]
+        if step == 'correlation' and self.config.selection.corr_ranking == 'forest':
+            return [self.row('selection', job_name, step, 'forest', None, 1, n_features)]
+        return []  # no model fits, e.g. normalisation, variance threshold, mRMR
+
+    def verification_rows(self, job_name: str, n_features: int) -> list:
+        """Fits of all models and n_top per seed"""
+        n_tops = [n_top for n_top in self.n_top_features if n_top <= n_features] or [n_features]
+        rows = []
+        for model in self.models:
+            swept = model in self.swept_models
+            for n_top in n_tops:
+                n_candidates, n_splits = self.search_size(model, n_top)
+                step = 'warm-started sweep' if swept else 'grid search'
+                rows.append(self.row('verification', job_name, step, model, n_top, n_candidates * n_splits + 1, n_top))
+        return rows
+
+    def row(self, stage: str, job_name: str, step: str, model: str, n_top, fits: int, n_features: int) -> dict:
+        return {
+            'stage': stage,
+            'job': job_name,
+            'step': step,
+            'model': model,
+            'n_top': n_top,
+            'fits_per_seed': fits,
+            'seconds_per_fit': self.fit_time(model, n_features),
+        }
+
+    def search_size(self, model: str, n_features: int) -> tuple:
+        """Number of candidates of the compiled grid and number of CV splits"""
+        estimator, cross_validator, param_grid = self.init_search(model)
+        candidates = GridCompiler(estimator, cross_validator)(
+            param_grid, self.x_train.iloc[:, :n_features], self.y_train
+        )
+        return len(candidates), cross_validator.get_n_splits()
+
+    def fit_time(self, model: str, n_features: int) -> float:
+        """Mean time of fitting some candidates on one training fold with n_features features"""
+        if (model, n_features) not in self.fit_times:
+            estimator, cross_validator, param_grid = self.init_search(model)
+            x_train = self.x_train.iloc[:, :n_features]
+            candidates = list(
+                ParameterGrid(GridCompiler(estimator, cross_validator)(param_grid, x_train, self.y_train))
+            )
+            train_index, _ = next(iter(cross_validator.split(x_train, self.y_train)))
+            timed = [
+                candidates[i] for i in np.linspace(0, len(candidates) - 1, self.n_calibration_candidates, dtype=int)
+            ]
+            durations = []
+            for params in timed:
+                start = time.perf_counter()
+                clone(estimator).set_params(**params).fit(x_train.iloc[train_index], self.y_train.iloc[train_index])
+                durations.append(time.perf_counter() - start)
+            self.fit_times[(model, n_features)] = float(np.mean(durations))
+        return self.fit_times[(model, n_features)]
+
+    def init_search(self, model: str) -> tuple:
+        backend = self.backends.get(model, 'sklearn')
+        estimator, cross_validator, _ = init_estimator(
+            model, self.learn_task, self.seed, self.scoring, self.class_weight, 1, backend
+        )
+        return (
+            estimator,
+            cross_validator,
+            translate_param_grid(model, self.learn_task, self.param_grids[model], backend),
+        )
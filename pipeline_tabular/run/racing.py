@@ -0,0 +1,108 @@
+import numpy as np
+from loguru import logger
+from omegaconf import DictConfig
+from scipy.stats import wilcoxon
+
+from pipeline_tabular.utils.helpers import job_name_cleaner, opt_metric
+from pipeline_tabular.data_handler.data_handler import DataHandler
+
+
+class Racing(DataHandler):
+    """Stop evaluating job/n_top/model cells that are significantly worse than the leading cell
+
+    After the warm-up seeds and then every racing.every seeds (a look), the per-seed scores of the optimisation metric
+    of every remaining cell are compared to the cell with the best mean score using a one-sided paired Wilcoxon
+    signed-rank test. alpha is split evenly over the looks of the run (Bonferroni) and the tests of a look are
+    Holm-corrected, hence the probability of pruning any cell that is not worse than the leader stays below alpha.
+    Dominated cells are marked as pruned in the score containers of all remaining seeds, which is respected by
+    Verification and CollectResults.
+    """
+
+    def __init__(self, config: DictConfig) -> None:
+        super().__init__()
+        self.active = config.verification.racing.active
+        self.warm_up = config.verification.racing.warm_up
+        self.alpha = config.verification.racing.alpha
+        self.every = config.verification.racing.every
+        self.job_names = job_name_cleaner(config.selection.jobs)
+        self.n_top_features = config.verification.use_n_top_features
+        models_dict = config.verification.models
+        self.race_models = [model for model in models_dict if models_dict[model] and 'ensemble' not in model]
+        self.metric, self.higher_is_better = opt_metric(config.selection.scoring[config.meta.learn_task])
+        if self.active and any('ensemble' in model and models_dict[model] for model in models_dict):
+            logger.warning('Racing is disabled, ensemble models need all base models of a cell to be evaluated')
+            self.active = False
+
+    def __call__(self, seeds: list, n_done: int) -> None:
+        """Prune dominated cells given the first n_done seeds have been evaluated"""
+        if not self.active or n_done < self.warm_up or (n_done - self.warm_up) % self.every:
+            return
+        seed_scores = {cell: self.cell_scores(cell, seeds[:n_done]) for cell in self.alive_cells(seeds[n_done - 1])}
+        seed_scores = {cell: scores for cell, scores in seed_scores.items() if len(scores) >= self.warm_up}
+        if len(seed_scores) < 2:
+            return
+        direction = 1 if self.higher_is_better else -1
+        leader = max(seed_scores, key=lambda cell: direction * np.nanmean(list(seed_scores[cell].values())))
+
+        p_values = {}
+        for cell, scores in seed_scores.items():
+            if cell == leader:
+                continue
+            paired = [seed for seed in scores if seed in seed_scores[leader]]
+            differences = direction * np.array([seed_scores[leader][seed] - scores[seed] for seed in paired])
+            if np.allclose(differences, 0):  # identical scores, e.g. same features for different n_top
+                continue
+            p_values[cell] = wilcoxon(differences, alternative='greater').pvalue
+
+        look_alpha = self.alpha / self.n_looks(len(seeds))
+        for rank, (cell, p_value) in enumerate(sorted(p_values.items(), key=lambda item: item[1])):
+            threshold = look_alpha / (len(p_values) - rank)  # Holm step-down
+            if p_value >= threshold:
+                break
+            logger.info(
+                f'Racing: pruned {cell[2]} on {cell[0]}_{cell[1]} after {n_done} seeds '
+                f'(dominated by {leader[2]} on {leader[0]}_{leader[1]}, p={p_value:.2e} < {threshold:.2e})'
+            )
+            self.prune(cell, seeds[n_done:])
+
+    def n_looks(self, n_seeds: int) -> int:
+        """Number of looks of a run with n_seeds seeds"""
+        return max(n_seeds - self.warm_up, 0) // self.every + 1
+
+    def alive_cells(self, seed) -> list:
+        """Cells that have not been pruned up to the given seed"""
+        return [
+            (job_name, n_top, model)
+            for job_name in self.job_names
+            for n_top in self.n_top_features
+            for model in self.race_models
+            if not self.get_store('score', seed, f'{job_name}_{n_top}').get(model, {}).get('pruned', False)
+        ]
+
+    def cell_scores(self, cell: tuple, seeds: list) -> dict:
+        """Mean score over bootstraps of the optimisation metric for each evaluated seed"""
+        job_name, n_top, model = cell
+        cell_scores = {}
+        for seed in seeds:
+            scores = self.get_store('score', seed, f'{job_name}_{n_top}').get(model, {}).get(self.metric, [])
+            if scores:
+                cell_scores[str(seed)] = np.mean(scores)
+        return cell_scores
+
+    def prune(self, cell: tuple, remaining_seeds: list) -> None:
+        """Mark cell as pruned in the score containers of all remaining seeds"""
+        job_name, n_top, model = cell
+        for seed in remaining_seeds:
+            scores = self.get_store('score', seed, f'{job_name}_{n_top}')
+            if model in scores and not scores[model].get(self.metric):
+                scores[model]['pruned'] = True
+
+    def job_pruned(self, seed, job_name: str) -> bool:
+        """Whether all cells of a job are pruned for the given seed, i.e. selection can be skipped"""
+        if not self.active:
+            return False
+        return all(
+            self.get_store('score', seed, f'{job_name}_{n_top}').get(model, {}).get('pruned', False)
+            for n_top in self.n_top_features
+            for model in self.race_models
+        )
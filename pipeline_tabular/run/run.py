@@ -1,28 +1,32 @@
 import os
 import sys
+from functools import partial
 
 import numpy as np
 import pandas as pd
 from loguru import logger
 from tqdm import tqdm
-from imblearn.over_sampling import (
-    ADASYN,
-    SMOTE,
-    SMOTEN,
-    SMOTENC,
-    SVMSMOTE,
-    BorderlineSMOTE,
-    KMeansSMOTE,
-    RandomOverSampler,
-)
-
-from pipeline_tabular.utils.data_split import DataSplit
-from pipeline_tabular.utils.helpers import generate_seeds, job_name_cleaner
+
+from pipeline_tabular.run.adaptive_seeds import AdaptiveSeeds
+from pipeline_tabular.run.fingerprints import Fingerprints
+from pipeline_tabular.run.racing import Racing
+from pipeline_tabular.run.scheduler import Task, TaskScheduler
+from pipeline_tabular.utils.data_split import DataSplit, FoldCache
+from pipeline_tabular.utils.executor import SharedExecutor
+from pipeline_tabular.utils.helpers import job_name_cleaner
 from pipeline_tabular.utils.imputers import Imputer
+from pipeline_tabular.utils.instrumentation import Instrumentation, stage
 from pipeline_tabular.utils.normalisers import Normalisers
+from pipeline_tabular.utils.plots import PlotRenderer
+from pipeline_tabular.utils.plugins import PLUGINS, load_plugin
+from pipeline_tabular.utils.random_streams import RandomStreams
+from pipeline_tabular.utils.resources import ResourceManager
 from pipeline_tabular.utils.selections import Selection
 from pipeline_tabular.utils.verifications import Verification
-from pipeline_tabular.data_handler.data_handler import DataHandler, NestedDefaultDict
+from pipeline_tabular.utils.verifications.grid_compiler import GridCompiler
+from pipeline_tabular.utils.verifications.nested_sweep import NestedFeatureSweep
+from pipeline_tabular.utils.verifications.timed_search import TimedGridSearch
+from pipeline_tabular.data_handler.data_handler import DataHandler
 
 
 class Run(DataHandler, Normalisers):
@@ -50,94 +54,292 @@ class Run(DataHandler, Normalisers):
         self.models_to_init = [model for model in self.models_to_init if model not in self.ensemble]
         if len(self.models_to_init) < 2:  # ensemble methods need at least two models two combine their results
             self.ensemble = []
+        PlotRenderer.configure(self.config)
         self.config.plot_first_iter = False
+        self.resources = ResourceManager(self.config)
+        self.cpu_layout = self.resources()
+        self.resources.log_layout(self.cpu_layout)
+        self.executor = SharedExecutor(self.config)  # shared by Selection and Verification via DataHandler
+        self.streams = RandomStreams(self.config)  # shared as well
 
         self.data_split = DataSplit(self.config)
         self.imputation = Imputer(self.config)
         self.selection = Selection(self.config)
         self.verification = Verification(self.config)
+        self.racing = Racing(self.config)
+        self.adaptive_seeds = AdaptiveSeeds(self.config)
 
     def __call__(self) -> None:
         """Iterate over all desired seeds/bootstraps, etc."""
-        high_logging_level = self.config.meta.logging_level in ['TRACE', 'DEBUG', 'INFO']
-        np.random.seed(self.init_seed)
-        self.seeds = generate_seeds(self.init_seed, self.n_seeds)
+        self.seeds = self.streams.seeds(self.adaptive_seeds.seeds_to_draw())
+        Instrumentation.configure(self.config, self.seeds)
         self.init_containers()
 
+        backend_config = self.executor.backend_config()
+        with self.resources.limit(self.cpu_layout, **backend_config):  # avoid nested oversubscription of threads
+            if self.cpu_layout['seeds'] > 1:  # several seeds in parallel -> schedule tasks across seeds
+                n_done = self.run_tasks()
+            else:
+                n_done = self.run_seeds()
+        self.adaptive_seeds.save(n_done)
+        TimedGridSearch.save_report(os.path.join(self.out_dir, self.experiment_name, 'timeouts.csv'))
+        self.executor.shutdown()
+        with stage('plot_flush'):
+            PlotRenderer.flush()  # plots rendered in the background while the seeds ran
+        Instrumentation.finish()
+        logger.info(f'Pruning invalid and duplicate grid combinations saved {GridCompiler.total_fits_saved} fits')
+
+    def run_seeds(self) -> int:
+        """Run seeds one after another, return the number of seeds run"""
+        high_logging_level = self.config.meta.logging_level in ['TRACE', 'DEBUG', 'INFO']
+        self.config.plot_first_iter = PlotRenderer.enabled('full')
+        n_done = 0
         for seed_iter, seed in enumerate(tqdm(self.seeds, desc='Running seeds', disable=high_logging_level)):
-            logger.info(f'Running seed {seed_iter+1}/{self.n_seeds}...')
-            np.random.seed(seed)
-            boot_seeds = generate_seeds(seed, self.n_bootstraps)  # generate boot seeds
+            logger.info(f'Running seed {seed_iter+1}/{len(self.seeds)}...')
+            with stage('seed', seed=seed):
+                boot_seeds = self.streams.boot_seeds(seed, self.n_bootstraps)  # generate boot seeds
+                for boot_iter in range(self.n_bootstraps):
+                    logger.info(f'Running bootstrap iteration {boot_iter+1}/{self.n_bootstraps}...')
+                    fit_imputer = self.prepare(seed, boot_iter, boot_seeds[boot_iter])
+                    for job, job_name in zip(self.jobs, self.job_names):
+                        if self.racing.job_pruned(seed, job_name):
+                            logger.info(f'Skipping {job_name}, all its models and n_top are pruned by racing')
+                            continue
+                        logger.info(f'Running {job_name}...')
+                        job_dir = os.path.join(self.out_dir, self.experiment_name, job_name)
+                        os.makedirs(job_dir, exist_ok=True)
+                        if not self.stored_features(seed, boot_iter, job_name):
+                            self.selection(
+                                seed, boot_iter, job, job_name, job_dir
+                            )  # run only if selection results not already available
+                        _ = self.verification(seed, boot_iter, job_name, job_dir, fit_imputer)
+                    self.save_results()
+                    self.config.plot_first_iter = (
+                        False  # minimise work by producing certain plots only for the first iteration
+                    )
+            n_done = seed_iter + 1
+            if self.finish_seed(n_done):  # best cell is precise enough
+                break
+        return n_done
+
+    def run_tasks(self) -> int:
+        """Run (seed, bootstrap, job, n_top, model) tasks in parallel, return the number of completed seeds
+
+        Tasks are created upfront with explicit dependencies (split/impute -> selection -> verification, next
+        bootstrap of a seed after the previous one) and run by the TaskScheduler in forked processes, longest
+        predicted chain first. Results are merged into the stores of the parent, seeds are completed (racing,
+        adaptive seeds, intermediate results) in order as soon as all their tasks are done.
+        """
+        experiment_dir = os.path.join(self.out_dir, self.experiment_name)
+        self.scheduler = TaskScheduler(self.cpu_layout['seeds'], os.path.join(experiment_dir, 'task_timings.json'))
+        sweep_models = NestedFeatureSweep.swept_models(self.config.verification)
+        n_tops = list(self.config.verification.use_n_top_features)
+        self.n_open_tasks = {}
+        self.n_done = 0
+        self.stopped = False
+        for seed_iter, seed in enumerate(self.seeds):
+            boot_seeds = self.streams.boot_seeds(seed, self.n_bootstraps)
+            previous_boot = []  # keys of all tasks of the previous bootstrap of the seed
             for boot_iter in range(self.n_bootstraps):
-                logger.info(f'Running bootstrap iteration {boot_iter+1}/{self.n_bootstraps}...')
-                self.data_split(seed, boot_seeds[boot_iter])
+                prepare = Task(
+                    ('prepare', seed_iter, boot_iter),
+                    'prepare',
+                    self.task_body,
+                    (seed, self.prepare_task, seed, boot_iter, boot_seeds[boot_iter]),
+                    previous_boot,
+                )
+                boot_tasks = [self.add_task(prepare, self.merge_prepare)]
+                for job, job_name in zip(self.jobs, self.job_names):
+                    verify_deps = [prepare.key]
+                    if not self.stored_features(seed, boot_iter, job_name):
+                        select = Task(
+                            ('select', seed_iter, boot_iter, job_name),
+                            f'select|{job_name}',
+                            self.task_body,
+                            (seed, self.selection_task, seed, boot_iter, job, job_name),
+                            verify_deps,
+                            skip=partial(self.racing.job_pruned, seed, job_name),
+                        )
+                        boot_tasks.append(self.add_task(select, self.merge_selection))
+                        verify_deps = [select.key]
+                    if self.ensemble:  # ensembles need all models of a cell -> one task per job
+                        units = [(None, None)]
+                    else:  # warm-started sweeps optimise all n_top at once -> one task per model
+                        units = [
+                            (model, n_top)
+                            for model in self.models_to_init
+                            for n_top in ([None] if model in sweep_models else n_tops)
+                        ]
+                    for model, n_top in units:
+                        models = None if model is None else [model]
+                        task_n_tops = None if n_top is None else [n_top]
+                        verify = Task(
+                            ('verify', seed_iter, boot_iter, job_name, str(n_top), str(model)),
+                            f'verify|{job_name}|{n_top}|{model}',
+                            self.task_body,
+                            (seed, self.verification_task, seed, boot_iter, job, job_name, models, task_n_tops),
+                            verify_deps,
+                            skip=partial(self.cells_pruned, seed, job_name, task_n_tops or n_tops, models),
+                        )
+                        boot_tasks.append(self.add_task(verify, self.merge_verification))
+                previous_boot = boot_tasks
+                self.n_open_tasks[seed_iter] = self.n_open_tasks.get(seed_iter, 0) + len(boot_tasks)
+        self.scheduler()
+        return self.n_done
+
+    def add_task(self, task: Task, merge) -> tuple:
+        """Add task to the scheduler, merge(task, result) is called in the parent once it is done"""
+        self.scheduler.add(task, on_done=partial(self.merge_task, merge))
+        return task.key
+
+    def task_body(self, seed, func, *args) -> tuple:
+        """Body of a scheduled task in the forked process, returns result and statistics of the class counters"""
+        if self.streams.legacy:
+            np.random.seed(seed)  # global state at the start of a seed in sequential runs
+        fits_saved, n_timeouts = GridCompiler.total_fits_saved, len(TimedGridSearch.timeouts)
+        result = func(*args)
+        return result, GridCompiler.total_fits_saved - fits_saved, TimedGridSearch.timeouts[n_timeouts:]
+
+    def prepare(self, seed, boot_iter, boot_seed):
+        """Split, impute and over sample the data of one bootstrap, return the fitted imputer"""
+        with stage('prepare', seed=seed, boot_iter=boot_iter):
+            self.streams.seed_global('prepare', seed, boot_iter)
+            with stage('split'):
+                self.data_split(seed, boot_seed)
+            with stage('impute'):
                 fit_imputer = self.imputation(seed)
-                if self.oversample:
+            if self.oversample:
+                with stage('oversample'):
                     train = self.over_sampling(self.get_store('frame', seed, 'train'), seed)
                     self.set_store('frame', seed, 'train', train)
-                for job, job_name in zip(self.jobs, self.job_names):
-                    logger.info(f'Running {job_name}...')
-                    job_dir = os.path.join(self.out_dir, self.experiment_name, job_name)
-                    os.makedirs(job_dir, exist_ok=True)
-                    try:
-                        features = self.get_store('feature', seed, job_name, boot_iter=boot_iter)
-                    except KeyError:
-                        features = []
-                    if not features:
-                        self.selection(
-                            seed, boot_iter, job, job_name, job_dir
-                        )  # run only if selection results not already available
-                    else:
-                        norm = [step for step in self.jobs[0] if 'norm' in step][
-                            0
-                        ]  # need to init normalisation for verification (normally part of selection)
-                        train_frame = self.get_store('frame', seed, 'train')
-                        _ = getattr(self, norm)(train_frame)
-                    _ = self.verification(seed, boot_iter, job_name, job_dir, fit_imputer)
-                try:  # ensure that intermediate result files are not corrupted by KeyboardInterrupt
-                    self.save_intermediate_results(os.path.join(self.out_dir, self.experiment_name))
-                except KeyboardInterrupt:
-                    logger.warning('Keyboard interrupt detected, saving intermediate results before exiting...')
-                    self.save_intermediate_results(os.path.join(self.out_dir, self.experiment_name))
-                    sys.exit(130)
-                self.config.plot_first_iter = (
-                    False  # minimise work by producing certain plots only for the first iteration
-                )
+        return fit_imputer
+
+    def prepare_task(self, seed, boot_iter, boot_seed) -> tuple:
+        self.prepare(seed, boot_iter, boot_seed)
+        return self.get_store('frame', seed, 'train'), self.get_store('frame', seed, 'test')
+
+    def selection_task(self, seed, boot_iter, job, job_name) -> list:
+        logger.info(f'Running {job_name} for seed {seed}, bootstrap {boot_iter+1}...')
+        job_dir = os.path.join(self.out_dir, self.experiment_name, job_name)
+        os.makedirs(job_dir, exist_ok=True)
+        self.config.plot_first_iter = PlotRenderer.enabled('full') and seed == self.seeds[0] and boot_iter == 0
+        self.selection(seed, boot_iter, job, job_name, job_dir)
+        return self.stored_features(seed, boot_iter, job_name)
+
+    def verification_task(self, seed, boot_iter, job, job_name, models, n_tops) -> dict:
+        """Verify the given models and n_top of a job, starting from the imputed frames of the seed"""
+        top_features = self.stored_features(seed, boot_iter, job_name)
+        valid_n_tops = self.verification.valid_n_top(top_features, n_tops)
+        if not valid_n_tops:  # n_top above the number of selected features, covered by the task of min(n_top)
+            return {}
+        job_dir = os.path.join(self.out_dir, self.experiment_name, job_name)
+        _ = self.verification(seed, boot_iter, job_name, job_dir, model=models, n_top_features=n_tops)
+        cells = {}
+        for n_top in valid_n_tops:
+            scores = self.get_store('score', seed, f'{job_name}_{n_top}')
+            cells[f'{job_name}_{n_top}'] = {model: scores[model] for model in (models or scores)}
+        return cells
+
+    def merge_task(self, merge, task: Task, result) -> None:
+        """Merge the result of a task in the parent and complete seeds whose tasks are all done"""
+        if result is not None:  # None if skipped
+            result, fits_saved, timeouts = result
+            GridCompiler.total_fits_saved += fits_saved
+            TimedGridSearch.timeouts += timeouts
+            merge(task, result)
+        seed_iter = task.key[1]
+        self.n_open_tasks[seed_iter] -= 1
+        while not self.stopped and self.n_done < len(self.seeds) and self.n_open_tasks[self.n_done] == 0:
+            self.save_results()
+            self.n_done += 1
+            logger.info(f'Completed seed {self.n_done}/{len(self.seeds)}')
+            if self.finish_seed(self.n_done):  # best cell is precise enough -> do not start remaining seeds
+                self.stopped = True
+                self.scheduler.cancel(lambda other_task: other_task.key[1] >= self.n_done)
+
+    def merge_prepare(self, task: Task, frames: tuple) -> None:
+        seed = self.seeds[task.key[1]]
+        self.set_store('frame', seed, 'train', frames[0])
+        self.set_store('frame', seed, 'test', frames[1])
+
+    def merge_selection(self, task: Task, features: list) -> None:
+        _, seed_iter, boot_iter, job_name = task.key
+        if features:
+            self.set_store('feature', self.seeds[seed_iter], job_name, features, boot_iter)
+
+    def merge_verification(self, task: Task, cells: dict) -> None:
+        seed = self.seeds[task.key[1]]
+        for cell, model_scores in cells.items():
+            scores = self.get_store('score', seed, cell)
+            if not scores:  # cell not initialised, e.g. fewer features than n_top
+                scores = {}
+                self.set_store('score', seed, cell, scores)
+            for model, child_scores in model_scores.items():
+                scores.setdefault(model, {}).update(child_scores)  # keeps flags set by racing in the meantime
+
+    def cells_pruned(self, seed, job_name: str, n_tops: list, models: list) -> bool:
+        """Whether all job/n_top/model cells of a task are pruned by racing"""
+        return models is not None and all(
+            self.get_store('score', seed, f'{job_name}_{n_top}').get(model, {}).get('pruned', False)
+            for n_top in n_tops
+            for model in models
+        )
+
+    def finish_seed(self, n_done: int) -> bool:
+        """Race cells and release resources after n_done seeds, return whether to stop drawing seeds"""
+        seed = self.seeds[n_done - 1]
+        self.racing(self.seeds, n_done)  # prune dominated cells for the remaining seeds
+        self.executor.release(seed)
+        FoldCache.release(seed)
+        Selection.release_cache(seed)
+        self._frame_store.pop(str(seed), None)  # splits of finished seeds are not needed anymore
+        stores = ['_frame_store', '_feature_store', '_feature_score_store', '_score_store']
+        Instrumentation.seed_done(seed, n_done, {name: getattr(self, name) for name in stores})
+        return self.adaptive_seeds(self.seeds, n_done)
+
+    def save_results(self) -> None:
+        try:  # ensure that intermediate result files are not corrupted by KeyboardInterrupt
+            with stage('save'):
+                self.save_intermediate_results(os.path.join(self.out_dir, self.experiment_name))
+        except KeyboardInterrupt:
+            logger.warning('Keyboard interrupt detected, saving intermediate results before exiting...')
+            self.save_intermediate_results(os.path.join(self.out_dir, self.experiment_name))
+            sys.exit(130)
+
+    def stored_features(self, seed, boot_iter, job_name) -> list:
+        """Selected features if already available, e.g. from a previous run, else empty list"""
+        try:
+            return list(self.get_store('feature', seed, job_name, boot_iter=boot_iter))
+        except KeyError:
+            return []
 
     def init_containers(self):
+        experiment_dir = os.path.join(self.out_dir, self.experiment_name)
+        os.makedirs(experiment_dir, exist_ok=True)
+        fingerprints = Fingerprints(self.config)
         if not self.config.meta.overwrite:
-            scores_found = self.load_intermediate_results(
-                os.path.join(self.out_dir, self.experiment_name)
-            )  # try loading available results
-        if self.config.meta.overwrite or not scores_found:
-            for seed in self.seeds:  # initialise empty score containers to be filled during verification
-                for job_name in self.job_names:
-                    for n_top in self.config.verification.use_n_top_features:
-                        scores = NestedDefaultDict()
-                        for model in self.models_to_init + self.ensemble:
+            self.load_intermediate_results(experiment_dir)  # try loading available results
+            fingerprints.invalidate()  # drop results computed with other data or settings
+        for seed in self.seeds:  # initialise missing score containers to be filled during verification
+            for job_name in self.job_names:
+                for n_top in self.config.verification.use_n_top_features:
+                    cell = f'{job_name}_{n_top}'
+                    scores = self._score_store.get(str(seed), {}).get(cell) or {}  # get_store would vivify the seed
+                    for model in self.models_to_init + self.ensemble:
+                        if model not in scores:
                             scores[model] = {score: [] for score in self.scores_to_init + ['probas', 'true', 'pred']}
-                        self.set_store('score', str(seed), f'{job_name}_{n_top}', scores)
+                    self.set_store('score', str(seed), cell, scores)
+        self.save_results()  # stored results match the fingerprints from now on
+        fingerprints.save()
 
     def over_sampling(self, x_frame: pd.DataFrame, seed: int) -> pd.DataFrame:
         """Over sample data"""
-        over_sampler_dict = {
-            'binary_classification_smoten': SMOTEN(random_state=seed),
-            'binary_classification_smotenc': SMOTENC(categorical_features=2, random_state=seed),
-            'binary_classification_svmsmote': SVMSMOTE(random_state=seed),
-            'binary_classification_borderlinesmote': BorderlineSMOTE(random_state=seed),
-            'binary_classification_randomoversampler': RandomOverSampler(random_state=seed),
-            'regression_adasyn': ADASYN(random_state=seed),
-            'regression_smote': SMOTE(random_state=seed),
-            'regression_kmeanssmote': KMeansSMOTE(random_state=seed),
-            'regression_randomoversampler': RandomOverSampler(random_state=seed),
-        }
-
         method = self.oversample_method[self.learn_task]
         over_sampler_name = f'{self.learn_task}_{method}'.lower()
-        if over_sampler_name not in over_sampler_dict:
+        if over_sampler_name not in PLUGINS['sampler']:
             raise ValueError(f'Unknown over sampler: {over_sampler_name}')
 
-        over_sampler = over_sampler_dict[over_sampler_name]
+        over_sampler = load_plugin('sampler', over_sampler_name)(random_state=seed)
         y_frame = x_frame[self.target_label]
         new_x_frame, _ = over_sampler.fit_resample(x_frame, y_frame)
         return new_x_frame
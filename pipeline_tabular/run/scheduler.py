@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import numpy as np
+from loguru import logger
+
+from pipeline_tabular.utils.instrumentation import Instrumentation
+
+
+class Task:
+    """Unit of work with explicit dependencies, kind identifies tasks with comparable cost across seeds"""
+
+    def __init__(self, key: tuple, kind: str, func, args: tuple = (), deps: list = None, skip=None) -> None:
+        self.key = key
+        self.kind = kind
+        self.func = func  # executed in a forked process, return value is sent back to the parent
+        self.args = args
+        self.deps = deps or []  # keys of tasks that need to finish first
+        self.skip = skip  # optional callable, checked when the task becomes ready, e.g. pruned by racing
+        self.on_done = None  # callable(task, result) executed in the parent, result is None if skipped
+
+
+class TaskScheduler:
+    """Run tasks in forked processes, longest predicted critical path first
+
+    Every task runs in a process forked from the parent when it is started, hence it sees all results the parent
+    merged so far (e.g. frames, features and scores in the DataHandler stores) without pickling them. Ready tasks
+    are ordered by their predicted cost plus the cost of the longest chain of tasks depending on them (HLFET), with
+    costs taken from the timings recorded by previous runs, so that expensive chains start early and cores stay busy
+    until the end.
+    """
+
+    def __init__(self, n_workers: int, timings_file: str) -> None:
+        self.n_workers = max(1, n_workers)
+        self.timings_file = timings_file
+        try:
+            with open(timings_file, 'r') as file:
+                self.timings = json.load(file)  # kind -> {'mean': seconds, 'n': count}
+        except FileNotFoundError:
+            self.timings = {}
+        self.tasks = {}
+        self.dependents = {}
+        self.cancelled = set()
+        self.counter = itertools.count()  # tie-breaker of equal priorities, keeps insertion order
+
+    def add(self, task: Task, on_done=None) -> None:
+        task.on_done = on_done
+        self.tasks[task.key] = task
+        self.dependents.setdefault(task.key, [])
+        for dep in task.deps:
+            self.dependents.setdefault(dep, []).append(task.key)
+
+    def cancel(self, predicate) -> None:
+        """Do not start tasks matching predicate(task), used to stop drawing seeds"""
+        self.cancelled.update(key for key, task in self.tasks.items() if predicate(task))
+
+    def predict(self, kind: str) -> float:
+        """Mean recorded duration of the kind, else of similar kinds (same type and model), else of the same type"""
+        if kind in self.timings:
+            return self.timings[kind]['mean']
+        kind_type, detail = kind.split('|')[0], kind.split('|')[-1]
+        same_type = {name: value['mean'] for name, value in self.timings.items() if name.split('|')[0] == kind_type}
+        similar = [mean for name, mean in same_type.items() if name.split('|')[-1] == detail]
+        for candidates in [similar, list(same_type.values())]:
+            if candidates:
+                return float(np.mean(candidates))
+        return 1.0  # nothing recorded yet, e.g. first run
+
+    def priorities(self) -> dict:
+        """Predicted cost of each task plus the most expensive chain of tasks depending on it"""
+        priorities = {}
+        for key in reversed(self.topological_order()):
+            tail = max((priorities[dependent] for dependent in self.dependents[key]), default=0.0)
+            priorities[key] = self.predict(self.tasks[key].kind) + tail
+        return priorities
+
+    def topological_order(self) -> list:
+        n_unmet = {key: len(task.deps) for key, task in self.tasks.items()}
+        order = [key for key, n in n_unmet.items() if n == 0]
+        for key in order:  # order grows while iterating
+            for dependent in self.dependents[key]:
+                n_unmet[dependent] -= 1
+                if n_unmet[dependent] == 0:
+                    order.append(dependent)
+        return order
+
+    def __call__(self) -> None:
+        """Run all tasks, results are merged by the on_done callbacks of the tasks"""
+        priorities = self.priorities()
+        n_unmet = {key: len(task.deps) for key, task in self.tasks.items()}
+        ready = [(-priorities[key], next(self.counter), key) for key, n in n_unmet.items() if n == 0]
+        heapq.heapify(ready)
+        running = {}  # receiver -> (task key, process, start time, worker slot)
+        free_slots = list(range(self.n_workers))  # lanes of the trace
+        context = multiprocessing.get_context('fork')
+        logger.info(f'Scheduling {len(self.tasks)} tasks on {self.n_workers} processes')
+
+        while ready or running:
+            while ready and len(running) < self.n_workers:
+                _, _, key = heapq.heappop(ready)
+                task = self.tasks[key]
+                if key in self.cancelled:
+                    continue
+                if task.skip is not None and task.skip():
+                    self.finish(key, None, n_unmet, ready, priorities)
+                    continue
+                receiver, sender = context.Pipe(duplex=False)
+                slot = heapq.heappop(free_slots)
+                # not daemonic, tasks may fork processes themselves (e.g. fits of timed grid searches)
+                process = context.Process(target=run_task, args=(task, sender, slot))
+                process.start()
+                sender.close()
+                running[receiver] = (key, process, time.monotonic(), slot)
+
+            for receiver in wait(list(running), timeout=1.0):
+                key, process, start, slot = running.pop(receiver)
+                heapq.heappush(free_slots, slot)
+                try:
+                    status, result = receiver.recv()
+                except EOFError:  # process died without sending, e.g. killed by the OS
+                    status, result = 'error', f'process exited with code {process.exitcode}'
+                process.join()
+                receiver.close()
+                if status == 'error':
+                    for _, other_process, _, _ in running.values():
+                        other_process.kill()
+                    raise RuntimeError(f'Task {key} failed:\n{result}')
+                self.record(self.tasks[key].kind, time.monotonic() - start)
+                self.finish(key, result, n_unmet, ready, priorities)
+        self.save_timings()
+
+    def finish(self, key: tuple, result, n_unmet: dict, ready: list, priorities: dict) -> None:
+        """Merge the result in the parent and release the tasks depending on it"""
+        task = self.tasks[key]
+        if task.on_done is not None:
+            task.on_done(task, result)
+        for dependent in self.dependents[key]:
+            n_unmet[dependent] -= 1
+            if n_unmet[dependent] == 0:
+                heapq.heappush(ready, (-priorities[dependent], next(self.counter), dependent))
+
+    def record(self, kind: str, duration: float) -> None:
+        """Running mean of the durations per kind"""
+        timing = self.timings.setdefault(kind, {'mean': 0.0, 'n': 0})
+        timing['n'] += 1
+        timing['mean'] += (duration - timing['mean']) / timing['n']
+
+    def save_timings(self) -> None:
+        with open(self.timings_file, 'w') as file:
+            json.dump(self.timings, file, indent=2)
+
+
+def run_task(task: Task, sender, slot: int) -> None:
+    """Entry point of the forked process"""
+    Instrumentation.worker = f'worker {slot}'
+    try:
+        sender.send(('ok', task.func(*task.args)))
+    except BaseException:  # report to the parent instead of failing silently
+        sender.send(('error', traceback.format_exc()))
+    finally:
+        sender.close()
+        os._exit(0)  # skip atexit handlers and finalizers inherited from the parent
@@ -1 +1,2 @@
 from pipeline_tabular.utils.data_split.data_split import DataSplit
+from pipeline_tabular.utils.data_split.fold_cache import FoldCache
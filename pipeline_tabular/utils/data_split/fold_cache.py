@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from joblib import hash as joblib_hash
+
+
+class FoldCache:
+    """Cross-validation splitter replaying the folds of one seed, shared by all searches of that seed
+
+    The folds of (repeated, stratified) k-fold only depend on the seed, the number of samples and the target values,
+    so the train/validation index pairs are generated once and replayed to every GridSearchCV, RFECV and grid
+    compilation with the same target. Pre-sliced contiguous fold arrays are kept for the current feature frame.
+    """
+
+    index_cache = {}  # (seed, splitter, target) -> [(train_index, val_index), ...]
+    array_cache = {}  # (seed, splitter, target) -> (frame hash, [(x_train, y_train, x_val, y_val), ...])
+
+    def __init__(self, cross_validator, seed: int) -> None:
+        self.cross_validator = cross_validator
+        self.seed = str(seed)
+
+    def __repr__(self) -> str:
+        return f'FoldCache({self.cross_validator!r})'
+
+    def get_n_splits(self, X=None, y=None, groups=None) -> int:
+        return self.cross_validator.get_n_splits(X, y, groups)
+
+    def split(self, X, y=None, groups=None):
+        """Yield cached train/validation indices, same interface as the wrapped cross validator"""
+        yield from self.folds(X, y)
+
+    def folds(self, x_train, y_train) -> list:
+        """Return train/validation index pairs, generating them only once per seed and target"""
+        key = self.cache_key(x_train, y_train)
+        if key not in FoldCache.index_cache:
+            FoldCache.index_cache[key] = list(self.cross_validator.split(x_train, y_train))
+        return FoldCache.index_cache[key]
+
+    def fold_arrays(self, x_train: pd.DataFrame, y_train: pd.DataFrame) -> list:
+        """Return (x_train, y_train, x_val, y_val) per fold for the content of x_train
+
+        Feature arrays are column-major, hence every prefix of the columns is a contiguous slice as well.
+        """
+        key = self.cache_key(x_train, y_train)
+        content = joblib_hash(x_train)  # same features of other jobs may differ, e.g. in normalisation
+        cached = FoldCache.array_cache.get(key)
+        if cached is None or cached[0] != content:  # feature frame changed -> slice again
+            x_values = x_train.to_numpy()
+            y_values = np.asarray(y_train)
+            arrays = [
+                (
+                    np.asfortranarray(x_values[train_index]),
+                    y_values[train_index],
+                    np.asfortranarray(x_values[val_index]),
+                    y_values[val_index],
+                )
+                for train_index, val_index in self.folds(x_train, y_train)
+            ]
+            FoldCache.array_cache[key] = (content, arrays)
+        return FoldCache.array_cache[key][1]
+
+    def cache_key(self, x_train, y_train) -> tuple:
+        target = joblib_hash(np.asarray(y_train)) if y_train is not None else None
+        return self.seed, repr(self.cross_validator), len(x_train), target
+
+    @classmethod
+    def release(cls, seed: int) -> None:
+        """Drop cached folds of the given seed"""
+        for cache in [cls.index_cache, cls.array_cache]:
+            for key in [key for key in cache if key[0] == str(seed)]:
+                del cache[key]
@@ -0,0 +1,53 @@
+import glob
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+from loguru import logger
+from omegaconf import DictConfig
+
+
+class SharedExecutor:
+    """Run-scoped joblib configuration shared by all parallel call sites with memory-mapped training arrays
+
+    Grid searches, RFECV, permutation importance and mRMR all dispatch to the same reusable loky pool, which is kept
+    alive for the run as long as its configuration does not change. Training frames published via publish() are
+    backed by a read-only memory-mapped file, so joblib sends a handle to the file to the workers instead of pickling
+    the whole frame into every task.
+    """
+
+    def __init__(self, config: DictConfig) -> None:
+        self.enabled = config.meta.shared_memory
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None  # RAM-backed if available
+        self.temp_folder = tempfile.mkdtemp(prefix='feature_corr_', dir=shm_dir)
+        self.n_published = 0
+        self.finalizer = weakref.finalize(self, shutil.rmtree, self.temp_folder, ignore_errors=True)  # also on exit
+
+    def backend_config(self) -> dict:
+        """Memmapping settings for joblib's parallel_config, large unpublished arrays are memory-mapped as well"""
+        return {'temp_folder': self.temp_folder, 'max_nbytes': '1M', 'mmap_mode': 'r'}
+
+    def publish(self, frame: pd.DataFrame, seed: int, name: str) -> pd.DataFrame:
+        """Return a read-only view of the frame backed by a memory-mapped file"""
+        if not self.enabled or frame.empty or not all(pd.api.types.is_numeric_dtype(t) for t in frame.dtypes):
+            return frame
+        self.n_published += 1
+        file_name = os.path.join(self.temp_folder, f'{seed}_{name}_{os.getpid()}_{self.n_published}.mmap')
+        # saved transposed, the frame then holds the memmap itself: joblib sends transposed memmap views (the block
+        # pandas builds from a row-major array) to the workers with wrong strides, i.e. scrambled training data
+        dump(np.ascontiguousarray(frame.to_numpy(dtype=float).T), file_name)
+        logger.trace(f'Published {name} with shape {frame.shape} for seed {seed}')
+        return pd.DataFrame(load(file_name, mmap_mode='r').T, index=frame.index, columns=frame.columns, copy=False)
+
+    def release(self, seed: int) -> None:
+        """Remove all arrays published for the given seed, also those published by forked task processes"""
+        for file_name in glob.glob(os.path.join(self.temp_folder, f'{seed}_*.mmap')):
+            os.remove(file_name)  # open memmaps stay valid until they are garbage collected
+
+    def shutdown(self) -> None:
+        """Remove the temporary folder of the run"""
+        self.finalizer()
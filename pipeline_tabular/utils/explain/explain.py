@@ -8,10 +8,11 @@ from alibi.explainers import KernelShap
 
 from pipeline_tabular.data_handler.data_handler import DataHandler
 from pipeline_tabular.utils.data_split import DataSplit
+from pipeline_tabular.utils.executor import SharedExecutor
 from pipeline_tabular.utils.imputers import Imputer
 from pipeline_tabular.utils.normalisers import Normalisers
+from pipeline_tabular.utils.random_streams import RandomStreams
 from pipeline_tabular.utils.verifications.verification import Verification
-from pipeline_tabular.utils.helpers import generate_seeds
 
 
 class Explain(DataHandler, Normalisers):
@@ -22,7 +23,8 @@ class Explain(DataHandler, Normalisers):
         self.out_dir = config.meta.output_dir
         self.plot_format = config.meta.plot_format
         self.oversample = config.data_split.oversample
-        self.jobs = config.selection.jobs
+        self.executor = SharedExecutor(config)
+        self.streams = RandomStreams(config)  # replaced by the streams of the collected experiment
         self.data_split = DataSplit(config)
         self.imputation = Imputer(config)
         self.verification = Verification(config)
@@ -42,8 +44,6 @@ class Explain(DataHandler, Normalisers):
             train_frame = self.get_store('frame', seed, 'train')
             if self.oversample:
                 train_frame = self.over_sampling(train_frame, seed)
-            norm = [step for step in self.jobs[job_index] if 'norm' in step][0]  # normalise data
-            train_frame, _ = getattr(self, norm)(train_frame)
             self.set_store('frame', seed, 'train', train_frame)
             features = self.get_store('feature', seed, job_name, boot_iter=0)[:n_top]
             pred_function, estimator, x_train_norm, x_test_norm = self.verification(
@@ -64,8 +64,8 @@ class Explain(DataHandler, Normalisers):
                 np.abs(opt_scores - mean_opt_score)
             )  # find data split representative of mean model performance
             seed = seeds[mean_split_index]
-            np.random.seed(seed)
-            boot_seed = generate_seeds(seed, n_seeds=1)  # re-generate seed of original run
+            boot_seed = self.streams.boot_seeds(seed, n_bootstraps)[0]  # re-generate seed of original run
+            self.streams.seed_global('explain', seed, job_name)
         else:
             raise NotImplementedError
 
@@ -6,6 +6,8 @@ from sklearn.ensemble import (
     ExtraTreesRegressor,
     GradientBoostingClassifier,
     GradientBoostingRegressor,
+    HistGradientBoostingClassifier,
+    HistGradientBoostingRegressor,
     RandomForestClassifier,
     RandomForestRegressor,
 )
@@ -13,6 +15,8 @@ from sklearn.linear_model import LogisticRegression, Lasso, LassoLars, ElasticNe
 from sklearn.svm import SVC
 from sklearn.model_selection import KFold, RepeatedStratifiedKFold
 
+from pipeline_tabular.utils.data_split.fold_cache import FoldCache
+
 
 def generate_seeds(init_seed: int, n_seeds: int) -> list:
     """Generate a list of random seeds"""
@@ -23,34 +27,146 @@ def generate_seeds(init_seed: int, n_seeds: int) -> list:
     return seeds
 
 
-def init_estimator(
-    estimator_name: str, learn_task: str, seed: int, scoring: dict, class_weight: str = None, workers: int = 8
-):
-    """Initialise the estimator and cross-validation method"""
-    estimator_name = f'{estimator_name}_{learn_task}'
-    estimator_dict = {
-        'logistic_regression_binary_classification': LogisticRegression(
-            random_state=seed, class_weight=class_weight, n_jobs=workers
+class EstimatorBackend:
+    """Estimator factory of one backend, translates the shared param_grids to the parameters of the backend"""
+
+    def __init__(self, factory, param_map: dict = None, value_map: dict = None) -> None:
+        self.factory = factory  # (seed, class_weight, workers) -> estimator
+        self.param_map = param_map or {}  # config param name -> backend param name, None drops the parameter
+        self.value_map = value_map or {}  # backend param name -> {config value: backend value}
+
+    def __call__(self, seed: int, class_weight: str, workers: int):
+        return self.factory(seed, class_weight, workers)
+
+    def translate(self, param_grid: dict) -> dict:
+        """Translate a param_grid written for the sklearn estimator"""
+        translated = {}
+        for param, values in dict(param_grid).items():
+            backend_param = self.param_map.get(param, param)
+            if backend_param is None:  # no equivalent in this backend
+                continue
+            value_map = self.value_map.get(backend_param, {})
+            backend_values = [value_map.get(value, value) for value in values]
+            translated[backend_param] = list(dict.fromkeys(backend_values))  # drop duplicates, keep order
+        return translated
+
+
+def lightgbm_classifier(seed, class_weight, workers):
+    from lightgbm import LGBMClassifier
+
+    return LGBMClassifier(random_state=seed, class_weight=class_weight, n_jobs=workers, verbose=-1)
+
+
+def lightgbm_regressor(seed, class_weight, workers):
+    from lightgbm import LGBMRegressor
+
+    return LGBMRegressor(random_state=seed, n_jobs=workers, verbose=-1)
+
+
+def xgboost_classifier(seed, class_weight, workers):
+    from xgboost import XGBClassifier
+
+    return XGBClassifier(random_state=seed, n_jobs=workers, tree_method='hist', grow_policy='lossguide')
+
+
+def xgboost_regressor(seed, class_weight, workers):
+    from xgboost import XGBRegressor
+
+    return XGBRegressor(random_state=seed, n_jobs=workers, tree_method='hist', grow_policy='lossguide')
+
+
+HIST_PARAMS = {'n_estimators': 'max_iter', 'max_features': None}  # HistGradientBoosting has no feature sampling
+LIGHTGBM_PARAMS = {'max_features': None}
+LIGHTGBM_VALUES = {'max_depth': {None: -1}}  # -1 -> no limit
+XGBOOST_PARAMS = {'max_features': None}
+XGBOOST_VALUES = {'max_depth': {None: 0}}  # 0 -> no limit (lossguide growth)
+
+ESTIMATOR_BACKENDS = {  # model name -> backend name -> estimator backend, selected by verification.backends
+    'logistic_regression_binary_classification': {
+        'sklearn': EstimatorBackend(
+            lambda seed, cw, workers: LogisticRegression(random_state=seed, class_weight=cw, n_jobs=workers)
         ),
-        'svm_binary_classification': SVC(random_state=seed, class_weight=class_weight, probability=True),
-        'forest_binary_classification': RandomForestClassifier(
-            random_state=seed, class_weight=class_weight, n_jobs=workers
+    },
+    'svm_binary_classification': {
+        'sklearn': EstimatorBackend(
+            lambda seed, cw, workers: SVC(random_state=seed, class_weight=cw)  # calibrated after search if needed
         ),
-        'extreme_forest_binary_classification': ExtraTreesClassifier(
-            random_state=seed, class_weight=class_weight, n_jobs=workers
+    },
+    'forest_binary_classification': {
+        'sklearn': EstimatorBackend(
+            lambda seed, cw, workers: RandomForestClassifier(random_state=seed, class_weight=cw, n_jobs=workers)
         ),
-        'adaboost_binary_classification': AdaBoostClassifier(random_state=seed),
-        'xgboost_binary_classification': GradientBoostingClassifier(random_state=seed),
-        'forest_regression': RandomForestRegressor(random_state=seed, n_jobs=workers),
-        'extreme_forest_regression': ExtraTreesRegressor(random_state=seed, n_jobs=workers),
-        'adaboost_regression': AdaBoostRegressor(random_state=seed),
-        'xgboost_regression': GradientBoostingRegressor(random_state=seed),
-        'lasso_regression': Lasso(random_state=seed),
-        'lassolars_regression': LassoLars(random_state=seed),
-        'elastic_net_regression': ElasticNet(random_state=seed),
-        'omp_regression': OrthogonalMatchingPursuit(),
-    }
+    },
+    'extreme_forest_binary_classification': {
+        'sklearn': EstimatorBackend(
+            lambda seed, cw, workers: ExtraTreesClassifier(random_state=seed, class_weight=cw, n_jobs=workers)
+        ),
+    },
+    'adaboost_binary_classification': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: AdaBoostClassifier(random_state=seed)),
+    },
+    'xgboost_binary_classification': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: GradientBoostingClassifier(random_state=seed)),
+        'hist': EstimatorBackend(
+            lambda seed, cw, workers: HistGradientBoostingClassifier(random_state=seed), HIST_PARAMS
+        ),
+        'lightgbm': EstimatorBackend(lightgbm_classifier, LIGHTGBM_PARAMS, LIGHTGBM_VALUES),
+        'xgboost': EstimatorBackend(xgboost_classifier, XGBOOST_PARAMS, XGBOOST_VALUES),
+    },
+    'forest_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: RandomForestRegressor(random_state=seed, n_jobs=workers)),
+    },
+    'extreme_forest_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: ExtraTreesRegressor(random_state=seed, n_jobs=workers)),
+    },
+    'adaboost_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: AdaBoostRegressor(random_state=seed)),
+    },
+    'xgboost_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: GradientBoostingRegressor(random_state=seed)),
+        'hist': EstimatorBackend(
+            lambda seed, cw, workers: HistGradientBoostingRegressor(random_state=seed), HIST_PARAMS
+        ),
+        'lightgbm': EstimatorBackend(lightgbm_regressor, LIGHTGBM_PARAMS, LIGHTGBM_VALUES),
+        'xgboost': EstimatorBackend(xgboost_regressor, XGBOOST_PARAMS, XGBOOST_VALUES),
+    },
+    'lasso_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: Lasso(random_state=seed)),
+    },
+    'lassolars_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: LassoLars(random_state=seed)),
+    },
+    'elastic_net_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: ElasticNet(random_state=seed)),
+    },
+    'omp_regression': {
+        'sklearn': EstimatorBackend(lambda seed, cw, workers: OrthogonalMatchingPursuit()),
+    },
+}
+
+
+def get_backend(estimator_name: str, learn_task: str, backend: str = 'sklearn') -> EstimatorBackend:
+    """Look up the estimator backend in the registry"""
+    estimator_name = f'{estimator_name}_{learn_task}'
+    if estimator_name not in ESTIMATOR_BACKENDS:
+        raise ValueError(f'Unknown estimator: {estimator_name}')
+    if backend not in ESTIMATOR_BACKENDS[estimator_name]:
+        raise ValueError(
+            f'Unknown backend {backend} for {estimator_name}, allowed -> {list(ESTIMATOR_BACKENDS[estimator_name])}'
+        )
+    return ESTIMATOR_BACKENDS[estimator_name][backend]
+
 
+def init_estimator(
+    estimator_name: str,
+    learn_task: str,
+    seed: int,
+    scoring: dict,
+    class_weight: str = None,
+    workers: int = 8,
+    backend: str = 'sklearn',
+):
+    """Initialise the estimator and cross-validation method"""
     if learn_task == 'binary_classification':
         cross_fold = RepeatedStratifiedKFold(n_splits=3, n_repeats=10, random_state=seed)
     elif learn_task == 'multi_classification':
@@ -60,17 +176,26 @@ def init_estimator(
     else:
         raise ValueError(f'Unknown learn task: {learn_task}')
 
-    if estimator_name not in estimator_dict:
-        raise ValueError(f'Unknown estimator: {estimator_name}')
-
-    estimator = estimator_dict[estimator_name]
+    estimator = get_backend(estimator_name, learn_task, backend)(seed, class_weight, workers)
     scoring = scoring[learn_task]
-    return estimator, cross_fold, scoring
+    return estimator, FoldCache(cross_fold, seed), scoring  # folds are generated once per seed and target
 
 
-def job_name_cleaner(jobs: list) -> str:
-    """Transform jobs given in list into job name strings"""
-    job_names = []
+def translate_param_grid(estimator_name: str, learn_task: str, param_grid: dict, backend: str = 'sklearn') -> dict:
+    """Translate the param_grid of a model from the config to the parameters of the selected backend"""
+    return get_backend(estimator_name, learn_task, backend).translate(param_grid)
+
+
+def opt_metric(scoring: str) -> tuple:
+    """Name of the verification score of the optimisation metric and whether higher is better"""
+    metric = scoring[len('neg_') :] if scoring.startswith('neg_') else scoring
+    higher_is_better = not metric.endswith(('error', 'loss', 'deviance'))
+    return (f'{metric}_score' if higher_is_better else metric), higher_is_better
+
+
+def job_steps(jobs: list) -> list:
+    """Steps of each job, steps stored by set_memory are prepended to jobs using get_memory"""
+    steps = []
     for job in jobs:
         if 'set_memory' in job:
             index = job.index('set_memory')
@@ -82,6 +207,11 @@ def job_name_cleaner(jobs: list) -> str:
             tmp = steps_before_set + tmp
         else:
             tmp = job
-        job_names.append('_'.join(tmp))
+        steps.append(list(tmp))
+
+    return steps
+
 
-    return job_names
+def job_name_cleaner(jobs: list) -> str:
+    """Transform jobs given in list into job name strings"""
+    return ['_'.join(steps) for steps in job_steps(jobs)]
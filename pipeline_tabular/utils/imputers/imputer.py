@@ -7,6 +7,7 @@ from sklearn.experimental import enable_iterative_imputer  # because of bug in s
 from sklearn.impute import IterativeImputer, KNNImputer, MissingIndicator, SimpleImputer
 
 from pipeline_tabular.data_handler.data_handler import DataHandler
+from pipeline_tabular.utils.plugins import check_plugins, load_plugin
 
 logger.trace(enable_iterative_imputer)  # to avoid auto import removal
 
@@ -29,7 +30,7 @@ class Imputer(DataHandler):
             if self.impute_method == 'drop_nan_impute':
                 raise NotImplementedError
             else:
-                imputer = getattr(self, self.impute_method)()
+                imputer = load_plugin('imputer', self.impute_method)(self)
                 imp_train = imputer.fit_transform(train_frame)
                 imp_train = pd.DataFrame(imp_train, index=train_frame.index, columns=train_frame.columns)
                 imp_test = imputer.transform(test_frame)
@@ -47,10 +48,7 @@ class Imputer(DataHandler):
 
     def _check_methods(self) -> bool:
         """Check if the given method is valid"""
-        valid_methods = set([func for func in dir(self) if callable(getattr(self, func)) and not func.startswith('_')])
-        method = set([self.impute_method])  # brackets to avoid splitting string into characters
-        if not method.issubset(valid_methods):
-            raise ValueError(f'Unknown imputation method -> "{self.impute_method}"')
+        check_plugins('imputer', [self.impute_method])
         return True
 
     def drop_nan_impute(self, frame: pd.DataFrame) -> None:
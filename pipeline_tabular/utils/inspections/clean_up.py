@@ -29,17 +29,34 @@ class CleanUp(DataHandler):
             self.drop_columns_rex()
 
         self.frame = self.frame.apply(pd.to_numeric, errors='coerce')  # Replace non-numeric entries with NaN
-        nunique = self.frame.nunique()
-        non_categorical = nunique[nunique > 5].index
-        self.frame[non_categorical] = self.frame[non_categorical].replace(0, np.nan)  # Replace 0 with NaN
-        self.frame = self.frame.dropna(how='all', axis=1)  # Drop columns with all NaN
-        self.frame = self.frame[self.frame[self.target_label].notna()]  # Drop rows with NaN in target column
+        if isinstance(self.target_label, str):  # with several targets the rows are only known per target (BatchRun)
+            self.drop_missing_target()
+            self.clean_columns()
 
         self.set_frame(self.frame)
         output_dir = os.path.join(self.config.meta.output_dir, self.config.meta.experiment)
         os.makedirs(output_dir, exist_ok=True)
         self.save_frame(output_dir)
 
+    def drop_missing_target(self) -> None:
+        """Drop rows with NaN in target column"""
+        self.frame = self.frame[self.frame[self.target_label].notna()]
+
+    def clean_columns(self) -> None:
+        """Cleaning steps depending on the rows, hence run after the rows with missing target are dropped"""
+        nunique = self.frame.nunique()
+        non_categorical = nunique[nunique > 5].index
+        self.frame[non_categorical] = self.frame[non_categorical].replace(0, np.nan)  # Replace 0 with NaN
+        self.frame = self.frame.dropna(how='all', axis=1)  # Drop columns with all NaN
+
+    def experiment_frame(self, drop_columns: list = None) -> None:
+        """Apply the experiment specific cleaning to the shared cleaned frame, e.g. the columns of other targets"""
+        self.frame = self.frame.drop(columns=drop_columns or [])
+        if self.manual_clean:
+            self.drop_columns_rex()
+        self.drop_missing_target()
+        self.clean_columns()  # per target, repeating it on the frame of a single target does not change it
+
     def set_index_by_label(self) -> None:
         """Set index by label"""
         if isinstance(self.label_as_index, str):
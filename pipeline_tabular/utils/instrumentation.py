@@ -0,0 +1,130 @@
+import json
+import os
+import resource
+import time
+from contextlib import ExitStack, contextmanager
+
+import pandas as pd
+from omegaconf import DictConfig
+
+from pipeline_tabular.utils.memory import MemoryTracker
+from pipeline_tabular.utils.profiler import StageProfiler
+from pipeline_tabular.utils.trace import export_trace
+
+
+class Instrumentation:
+    """Wall time, CPU time and model fits per pipeline stage, appended to timings.jsonl of the experiment
+
+    Stages are nested (e.g. selection -> correlation -> plot), every stage is recorded with the tags of its enclosing
+    stages (seed, boot_iter, job, n_top, model) and the name of its parent stage, hence time can be summarised per
+    stage, job and model across seeds. Records are appended line by line as soon as a stage ends, so stages of forked
+    tasks are recorded as well. CPU time includes finished child processes (e.g. timed fits), but not persistent
+    joblib workers. Nothing is recorded before configure() is called, e.g. by collect_results. Stages listed in
+    meta.profile.stages are additionally profiled for the first seeds (see StageProfiler), the peak memory of every
+    stage and the store sizes after each seed are written to memory.jsonl if meta.memory.track is set. With
+    meta.trace, the records of the run are exported as trace.json with one lane per worker (see export_trace).
+    """
+
+    out_file = None
+    run_id = None  # start of the run, separates records of resumed runs
+    tags = {}  # tags of the enclosing stages
+    n_fits = 0  # model fits started by this process
+    profiler = None  # StageProfiler if meta.profile.stages is set
+    memory = None  # MemoryTracker if meta.memory.track is set
+    trace = False
+    worker = 'main'  # lane of the trace, set in the processes of scheduled tasks
+
+    @classmethod
+    def configure(cls, config: DictConfig, seeds: list) -> None:
+        experiment_dir = os.path.join(config.meta.output_dir, config.meta.experiment)
+        os.makedirs(experiment_dir, exist_ok=True)
+        cls.out_file = os.path.join(experiment_dir, 'timings.jsonl')
+        cls.run_id = time.strftime('%Y-%m-%dT%H:%M:%S')
+        profile = config.meta.get('profile')
+        cls.profiler = StageProfiler(config, seeds) if profile is not None and profile.stages else None
+        memory = config.meta.get('memory')
+        track_memory = memory is not None and memory.track
+        cls.memory = MemoryTracker(config, os.path.join(experiment_dir, 'memory.jsonl')) if track_memory else None
+        cls.trace = config.meta.get('trace', False)
+
+    @classmethod
+    def finish(cls) -> None:
+        """Aggregate the stage profiles and export the trace of the run"""
+        if cls.profiler is not None:
+            cls.profiler.render()
+        records = load_records(cls.out_file) if cls.trace else pd.DataFrame()
+        if not records.empty:
+            export_trace(
+                records[records['run'] == cls.run_id], os.path.join(os.path.dirname(cls.out_file), 'trace.json')
+            )
+
+    @classmethod
+    def seed_done(cls, seed, n_done: int, stores: dict) -> None:
+        """Record the size of the stores after the first n_done seeds are completed"""
+        if cls.memory is not None:
+            cls.memory.seed_done(seed, n_done, stores)
+
+    @classmethod
+    def count_fits(cls, n_fits: int) -> None:
+        cls.n_fits += n_fits
+
+    @classmethod
+    @contextmanager
+    def stage(cls, name: str, **tags):
+        """Record the enclosed code as stage name, tags are inherited by nested stages"""
+        if cls.out_file is None:
+            yield
+            return
+        outer_tags = cls.tags
+        cls.tags = {**outer_tags, **tags, 'stage': name}
+        start, cpu_start, fits_start = time.time(), cpu_time(), cls.n_fits
+        try:
+            with ExitStack() as hooks:
+                if cls.memory is not None:
+                    hooks.enter_context(cls.memory({**cls.tags, 'parent': outer_tags.get('stage'), 'run': cls.run_id}))
+                if cls.profiler is not None and cls.profiler.active(cls.tags):
+                    hooks.enter_context(cls.profiler(cls.tags))
+                yield
+        finally:
+            record = {
+                **cls.tags,
+                'parent': outer_tags.get('stage'),
+                'wall': time.time() - start,
+                'cpu': cpu_time() - cpu_start,
+                'n_fits': cls.n_fits - fits_start,
+            }
+            cls.tags = outer_tags
+            cls.write(record, start, cls.worker)
+
+    @classmethod
+    def event(cls, name: str, start: float, duration: float, worker: str, **tags) -> None:
+        """Record a span measured outside of a stage, e.g. a fit in a forked process"""
+        if cls.out_file is not None:
+            cls.write(
+                {**cls.tags, **tags, 'stage': name, 'parent': cls.tags.get('stage'), 'wall': duration}, start, worker
+            )
+
+    @classmethod
+    def write(cls, record: dict, start: float, worker: str) -> None:
+        record.update({'run': cls.run_id, 'pid': os.getpid(), 'worker': worker, 'start': start})
+        with open(cls.out_file, 'a') as file:  # single appended line per record, safe across processes
+            file.write(json.dumps(record, default=str) + '\n')
+
+
+def stage(name: str, **tags):
+    """Shorthand of Instrumentation.stage"""
+    return Instrumentation.stage(name, **tags)
+
+
+def cpu_time() -> float:
+    """User and system time of this process and its finished children"""
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def load_records(out_file: str) -> pd.DataFrame:
+    """Records of a jsonl file written by the instrumentation, empty frame if not available"""
+    try:
+        return pd.read_json(out_file, lines=True, dtype=False)
+    except (FileNotFoundError, ValueError):
+        return pd.DataFrame()
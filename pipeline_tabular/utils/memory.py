@@ -0,0 +1,144 @@
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from omegaconf import DictConfig
+
+
+class MemoryTracker:
+    """Peak RSS and peak Python allocations per stage and size of the stores after each seed, see meta.memory
+
+    The peak RSS of a stage is measured by resetting the high-water mark of the process (Linux clear_refs) when the
+    stage starts and reading it when it ends, peaks of nested stages are propagated to their enclosing stages. Without
+    clear_refs, the peak RSS of the process so far is recorded instead (peak_rss_reset False). Forked fits and joblib
+    workers are separate processes and not included. Peak Python allocations (tracemalloc) are only tracked if
+    meta.memory.tracemalloc is set, since tracing slows down pure Python code considerably.
+    """
+
+    bounded_stores = ['_frame_store']  # should not grow once finished seeds are released, results accumulate
+
+    def __init__(self, config: DictConfig, out_file: str) -> None:
+        memory = config.meta.memory
+        self.out_file = out_file
+        self.growth_window = memory.growth_window
+        self.tracemalloc = memory.tracemalloc
+        if self.tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.peak_rss_reset = reset_peak_rss()
+        self.peaks = []  # running [rss, python] peaks of the enclosing stages
+        self.store_sizes = {}  # store name -> size after each seed
+        self.warned = set()
+
+    @contextmanager
+    def __call__(self, tags: dict):
+        """Record the peak memory of the enclosed stage"""
+        rss_start = current_rss()
+        self.fold_peaks()
+        self.peaks.append([0, 0])
+        try:
+            yield
+        finally:
+            peak = self.peaks.pop()
+            peak[0] = max(peak[0], peak_rss())
+            if self.tracemalloc:
+                peak[1] = max(peak[1], tracemalloc.get_traced_memory()[1])
+            if self.peaks:  # enclosing stage
+                self.peaks[-1] = [max(outer, inner) for outer, inner in zip(self.peaks[-1], peak)]
+            self.write(
+                {
+                    **tags,
+                    'pid': os.getpid(),
+                    'rss_start': rss_start,
+                    'rss_end': current_rss(),
+                    'peak_rss': peak[0],
+                    'peak_rss_reset': self.peak_rss_reset,
+                    'peak_python': peak[1] if self.tracemalloc else None,
+                }
+            )
+
+    def fold_peaks(self) -> None:
+        """Fold the peaks reached so far into the enclosing stage and reset them"""
+        if self.peaks:
+            self.peaks[-1][0] = max(self.peaks[-1][0], peak_rss())
+            if self.tracemalloc:
+                self.peaks[-1][1] = max(self.peaks[-1][1], tracemalloc.get_traced_memory()[1])
+        reset_peak_rss()
+        if self.tracemalloc:
+            tracemalloc.reset_peak()
+
+    def seed_done(self, seed, n_done: int, stores: dict) -> None:
+        """Record the size of the stores after a seed, warn if a bounded store grew over the last seeds"""
+        sizes = {name: deep_size(store) for name, store in stores.items()}
+        self.write({'stage': 'seed_done', 'seed': seed, 'n_done': n_done, 'rss': current_rss(), 'store_sizes': sizes})
+        for name, size in sizes.items():
+            history = self.store_sizes.setdefault(name, [])
+            history.append(size)
+            recent = history[-(self.growth_window + 1) :]
+            growing = len(recent) > self.growth_window and all(b > a for a, b in zip(recent, recent[1:]))
+            if growing and name in self.bounded_stores and name not in self.warned:
+                logger.warning(
+                    f'{name} grew after each of the last {self.growth_window} seeds '
+                    f'({recent[0] / 1e6:.1f} -> {recent[-1] / 1e6:.1f} MB), data of finished seeds may be kept'
+                )
+                self.warned.add(name)
+
+    def write(self, record: dict) -> None:
+        with open(self.out_file, 'a') as file:
+            file.write(json.dumps({'time': time.time(), **record}, default=str) + '\n')
+
+
+def proc_status(field: str) -> int or None:
+    """Value of a memory field of /proc/self/status in bytes, None if not available"""
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss() -> int or None:
+    return proc_status('VmRSS')
+
+
+def peak_rss() -> int:
+    """High-water mark of the RSS since the last reset (Linux), else since the process started"""
+    peak = proc_status('VmHWM')
+    if peak is None:
+        scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, in KB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return peak
+
+
+def reset_peak_rss() -> bool:
+    """Reset the RSS high-water mark of the process, return whether it is supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def deep_size(obj) -> int:
+    """Approximate size in bytes of nested dicts/lists of frames, arrays and Python objects"""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(key) + deep_size(value) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(deep_size(item) for item in obj)
+    return sys.getsizeof(obj)
@@ -0,0 +1,222 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from loguru import logger
+from omegaconf import DictConfig
+
+
+class PlotRenderer:
+    """Render figures in background processes while the computation continues, see meta.plots
+
+    Plots are submitted as a render function of this module and the data it needs, rendered and saved by a pool of
+    meta.plot_workers spawned processes (in place if 0) and awaited by flush() at the end of the run. Forked processes
+    (scheduled tasks) render in place, the pool belongs to the process that configured it. Levels: none (no plots),
+    minimal (data exploration and collected results), full (also the selection plots of the first seed).
+    """
+
+    levels = {'none': 0, 'minimal': 1, 'full': 2}
+    level = 'minimal'
+    workers = 0
+    _owner = None  # pid of the process owning the pool
+    _pool = None
+    _pending = []  # (out_file, future)
+
+    @classmethod
+    def configure(cls, config: DictConfig) -> None:
+        level = config.meta.get('plots', 'minimal')
+        if level not in cls.levels:
+            raise ValueError(f'Unknown plot level: {level}, allowed -> {list(cls.levels)}')
+        cls.level = level
+        cls.workers = config.meta.get('plot_workers', 1)
+        if cls._owner != os.getpid():  # the pool of the parent is not usable in a forked process
+            cls._owner, cls._pool, cls._pending = os.getpid(), None, []
+
+    @classmethod
+    def enabled(cls, level: str = 'minimal') -> bool:
+        return cls.levels[cls.level] >= cls.levels[level]
+
+    @classmethod
+    def submit(cls, level: str, render, out_file: str, *args, **kwargs) -> None:
+        """Render render(out_file, *args, **kwargs) if plots of the level are enabled, with the current font size"""
+        if not cls.enabled(level):
+            return
+        rc = {'font.size': plt.rcParams['font.size']}
+        if cls.workers > 0 and cls._owner == os.getpid():
+            if cls._pool is None:
+                cls._pool = ProcessPoolExecutor(cls.workers, mp_context=get_context('spawn'), initializer=_init_worker)
+            while len(cls._pending) >= 4 * cls.workers:  # bound the memory held by queued figures
+                cls._wait(*cls._pending.pop(0))
+            try:
+                cls._pending.append((out_file, cls._pool.submit(_render, rc, render, out_file, *args, **kwargs)))
+                return
+            except BrokenProcessPool as e:
+                logger.warning(f'Plot workers failed, rendering the remaining plots in place -> {e}')
+                cls._pool, cls.workers = None, 0
+        try:
+            _render(rc, render, out_file, *args, **kwargs)
+        except Exception as e:
+            logger.error(f'Plot {out_file} failed -> {e}')
+
+    @classmethod
+    def flush(cls) -> None:
+        """Wait for all submitted plots and shut down the pool"""
+        if cls._owner != os.getpid():
+            return
+        if cls._pending:
+            logger.info(f'Waiting for {len(cls._pending)} plots to be rendered...')
+        while cls._pending:
+            cls._wait(*cls._pending.pop(0))
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=True)
+            cls._pool = None
+
+    @staticmethod
+    def _wait(out_file: str, future) -> None:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f'Plot {out_file} failed -> {e}')
+
+
+def _init_worker() -> None:
+    matplotlib.use('Agg')
+
+
+def _render(rc: dict, render, out_file: str, *args, **kwargs) -> None:
+    with plt.rc_context(rc):
+        render(out_file, *args, **kwargs)
+    plt.close('all')
+
+
+def barh(out_file: str, frame: pd.DataFrame, title: str, xlabel: str, **plot_kwargs) -> None:
+    """Horizontal bar plot of the frame, e.g. feature importances or rankings"""
+    ax = frame.plot.barh(**plot_kwargs)
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.tight_layout()
+    ax.legend_.remove()
+    ax.get_figure().savefig(out_file, dpi=300)
+
+
+def heatmap(
+    out_file: str, matrix: pd.DataFrame, title: str = None, figsize: tuple = None, rotation=0, ha='center', **kwargs
+) -> None:
+    """Heatmap of the matrix, kwargs are passed to seaborn.heatmap, rotation and ha of the x tick labels"""
+    import seaborn as sns
+
+    fig = plt.figure(figsize=figsize)
+    sns.heatmap(matrix, **kwargs)
+    if title:
+        plt.title(title)
+    plt.xticks(rotation=rotation, ha=ha)
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+    fig.savefig(out_file, dpi=300)
+
+
+def triangle_heatmap(out_file: str, matrix: pd.DataFrame) -> None:
+    """Lower triangle of a correlation matrix"""
+    import seaborn as sns
+
+    mask = np.triu(np.ones_like(matrix, dtype=bool))
+    ax = sns.heatmap(
+        matrix,
+        mask=mask,
+        cmap='coolwarm',
+        annot=False,
+        square=True,
+        vmin=-1,
+        vmax=1,
+        center=0,
+        linewidths=0.5,
+        cbar_kws={'shrink': 0.5},
+    )
+    ax.figure.tight_layout()
+    ax.get_figure().savefig(out_file, dpi=300)
+
+
+def cluster_map(out_file: str, frame: pd.DataFrame) -> None:
+    import seaborn as sns
+
+    cluster_map = sns.clustermap(frame, figsize=(20, 20), cmap='coolwarm', method='ward', metric='euclidean')
+    cluster_map.savefig(out_file, dpi=300)
+
+
+def rfecv_curve(out_file: str, min_features: int, mean_scores, std_scores, scoring: str, title: str) -> None:
+    """Cross-validated score for increasing number of features"""
+    n_scores = len(mean_scores)
+    plt.figure()
+    plt.xlabel('Number of features selected')
+    plt.ylabel(f'Mean {scoring}')
+    plt.xticks(range(0, n_scores + 1, 5))
+    plt.grid(alpha=0.5)
+    plt.errorbar(range(min_features, n_scores + min_features), mean_scores, yerr=std_scores)
+    plt.title(title)
+    plt.savefig(out_file, dpi=300)
+
+
+def projection(out_file: str, proj, y_train: pd.Series, target_label: str, title: str) -> None:
+    """Interactive 2D or 3D scatter plot of a projection (html), 2D plots are saved as svg as well"""
+    import plotly.express as px
+
+    if proj.shape[1] == 2:
+        fig = px.scatter(
+            proj,
+            x=0,
+            y=1,
+            color=y_train,
+            labels={'color': target_label},
+            title=title,
+            color_continuous_scale='viridis',
+        )
+        fig.write_image(f'{os.path.splitext(out_file)[0]}.svg')
+    else:
+        fig = px.scatter_3d(
+            proj,
+            x=0,
+            y=1,
+            z=2,
+            color=y_train,
+            labels={'color': target_label},
+            title=title,
+            color_continuous_scale='viridis',
+        )
+        fig.update_traces(marker_size=5)
+    fig.write_html(out_file)
+
+
+def boxplot(out_file: str, frame: pd.DataFrame, x: str, y: str) -> None:
+    import seaborn as sns
+
+    fig = plt.figure()
+    sns.boxplot(data=frame, x=x, y=y)
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    fig.savefig(out_file, dpi=300)
+
+
+def timings(out_file: str, records: pd.DataFrame, order: list) -> None:
+    """Total wall time per stage and job"""
+    import seaborn as sns
+
+    fig, ax = plt.subplots(figsize=(10, max(4, 0.4 * records['stage'].nunique())))
+    sns.barplot(data=records, x='wall', y='stage', hue='job', order=order, estimator='sum', errorbar=None, ax=ax)
+    ax.set_xlabel('Total wall time [s]')
+    ax.set_ylabel('Stage')
+    plt.tight_layout()
+    fig.savefig(out_file, dpi=300)
+
+
+def confusion_matrix(out_file: str, conf_matrix) -> None:
+    from sklearn.metrics import ConfusionMatrixDisplay
+
+    plt.figure()
+    plt.tight_layout()
+    ConfusionMatrixDisplay(conf_matrix).plot(cmap='Blues', values_format='.2f')
+    plt.savefig(out_file, dpi=300)
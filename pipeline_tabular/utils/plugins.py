@@ -0,0 +1,126 @@
+import importlib
+import importlib.util
+from functools import partial
+
+
+class Plugin:
+    """Lazily imported plugin, target is 'module:attribute' (attribute may be dotted, e.g. Class.method)
+
+    Nothing is imported until the plugin is loaded, requires lists the optional packages it depends on.
+    """
+
+    def __init__(self, target: str, requires: list = None, **options) -> None:
+        self.target = target
+        self.requires = list(requires or [])
+        self.options = options  # bound as keyword arguments when loaded
+        self._loaded = None
+
+    def missing(self) -> list:
+        """Required packages that are not installed, found without importing them"""
+        return [package for package in self.requires if importlib.util.find_spec(package) is None]
+
+    def load(self):
+        if self._loaded is None:
+            module_name, _, attribute = self.target.partition(':')
+            loaded = importlib.import_module(module_name)
+            for name in attribute.split('.'):
+                loaded = getattr(loaded, name)
+            self._loaded = partial(loaded, **self.options) if self.options else loaded
+        return self._loaded
+
+
+def _steps(module: str, owner: str, names: list, requires: list = None) -> dict:
+    return {name: Plugin(f'pipeline_tabular.utils.{module}:{owner}.{name}', requires) for name in names}
+
+
+PLUGINS = {  # kind -> name -> plugin, names are what the config refers to
+    'selection step': {  # called as step(selection, frame, seed) -> frame, features
+        **_steps(
+            'normalisers.normalisers',
+            'Normalisers',
+            [
+                'l1_norm',
+                'l2_norm',
+                'z_score_norm',
+                'min_max_norm',
+                'max_abs_norm',
+                'robust_norm',
+                'quantile_norm',
+                'power_norm',
+            ],
+        ),
+        **_steps('selections.dimension_projections', 'DimensionProjections', ['pca', 'tsne']),
+        **_steps('selections.dimension_projections', 'DimensionProjections', ['umap'], ['umap']),
+        **_steps(
+            'selections.feature_reductions',
+            'FeatureReductions',
+            ['hand_picked', 'variance_threshold', 'correlation', 'univariate_ranking'],
+        ),
+        **_steps('selections.feature_reductions', 'FeatureReductions', ['mrmr'], ['mrmr']),
+        **_steps('selections.feature_reductions', 'FeatureReductions', ['feature_wiz'], ['featurewiz']),
+        **_steps(
+            'selections.recursive_feature_elimination',
+            'RecursiveFeatureElimination',
+            ['fr_logistic_regression', 'fr_forest', 'fr_extreme_forest', 'fr_adaboost', 'fr_xgboost'],
+        ),
+    },
+    'imputer': {  # called as imputer(imputation) -> unfitted sklearn imputer
+        **_steps(
+            'imputers.imputer',
+            'Imputer',
+            ['iterative_impute', 'simple_impute', 'missing_indicator_impute', 'knn_impute', 'drop_nan_impute'],
+        ),
+    },
+    'sampler': {  # called as sampler(random_state=seed) -> imblearn over sampler, by f'{learn_task}_{method}'
+        'binary_classification_smoten': Plugin('imblearn.over_sampling:SMOTEN', ['imblearn']),
+        'binary_classification_smotenc': Plugin('imblearn.over_sampling:SMOTENC', ['imblearn'], categorical_features=2),
+        'binary_classification_svmsmote': Plugin('imblearn.over_sampling:SVMSMOTE', ['imblearn']),
+        'binary_classification_borderlinesmote': Plugin('imblearn.over_sampling:BorderlineSMOTE', ['imblearn']),
+        'binary_classification_randomoversampler': Plugin('imblearn.over_sampling:RandomOverSampler', ['imblearn']),
+        'regression_adasyn': Plugin('imblearn.over_sampling:ADASYN', ['imblearn']),
+        'regression_smote': Plugin('imblearn.over_sampling:SMOTE', ['imblearn']),
+        'regression_kmeanssmote': Plugin('imblearn.over_sampling:KMeansSMOTE', ['imblearn']),
+        'regression_randomoversampler': Plugin('imblearn.over_sampling:RandomOverSampler', ['imblearn']),
+    },
+    'explainer': {  # called as explainer(config) -> callable as Explain
+        'kernel_shap': Plugin('pipeline_tabular.utils.explain.explain:Explain', ['shap', 'alibi']),
+    },
+    'statistics': {  # called as mwu(x, y) -> two-sided p-value of the Mann-Whitney U test
+        'pingouin': Plugin('pipeline_tabular.utils.statistics:pingouin_mwu', ['pingouin']),
+        'scipy': Plugin('pipeline_tabular.utils.statistics:scipy_mwu'),
+    },
+}
+
+
+def register(kind: str, name: str, target: str, requires: list = None, **options) -> None:
+    """Add a plugin to the registry, e.g. register('selection step', 'my_step', 'my_package.steps:my_step')"""
+    PLUGINS.setdefault(kind, {})[name] = Plugin(target, requires, **options)
+
+
+def get_plugin(kind: str, name: str) -> Plugin:
+    """Look up the plugin in the registry"""
+    if kind not in PLUGINS:
+        raise ValueError(f'Unknown plugin kind: {kind}')
+    if name not in PLUGINS[kind]:
+        raise ValueError(f'Unknown {kind}: {name}, allowed -> {sorted(PLUGINS[kind])}')
+    return PLUGINS[kind][name]
+
+
+def check_plugins(kind: str, names) -> None:
+    """Check that the plugins exist and their packages are installed, without importing them"""
+    unknown = set(names) - set(PLUGINS.get(kind, {}))
+    if unknown:
+        raise ValueError(f'Invalid {kind}, check -> {sorted(unknown)}, allowed -> {sorted(PLUGINS.get(kind, {}))}')
+    for name in set(names):
+        missing = get_plugin(kind, name).missing()
+        if missing:
+            raise ImportError(f'{kind} {name} requires {missing}, install them or remove it from the config')
+
+
+def load_plugin(kind: str, name: str):
+    """Import the plugin on first use"""
+    plugin = get_plugin(kind, name)
+    missing = plugin.missing()
+    if missing:
+        raise ImportError(f'{kind} {name} requires {missing}, install them or remove it from the config')
+    return plugin.load()
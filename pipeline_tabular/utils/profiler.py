@@ -0,0 +1,186 @@
+import cProfile
+import glob
+import itertools
+import os
+import pstats
+import shutil
+import sys
+import threading
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+from loguru import logger
+from omegaconf import DictConfig
+
+
+class SamplingProfiler:
+    """Sample the stack of the profiled thread at a fixed interval from a background thread
+
+    Stacks are counted in folded format (frames from the profiled code down to the sampled frame, separated by ';'),
+    frames enclosing the profiled code are stripped. Only the profiled thread is sampled, i.e. not joblib workers.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        self.thread_id = threading.get_ident()
+        self.base = [frame.f_code for frame in self.frames(sys._getframe(1))]  # enclosing frames, root first
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    def stop(self) -> Counter:
+        self.stopped.set()
+        self.sampler.join()
+        return self.stacks
+
+    def sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = self.frames(frame)
+            n_common = 0
+            while n_common < min(len(frames), len(self.base)) and frames[n_common].f_code is self.base[n_common]:
+                n_common += 1
+            frames = frames[max(0, n_common - 1) :]  # keep the function running the stage as root
+            self.stacks[';'.join(self.frame_name(frame) for frame in frames)] += 1
+
+    @staticmethod
+    def frames(frame) -> list:
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        return frames[::-1]
+
+    @staticmethod
+    def frame_name(frame) -> str:
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class StageProfiler:
+    """Profile selected stages (names as in timings.jsonl) of the first n seeds, see meta.profile
+
+    Every profiled stage writes a profile file to profiles/<stage>/ in the experiment directory, folded stacks in
+    sampling mode and pstats files in cprofile mode. render() aggregates them per stage into flame graphs (sampling)
+    or a pstats summary sorted by cumulative time (cprofile). Nested profiled stages are covered by the outermost one.
+    """
+
+    modes = ['sampling', 'cprofile']
+
+    def __init__(self, config: DictConfig, seeds: list) -> None:
+        profile = config.meta.profile
+        self.stages = set(profile.stages)
+        self.seeds = {str(seed) for seed in seeds[: profile.n_seeds]}
+        self.mode = profile.mode
+        self.interval = profile.interval
+        if self.mode not in self.modes:
+            raise ValueError(f'Unknown meta.profile.mode: {self.mode}, allowed -> {", ".join(self.modes)}')
+        self.out_dir = os.path.join(config.meta.output_dir, config.meta.experiment, 'profiles')
+        shutil.rmtree(self.out_dir, ignore_errors=True)  # profiles of the previous run
+        self.running = False
+        self.counter = itertools.count()  # unique profile files per process
+
+    def active(self, tags: dict) -> bool:
+        seed = tags.get('seed')
+        return not self.running and tags['stage'] in self.stages and (seed is None or str(seed) in self.seeds)
+
+    @contextmanager
+    def __call__(self, tags: dict):
+        """Profile the enclosed stage"""
+        stage_dir = os.path.join(self.out_dir, tags['stage'])
+        os.makedirs(stage_dir, exist_ok=True)
+        name = '_'.join(f'{key}{tags[key]}' for key in ['seed', 'boot_iter', 'job', 'n_top', 'model'] if key in tags)
+        out_file = os.path.join(stage_dir, f'{name}_{os.getpid()}_{next(self.counter)}')
+        self.running = True
+        if self.mode == 'sampling':
+            profiler = SamplingProfiler(self.interval)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield
+        finally:
+            self.running = False
+            if self.mode == 'sampling':
+                with open(f'{out_file}.folded', 'w') as file:
+                    file.writelines(f'{stack} {count}\n' for stack, count in profiler.stop().items())
+            else:
+                profiler.disable()
+                profiler.dump_stats(f'{out_file}.prof')
+
+    def render(self) -> None:
+        """Aggregate the profiles of each stage, over all profiled seeds and processes"""
+        for stage_dir in sorted(glob.glob(os.path.join(self.out_dir, '*', ''))):
+            stage = os.path.basename(os.path.dirname(stage_dir))
+            if self.mode == 'sampling':
+                stacks = Counter()
+                for folded_file in glob.glob(os.path.join(stage_dir, '*.folded')):
+                    with open(folded_file, 'r') as file:
+                        for line in file:
+                            stack, _, count = line.rstrip('\n').rpartition(' ')
+                            stacks[stack] += int(count)
+                if not stacks:
+                    continue
+                with open(os.path.join(self.out_dir, f'{stage}.folded'), 'w') as file:
+                    file.writelines(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+                with open(os.path.join(self.out_dir, f'flamegraph_{stage}.svg'), 'w') as file:
+                    file.write(flame_graph(stacks, f'{stage} ({sum(stacks.values())} samples)'))
+            else:
+                prof_files = glob.glob(os.path.join(stage_dir, '*.prof'))
+                if not prof_files:
+                    continue
+                with open(os.path.join(self.out_dir, f'{stage}.txt'), 'w') as file:
+                    stats = pstats.Stats(*prof_files, stream=file)
+                    stats.dump_stats(os.path.join(self.out_dir, f'{stage}.prof'))
+                    stats.sort_stats('cumulative').print_stats(50)
+        logger.info(f'Profiles of {", ".join(sorted(self.stages))} written to {self.out_dir}')
+
+
+def flame_graph(stacks: Counter, title: str, width: int = 1200, row_height: int = 16) -> str:
+    """SVG flame graph of folded stacks, the width of a frame is its share of the samples"""
+    root = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    boxes, pending = [], [('all', root, 0, 0)]  # name, node, samples before it, depth
+    while pending:
+        name, node, offset, depth = pending.pop()
+        boxes.append((name, node['count'], offset, depth))
+        for child_name, child in sorted(node['children'].items()):
+            pending.append((child_name, child, offset, depth + 1))
+            offset += child['count']
+
+    scale = width / max(root['count'], 1)
+    max_depth = max(depth for *_, depth in boxes)
+    height = (max_depth + 1) * row_height + 2 * row_height
+    svg = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" '
+        f'font-size="11">',
+        f'<text x="{width / 2}" y="{row_height - 4}" text-anchor="middle">{escape(title)}</text>',
+    ]
+    for name, count, offset, depth in boxes:
+        box_width = count * scale
+        if box_width < 0.5:
+            continue
+        x, y = offset * scale, height - (depth + 1) * row_height
+        hue = zlib.crc32(name.encode()) % 60  # warm colours, stable per frame
+        label = escape(name[: int(box_width / 7)]) if box_width > 21 else ''
+        svg.append(
+            f'<g><title>{escape(name)}: {count} samples ({100 * count / max(root["count"], 1):.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{box_width:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue}, 80%, 60%)"/><text x="{x + 2:.1f}" y="{y + row_height - 4}">{label}</text></g>'
+        )
+    svg.append('</svg>')
+    return '\n'.join(svg)
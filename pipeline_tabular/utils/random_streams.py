@@ -0,0 +1,64 @@
+import zlib
+
+import numpy as np
+from omegaconf import DictConfig
+
+from pipeline_tabular.utils.helpers import generate_seeds
+
+
+class RandomStreams:
+    """Random streams derived from a root SeedSequence by task key, independent of the execution order
+
+    Data split seeds, bootstrap seeds and the seeds of selection/verification tasks are drawn from their own child
+    SeedSequence of data_split.init_seed, keyed by e.g. ('bootstrap', seed, boot_iter), hence serial, parallel and
+    sharded runs draw identical splits and folds. Sequential and scheduled runs (meta.cpu_layout.seeds) also write
+    identical scores.json files, which benchmarks.throughput checks. With data_split.rng = legacy, seeds are generated
+    by reseeding numpy's global generator as before, which reproduces the seeds of existing scores.json files.
+    """
+
+    modes = ['streams', 'legacy']
+
+    def __init__(self, config: DictConfig) -> None:
+        self.init_seed = config.data_split.init_seed
+        self.mode = config.data_split.get('rng', 'legacy')  # runs without rng setting used the global generator
+        if self.mode not in self.modes:
+            raise ValueError(f'Unknown data_split.rng: {self.mode}, allowed -> {", ".join(self.modes)}')
+
+    @property
+    def legacy(self) -> bool:
+        return self.mode == 'legacy'
+
+    def seeds(self, n_seeds: int) -> list:
+        """Data split seeds, the first n seeds do not depend on n_seeds"""
+        if self.legacy:
+            np.random.seed(self.init_seed)
+            return generate_seeds(self.init_seed, n_seeds)
+        return [self.seed('split', seed_iter) for seed_iter in range(n_seeds)]
+
+    def boot_seeds(self, seed: int, n_bootstraps: int) -> list:
+        """Bootstrap seeds of a data split seed"""
+        if self.legacy:
+            np.random.seed(seed)
+            return generate_seeds(seed, n_bootstraps)
+        return [self.seed('bootstrap', seed, boot_iter) for boot_iter in range(n_bootstraps)]
+
+    def seed(self, *key) -> int:
+        """32 bit seed of the stream of the given key (ints and strings)"""
+        return int(self.sequence(*key).generate_state(1)[0])
+
+    def generator(self, *key) -> np.random.Generator:
+        return np.random.default_rng(self.sequence(*key))
+
+    def sequence(self, *key) -> np.random.SeedSequence:
+        spawn_key = tuple(
+            int(part) if isinstance(part, (int, np.integer)) else zlib.crc32(str(part).encode()) for part in key
+        )
+        return np.random.SeedSequence(self.init_seed, spawn_key=spawn_key)
+
+    def seed_global(self, *key) -> None:
+        """Seed numpy's global generator for the task of the given key, used by estimators without random_state
+
+        Only in streams mode, the legacy mode keeps the global state of the previous runs.
+        """
+        if not self.legacy:
+            np.random.seed(self.seed(*key))
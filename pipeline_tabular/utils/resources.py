@@ -0,0 +1,70 @@
+import os
+from contextlib import contextmanager
+
+from joblib import parallel_config
+from joblib._parallel_backends import ParallelBackendBase
+from loguru import logger
+from omegaconf import DictConfig
+from threadpoolctl import threadpool_limits
+
+
+class ResourceManager:
+    """Split meta.workers between the nested levels of parallelism to avoid oversubscription
+
+    Levels from outer to inner: seeds (parallel seeds/tasks), search (parallel fits of grid searches, RFECV,
+    permutation importance, mRMR), estimator (n_jobs of the estimator inside a search) and blas (BLAS/OpenMP threads
+    per worker). Levels not set in meta.cpu_layout are derived from meta.workers, all remaining workers go to search.
+    """
+
+    levels = ['seeds', 'search', 'estimator', 'blas']
+
+    def __init__(self, config: DictConfig) -> None:
+        self.workers = config.meta.workers
+        self.requested = config.meta.cpu_layout
+
+    def __call__(self) -> dict:
+        """Return number of workers per level"""
+        layout = {level: self.requested.get(level) for level in self.levels}
+        for level in ['seeds', 'estimator', 'blas']:
+            layout[level] = max(1, int(layout[level] or 1))
+        if not layout['search']:
+            layout['search'] = max(1, self.workers // (layout['seeds'] * layout['estimator'] * layout['blas']))
+        return layout
+
+    def log_layout(self, layout: dict) -> None:
+        """Log the effective layout, warn if it asks for more threads than workers"""
+        n_threads = layout['seeds'] * layout['search'] * layout['estimator'] * layout['blas']
+        logger.info(
+            f'CPU layout for {self.workers} workers: {layout["seeds"]} seeds x {layout["search"]} search x '
+            f'{layout["estimator"]} estimator x {layout["blas"]} BLAS = {n_threads} threads'
+        )
+        if n_threads > self.workers:
+            logger.warning(f'CPU layout uses {n_threads} threads for {self.workers} workers, check meta.cpu_layout')
+
+    @contextmanager
+    def limit(self, layout: dict, **backend_config):
+        """Apply BLAS/OpenMP limits to this process (one seed's share) and to the joblib workers (blas share)
+
+        No backend is set, so call sites preferring threads keep them. Process workers take their limits from the
+        environment, as joblib only accepts inner_max_num_threads together with an explicit backend.
+        """
+        seed_share = max(1, self.workers // layout['seeds'])
+        with threadpool_limits(limits=seed_share), self.worker_threads(layout['blas']), parallel_config(
+            n_jobs=layout['search'], **backend_config
+        ):
+            yield
+
+    @staticmethod
+    @contextmanager
+    def worker_threads(n_threads: int):
+        """Thread limits passed by joblib to the process workers it starts"""
+        previous = {var: os.environ.get(var) for var in ParallelBackendBase.MAX_NUM_THREADS_VARS}
+        os.environ.update({var: str(n_threads) for var in previous})
+        try:
+            yield
+        finally:
+            for var, value in previous.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
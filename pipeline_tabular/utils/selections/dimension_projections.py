@@ -1,54 +1,38 @@
 import os
 
 import pandas as pd
-import plotly.express as px
 from loguru import logger
 from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
-from umap import UMAP
+
+from pipeline_tabular.utils import plots
+from pipeline_tabular.utils.instrumentation import stage
+from pipeline_tabular.utils.plots import PlotRenderer
 
 
 def plot_bubble(func):
     """Creates 2D and 3D scatter plots of the frame"""
 
-    def wrapper(self, *args):
-        frame = args[0]
-        show_plots = self.config.meta.pipeline_plots
+    def wrapper(self, frame: pd.DataFrame, seed: int) -> tuple:
         y_train = frame[self.target_label]
         x_train = frame.drop(self.target_label, axis=1)
 
-        proj_2d, proj_3d, name = func(self, x_train)  # call the wrapped function
-        if show_plots:
-            if proj_2d is not None:
-                fig_2d = px.scatter(
-                    proj_2d,
-                    x=0,
-                    y=1,
-                    color=y_train,
-                    labels={'color': self.target_label},
-                    title=f'{name} 2D',
-                    color_continuous_scale='viridis',
-                )
-                fig_2d.write_image(os.path.join(self.job_dir, f'{name}_2d.svg'))
-                fig_2d.write_html(os.path.join(self.job_dir, f'{name}_2d.html'))
-            else:
-                logger.warning(f'Cannot plot {name} 2D, needs at least 2 features to run')
-
-            if proj_3d is not None:
-                fig_3d = px.scatter_3d(
-                    proj_3d,
-                    x=0,
-                    y=1,
-                    z=2,
-                    color=y_train,
-                    labels={'color': self.target_label},
-                    title=f'{name} 3D',
-                    color_continuous_scale='viridis',
-                )
-                fig_3d.update_traces(marker_size=5)
-                fig_3d.write_html(os.path.join(self.job_dir, f'{name}_3d.html'))
-            else:
-                logger.warning(f'Cannot plot {name} 3D, needs at least 3 features to run')
+        proj_2d, proj_3d, name = func(self, x_train, seed)  # call the wrapped function
+        if self.config.plot_first_iter:
+            with stage('plot'):
+                for proj, dims in [(proj_2d, 2), (proj_3d, 3)]:
+                    if proj is not None:
+                        PlotRenderer.submit(
+                            'full',
+                            plots.projection,
+                            os.path.join(self.job_dir, f'{name}_{dims}d.html'),
+                            proj,
+                            y_train,
+                            self.target_label,
+                            f'{name} {dims}D',
+                        )
+                    else:
+                        logger.warning(f'Cannot plot {name} {dims}D, needs at least {dims} features to run')
 
         if proj_2d is not None:
             proj_2d = pd.DataFrame(proj_2d, index=frame.index)
@@ -98,6 +82,8 @@ class DimensionProjections:
     @plot_bubble
     def umap(self, frame: pd.DataFrame, seed: int) -> (pd.DataFrame, pd.DataFrame, str):
         """Perform UMAP dimensionality reduction and visualisation"""
+        from umap import UMAP
+
         proj_2d, proj_3d = None, None
         if len(frame.columns) >= 2:
             umap_2d = UMAP(n_components=2, random_state=seed)
@@ -1,28 +1,32 @@
 import os
-import mrmr
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
+from joblib import hash as joblib_hash
 from loguru import logger
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.feature_selection import VarianceThreshold
 from sklearn.inspection import permutation_importance
 
-from pipeline_tabular.utils.helpers import init_estimator
+from pipeline_tabular.utils import plots
+from pipeline_tabular.utils.helpers import init_estimator, translate_param_grid
+from pipeline_tabular.utils.instrumentation import Instrumentation, stage
+from pipeline_tabular.utils.plots import PlotRenderer
 from pipeline_tabular.utils.verifications.verification import CrossValidation
 
 
 class FeatureReductions:
     """Simple feature reduction methods"""
 
+    threshold_cache = {}  # threshold independent results per seed and input data, shared by threshold sweeps
+
     def __init__(self) -> None:
         self.config = None
         self.plot_format = None
         self.job_dir = None
         self.metadata = None
         self.workers = None
+        self.estimator_workers = None
         self.target_label = None
         self.corr_method = None
         self.corr_thresh = None
@@ -33,8 +37,23 @@ class FeatureReductions:
         self.scoring = None
         self.class_weight = None
         self.param_grids = None
+        self.backends = None
+        self.time_budget = None
+        self.executor = None
         self.n_top_features = None
 
+    def cached(self, seed: int, name: str, frame: pd.DataFrame, compute):
+        """Result of compute() for the given seed and input data, computed once, e.g. for all thresholds of a sweep"""
+        key = (str(seed), name, joblib_hash(frame))
+        if key not in FeatureReductions.threshold_cache:
+            FeatureReductions.threshold_cache[key] = compute()
+        return FeatureReductions.threshold_cache[key]
+
+    @classmethod
+    def release_cache(cls, seed) -> None:
+        for key in [key for key in cls.threshold_cache if key[0] == str(seed)]:
+            del cls.threshold_cache[key]
+
     def hand_picked(self, frame: pd.DataFrame, seed: int) -> tuple:
         features = list(self.config.meta.hand_picked)
         frame = frame[features + [self.target_label]]
@@ -45,11 +64,20 @@ class FeatureReductions:
         """Remove features with variance below threshold"""
         y_frame = frame[self.target_label]
         x_frame = frame.drop(self.target_label, axis=1)
-        selector = VarianceThreshold(threshold=self.variance_thresh * (1 - self.variance_thresh))
-        selector.fit(x_frame)
-        x_frame = x_frame.loc[:, selector.get_support()]
+        variances = self.cached(seed, 'variance', x_frame, lambda: np.nanvar(x_frame.to_numpy(dtype=float), axis=0))
+        threshold = self.variance_thresh * (1 - self.variance_thresh)
+        if threshold == 0:  # as sklearn, also drop constant features whose variance is not exactly 0 numerically
+            values = x_frame.to_numpy(dtype=float)
+            peak_to_peak = self.cached(
+                seed, 'peak_to_peak', x_frame, lambda: np.nanmax(values, axis=0) - np.nanmin(values, axis=0)
+            )
+            variances = np.nanmin([variances, peak_to_peak], axis=0)
+        support = variances > threshold  # as sklearn's VarianceThreshold
+        if not support.any():
+            raise ValueError(f'No feature in X meets the variance threshold {threshold:.5f}')
+        x_frame = x_frame.loc[:, support]
         logger.info(
-            f'Removed {len(selector.get_support()) - len(x_frame.columns)} '
+            f'Removed {len(support) - len(x_frame.columns)} '
             f'features with same value in more than {int(self.variance_thresh*100)}% of subjects, '
             f'number of remaining features: {len(x_frame.columns)}'
         )
@@ -61,15 +89,58 @@ class FeatureReductions:
         """Compute correlation between features and optionally drop highly correlated ones"""
         y_frame = frame[self.target_label]
         x_frame = frame.drop(self.target_label, axis=1)
+        abs_corr = self.cached(
+            seed,
+            f'correlation_{self.corr_method}_{self.corr_ranking}',
+            frame,
+            lambda: self.ranked_correlation(frame, seed),
+        )
+        upper_tri = abs_corr.where(np.triu(np.ones(abs_corr.shape), k=1).astype(bool))
+
+        cols_to_drop = [col for col in upper_tri.columns if any(upper_tri[col] > self.corr_thresh)]
+        x_frame = x_frame.drop(cols_to_drop, axis=1)
+        logger.info(
+            f'Removed {len(cols_to_drop)} redundant features with correlation above {self.corr_thresh}, '
+            f'number of remaining features: {len(x_frame.columns)}'
+        )
+        abs_corr = abs_corr.drop(cols_to_drop, axis=0)
+        abs_corr = abs_corr.drop(cols_to_drop, axis=1)
+
+        # plot correlation heatmap
+        if self.config.plot_first_iter:
+            with stage('plot'):
+                PlotRenderer.submit(
+                    'full',
+                    plots.heatmap,
+                    os.path.join(self.job_dir, f'corr_plot.{self.plot_format}'),
+                    abs_corr,
+                    figsize=(20, 20),
+                    rotation=90,
+                    annot=False,
+                    xticklabels=True,
+                    yticklabels=True,
+                    cmap='viridis',
+                )
+
+        new_frame = pd.concat([x_frame, y_frame], axis=1)
+        features = list(x_frame.columns)
+        return new_frame, features
+
+    def ranked_correlation(self, frame: pd.DataFrame, seed: int) -> pd.DataFrame:
+        """Absolute correlation matrix sorted w.r.t. feature importance, independent of corr_thresh"""
+        y_frame = frame[self.target_label]
+        x_frame = frame.drop(self.target_label, axis=1)
         corr_matrix = x_frame.corr(method=self.corr_method).round(2)
 
         # calculate feature importance
         if self.corr_ranking == 'forest':
+            x_shared = self.executor.publish(x_frame, seed, 'corr_x')
             estimator = RandomForestClassifier(random_state=seed, n_jobs=self.workers)
-            estimator.fit(x_frame, y_frame)
+            estimator.fit(x_shared, y_frame)
+            Instrumentation.count_fits(1)
             scoring = self.config.selection.scoring[self.learn_task]
             perm_importances = permutation_importance(
-                estimator, x_frame, y_frame, n_repeats=5, scoring=scoring, random_state=seed, n_jobs=self.workers
+                estimator, x_shared, y_frame, n_repeats=5, scoring=scoring, random_state=seed, n_jobs=self.workers
             )
             importances = perm_importances.importances_mean
             importances = pd.Series(importances, index=x_frame.columns)
@@ -83,39 +154,20 @@ class FeatureReductions:
 
         # sort corr_matrix w.r.t. feature importance
         corr_matrix = corr_matrix.reindex(index=importances.index, columns=importances.index)
-        abs_corr = corr_matrix.abs()
-        upper_tri = abs_corr.where(np.triu(np.ones(abs_corr.shape), k=1).astype(bool))
-
-        cols_to_drop = [col for col in upper_tri.columns if any(upper_tri[col] > self.corr_thresh)]
-        x_frame = x_frame.drop(cols_to_drop, axis=1)
-        logger.info(
-            f'Removed {len(cols_to_drop)} redundant features with correlation above {self.corr_thresh}, '
-            f'number of remaining features: {len(x_frame.columns)}'
-        )
-        abs_corr = abs_corr.drop(cols_to_drop, axis=0)
-        abs_corr = abs_corr.drop(cols_to_drop, axis=1)
-
-        # plot correlation heatmap
-        if self.config.plot_first_iter:
-            fig = plt.figure(figsize=(20, 20))
-            sns.heatmap(abs_corr, annot=False, xticklabels=True, yticklabels=True, cmap='viridis')
-            plt.xticks(rotation=90)
-            plt.savefig(os.path.join(self.job_dir, f'corr_plot.{self.plot_format}'), dpi=300)
-            plt.close(fig)
-
-        new_frame = pd.concat([x_frame, y_frame], axis=1)
-        features = list(x_frame.columns)
-        return new_frame, features
+        return corr_matrix.abs()
 
     def mrmr(self, frame: pd.DataFrame, seed: int) -> tuple:
         """Maximum relevance minimum redundancy to select features"""
+        import mrmr
+
         y_frame = frame[self.target_label]
         x_frame = frame.drop(self.target_label, axis=1)
         nunique = x_frame.nunique()
         categorical = list(nunique[nunique <= 5].index)
+        x_shared = self.executor.publish(x_frame, seed, 'mrmr_x')
         if self.learn_task == 'binary_classification':
             features = mrmr.mrmr_classif(
-                x_frame,
+                x_shared,
                 y_frame,
                 K=max(self.n_top_features),
                 cat_features=categorical,
@@ -124,7 +176,7 @@ class FeatureReductions:
             )
         elif self.learn_task == 'regression':
             features = mrmr.mrmr_regression(
-                x_frame,
+                x_shared,
                 y_frame,
                 K=max(self.n_top_features),
                 cat_features=categorical,
@@ -164,14 +216,17 @@ class FeatureReductions:
         y_frame = frame[self.target_label]
         x_frame = frame.drop(self.target_label, axis=1)
 
+        backend = self.backends.get(model, 'sklearn')
         estimator, cross_validator, scoring = init_estimator(
             model,
             self.learn_task,
             seed,
             self.scoring,
             self.class_weight,
-            self.workers,
+            self.estimator_workers,
+            backend,
         )
+        param_grid = translate_param_grid(model, self.learn_task, self.param_grids[model], backend)
         scores = {}
         for feature in x_frame.columns:
             optimiser = CrossValidation(
@@ -179,12 +234,14 @@ class FeatureReductions:
                 y_frame,
                 estimator,
                 cross_validator,
-                self.param_grids[model],
+                param_grid,
                 scoring,
                 seed,
                 self.workers,
+                self.time_budget,
             )
-            scores[feature] = optimiser().best_score_
+            feature_frame = frame[[feature, self.target_label]]  # score only depends on the feature itself
+            scores[feature] = self.cached(seed, f'univariate_{model}', feature_frame, lambda: optimiser().best_score_)
         if self.univariate_thresh > 0:
             scores = {key: value for key, value in scores.items() if value > self.univariate_thresh}
         scores = dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
@@ -194,6 +251,8 @@ class FeatureReductions:
 
     def univariate_analysis(self, frame: pd.DataFrame) -> tuple:
         """Perform univariate analysis (box plots and distributions)"""
+        import seaborn as sns
+
         frame_long = frame.melt(id_vars=[self.target_label])
         sns.boxplot(
             data=frame_long,
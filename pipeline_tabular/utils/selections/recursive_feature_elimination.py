@@ -1,13 +1,14 @@
 import os
 
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 import pandas as pd
 from loguru import logger
 from sklearn.feature_selection import RFECV, RFE
 
-from pipeline_tabular.utils.helpers import init_estimator
+from pipeline_tabular.utils import plots
+from pipeline_tabular.utils.helpers import init_estimator, translate_param_grid
+from pipeline_tabular.utils.instrumentation import Instrumentation, stage
+from pipeline_tabular.utils.plots import PlotRenderer
 from pipeline_tabular.utils.verifications.verification import CrossValidation
 
 
@@ -20,6 +21,7 @@ class RecursiveFeatureElimination:
         self.plot_format = None
         self.metadata = None
         self.workers = None
+        self.estimator_workers = None
         self.target_label = None
         self.corr_method = None
         self.corr_thresh = None
@@ -28,27 +30,34 @@ class RecursiveFeatureElimination:
         self.class_weight = None
         self.learn_task = None
         self.param_grids = None
+        self.backends = None
+        self.time_budget = None
+        self.executor = None
 
     def __reduction(self, frame: pd.DataFrame, rfe_estimator: str, seed: int) -> tuple:
         """Reduce the number of features using recursive feature elimination"""
+        backend = self.backends.get(rfe_estimator, 'sklearn')
         estimator, cross_validator, scoring = init_estimator(
-            rfe_estimator, self.learn_task, seed, self.scoring, self.class_weight, self.workers
+            rfe_estimator, self.learn_task, seed, self.scoring, self.class_weight, self.estimator_workers, backend
         )
+        param_grid = translate_param_grid(rfe_estimator, self.learn_task, self.param_grids[rfe_estimator], backend)
 
         y = frame[self.target_label]
-        x = frame.drop(self.target_label, axis=1)
+        x = self.executor.publish(frame.drop(self.target_label, axis=1), seed, 'rfe_x')
         min_features = 2
         optimiser = CrossValidation(
             x,
             y,
             estimator,
             cross_validator,
-            self.param_grids[rfe_estimator],
+            param_grid,
             scoring,
             seed,
             self.workers,
+            self.time_budget,
         )
-        estimator = optimiser()  # find estimator with ideal parameters
+        with stage('search', model=rfe_estimator):
+            estimator = optimiser()  # find estimator with ideal parameters
 
         selector = RFECV(
             estimator=estimator.best_estimator_,
@@ -57,24 +66,24 @@ class RecursiveFeatureElimination:
             scoring=scoring,
             n_jobs=self.workers,
         )
-        selector.fit(x, y)
+        with stage('rfecv', model=rfe_estimator):
+            selector.fit(x, y)
+        n_fits_per_elimination = x.shape[1] - min_features + 1  # step 1
+        Instrumentation.count_fits((cross_validator.get_n_splits() + 1) * n_fits_per_elimination + 1)
 
         # Plot performance for increasing number of features
         if self.config.plot_first_iter:
-            n_scores = len(selector.cv_results_['mean_test_score'])
-            fig = plt.figure()
-            plt.xlabel('Number of features selected')
-            plt.ylabel(f'Mean {scoring}')
-            plt.xticks(range(0, n_scores + 1, 5))
-            plt.grid(alpha=0.5)
-            plt.errorbar(
-                range(min_features, n_scores + min_features),
-                selector.cv_results_['mean_test_score'],
-                yerr=selector.cv_results_['std_test_score'],
-            )
-            plt.title(f'Recursive Feature Elimination for {rfe_estimator} estimator')
-            plt.savefig(os.path.join(self.job_dir, f'RFECV_{rfe_estimator}.{self.plot_format}'), dpi=300)
-            plt.close(fig)
+            with stage('plot'):
+                PlotRenderer.submit(
+                    'full',
+                    plots.rfecv_curve,
+                    os.path.join(self.job_dir, f'RFECV_{rfe_estimator}.{self.plot_format}'),
+                    min_features,
+                    selector.cv_results_['mean_test_score'],
+                    selector.cv_results_['std_test_score'],
+                    scoring,
+                    f'Recursive Feature Elimination for {rfe_estimator} estimator',
+                )
 
         frame = pd.concat((x.loc[:, selector.support_], frame[self.target_label]), axis=1)  # concat with target label
 
@@ -92,14 +101,15 @@ class RecursiveFeatureElimination:
             f'number of remaining features: {len(frame.columns) - 1}'
         )
         if self.config.plot_first_iter:
-            ax = importances.plot.barh()
-            fig = ax.get_figure()
-            plt.title(f'Feature importance' f'\n{rfe_estimator} estimator for target: {self.target_label}')
-            plt.xlabel('Feature importance')
-            plt.tight_layout()
-            plt.gca().legend_.remove()
-            plt.savefig(os.path.join(self.job_dir, f'feature_importance_{rfe_estimator}.{self.plot_format}'), dpi=300)
-            plt.close(fig)
+            with stage('plot'):
+                PlotRenderer.submit(
+                    'full',
+                    plots.barh,
+                    os.path.join(self.job_dir, f'feature_importance_{rfe_estimator}.{self.plot_format}'),
+                    importances,
+                    f'Feature importance\n{rfe_estimator} estimator for target: {self.target_label}',
+                    'Feature importance',
+                )
 
         features = importances.index.tolist()[::-1]
 
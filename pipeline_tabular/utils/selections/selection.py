@@ -2,7 +2,11 @@ import pandas as pd
 from loguru import logger
 from omegaconf import DictConfig
 
+from pipeline_tabular.config_manager import ConfigManager
+from pipeline_tabular.utils.instrumentation import stage
 from pipeline_tabular.utils.normalisers import Normalisers
+from pipeline_tabular.utils.plugins import check_plugins, load_plugin
+from pipeline_tabular.utils.resources import ResourceManager
 from pipeline_tabular.utils.selections.dimension_projections import DimensionProjections
 from pipeline_tabular.utils.selections.feature_reductions import FeatureReductions
 from pipeline_tabular.utils.selections.recursive_feature_elimination import (
@@ -18,7 +22,9 @@ class Selection(DataHandler, Normalisers, DimensionProjections, FeatureReduction
         super().__init__()
         self.config = config
         self.plot_format = config.meta.plot_format
-        self.workers = config.meta.workers
+        cpu_layout = ResourceManager(config)()
+        self.workers = cpu_layout['search']
+        self.estimator_workers = cpu_layout['estimator']
         self.jobs = config.selection.jobs
         self.task = config.meta.learn_task
         self.scoring = config.selection.scoring
@@ -30,6 +36,8 @@ class Selection(DataHandler, Normalisers, DimensionProjections, FeatureReduction
         self.variance_thresh = config.selection.variance_thresh
         self.class_weight = config.selection.class_weight
         self.param_grids = config.verification.param_grids
+        self.backends = config.verification.backends
+        self.time_budget = config.verification.time_budget
         self.n_top_features = config.verification.use_n_top_features
         self.job_name = ''
         self.job_dir = None
@@ -39,22 +47,27 @@ class Selection(DataHandler, Normalisers, DimensionProjections, FeatureReduction
         self.__check_jobs()
         self.job_name = job_name
         self.job_dir = job_dir
+        self.streams.seed_global('selection', seed, boot_iter, job_name)
 
-        frame = self.get_store('frame', seed, 'train')
-        for step in job:
-            logger.info(f'Running {step} for seed {seed}...')
-            frame, features, error = self.process_job(step, frame, seed)
-            if error:
-                logger.error(f'Step {step} is invalid')
-                break
-            self.__store_features(features, seed, boot_iter)
+        frame = self.get_store('frame', seed, 'train').copy()  # normalisation steps work in place
+        with stage('selection', seed=seed, boot_iter=boot_iter, job=job_name):
+            try:
+                for step in job:
+                    logger.info(f'Running {step} for seed {seed}...')
+                    with stage(step):
+                        frame, features, error = self.process_job(step, frame, seed)
+                    if error:
+                        logger.error(f'Step {step} is invalid')
+                        break
+                    self.__store_features(features, seed, boot_iter)
+            finally:  # thresholds set by swept steps must not leak into the next job
+                for threshold in ConfigManager.threshold_steps.values():
+                    setattr(self, threshold, self.config.selection[threshold])
 
     def __check_jobs(self) -> None:
-        """Check if the given jobs are valid"""
-        valid_methods = set([x for x in dir(self) if not x.startswith('_') and x != 'process_job'])
-        jobs = set([x for sublist in self.jobs for x in sublist])
-        if not jobs.issubset(valid_methods):
-            raise ValueError(f'Invalid job, check -> {str(jobs - valid_methods)}')
+        """Check if the given jobs are valid, i.e. registered steps whose packages are installed"""
+        jobs = set([x.partition('@')[0] for sublist in self.jobs for x in sublist])  # without swept thresholds
+        check_plugins('selection step', jobs)
 
     def __store_features(self, features: list, seed: int, boot_iter) -> None:
         """Store features"""
@@ -75,6 +88,9 @@ class Selection(DataHandler, Normalisers, DimensionProjections, FeatureReduction
                 f'\nThe previous step does not seem to produce any output.'
             )
             return None, None, True
-        frame, features = getattr(self, step)(frame, seed)
+        step, _, threshold = step.partition('@')
+        if threshold:  # virtual step of a threshold sweep, e.g. correlation@0.9
+            setattr(self, ConfigManager.threshold_steps[step], float(threshold))
+        frame, features = load_plugin('selection step', step)(self, frame, seed)  # imported on first use
         return frame, features, False
 
@@ -0,0 +1,12 @@
+def pingouin_mwu(x, y) -> float:
+    """Two-sided p-value of the Mann-Whitney U test (pingouin)"""
+    import pingouin as pg
+
+    return pg.mwu(x, y)['p-val'].iloc[0]
+
+
+def scipy_mwu(x, y) -> float:
+    """Two-sided p-value of the Mann-Whitney U test (scipy), same test as pingouin without the extra dependency"""
+    from scipy.stats import mannwhitneyu
+
+    return mannwhitneyu(x, y, alternative='two-sided').pvalue
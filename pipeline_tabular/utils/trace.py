@@ -0,0 +1,45 @@
+import json
+
+import pandas as pd
+from loguru import logger
+
+TAG_KEYS = ['seed', 'boot_iter', 'job', 'n_top', 'model', 'estimator', 'candidate', 'fold', 'status', 'pid']
+
+
+def export_trace(records: pd.DataFrame, out_file: str) -> None:
+    """Write stage records as Chrome trace events (chrome://tracing, ui.perfetto.dev), one lane per worker
+
+    Lanes are the main process, the workers of the task scheduler and the fits of timed grid searches. Stages of a
+    lane are nested by time, gaps between them are idle time of the worker.
+    """
+    if records.empty:
+        return
+    workers = sorted(records['worker'].fillna('main').unique(), key=lambda worker: (worker != 'main', worker))
+    lanes = {worker: lane for lane, worker in enumerate(workers)}
+    events = []
+    for worker, lane in lanes.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': lane, 'args': {'name': worker}})
+        events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 0, 'tid': lane, 'args': {'sort_index': lane}})
+    start = records['start'].min()
+    for record in records.sort_values('start').to_dict('records'):
+        args = {key: integral(record[key]) for key in TAG_KEYS if key in record and pd.notna(record[key])}
+        events.append(
+            {
+                'name': record['stage'],
+                'cat': record['parent'] if pd.notna(record.get('parent')) else 'run',
+                'ph': 'X',
+                'ts': round((record['start'] - start) * 1e6),  # microseconds since the start of the run
+                'dur': round(record['wall'] * 1e6),
+                'pid': 0,
+                'tid': lanes[record['worker'] if pd.notna(record['worker']) else 'main'],
+                'args': args,
+            }
+        )
+    with open(out_file, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, default=str)
+    logger.info(f'Trace of {len(records)} stages on {len(lanes)} workers written to {out_file}')
+
+
+def integral(value):
+    """Integer tags (e.g. seeds) of columns with missing values are read as floats"""
+    return int(value) if isinstance(value, float) and value.is_integer() else value
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sklearn.ensemble import (
+    ExtraTreesClassifier,
+    ExtraTreesRegressor,
+    GradientBoostingClassifier,
+    GradientBoostingRegressor,
+    HistGradientBoostingClassifier,
+    HistGradientBoostingRegressor,
+    RandomForestClassifier,
+    RandomForestRegressor,
+)
+from sklearn.linear_model import LogisticRegression, OrthogonalMatchingPursuit
+from sklearn.model_selection import ParameterGrid
+from sklearn.svm import SVC
+
+TREE_ENSEMBLES = (
+    ExtraTreesClassifier,
+    ExtraTreesRegressor,
+    GradientBoostingClassifier,
+    GradientBoostingRegressor,
+    HistGradientBoostingClassifier,
+    HistGradientBoostingRegressor,
+    RandomForestClassifier,
+    RandomForestRegressor,
+)
+SOLVER_PENALTIES = {  # penalties supported by each LogisticRegression solver
+    'lbfgs': ['l2', 'none', None],
+    'newton-cg': ['l2', 'none', None],
+    'newton-cholesky': ['l2', 'none', None],
+    'sag': ['l2', 'none', None],
+    'liblinear': ['l1', 'l2'],
+    'saga': ['l1', 'l2', 'elasticnet', 'none', None],
+}
+
+
+class GridCompiler:
+    """Prune invalid and no-op hyperparameter combinations from a parameter grid before the grid search
+
+    Every combination of the grid is canonicalised with the parameter semantics of the estimator and the shape of the
+    training data, i.e. parameters without effect are removed, values with identical effect are merged, and
+    combinations the estimator would reject are dropped. The first combination of each equivalence class is kept, so
+    the candidate order (and therefore tie-breaking in GridSearchCV) is unchanged.
+    """
+
+    total_fits_saved = 0  # accumulated over all compiled grids of the run
+
+    def __init__(self, estimator, cross_validator) -> None:
+        self.estimator = estimator
+        self.cross_validator = cross_validator
+        self.valid_params = set(estimator.get_params().keys())
+
+    def __call__(self, param_grid: dict or list, x_train: pd.DataFrame, y_train: pd.DataFrame) -> list:
+        """Return the compiled grid as list of single-candidate grids, usable by GridSearchCV"""
+        self.n_features = x_train.shape[1]
+        self.n_fold_samples = min(len(train) for train, _ in self.cross_validator.split(x_train, y_train))
+        param_grid = [dict(grid) for grid in param_grid] if isinstance(param_grid, list) else dict(param_grid)
+
+        candidates, seen, n_raw, n_invalid = [], set(), 0, 0
+        for params in ParameterGrid(param_grid):
+            n_raw += 1
+            params = self.canonicalise(dict(params))
+            if params is None:
+                n_invalid += 1
+                continue
+            params, key = params
+            if key not in seen:
+                seen.add(key)
+                candidates.append({name: [value] for name, value in params.items()})
+
+        if not candidates:
+            raise ValueError(f'No valid parameter combination left for {self.estimator.__class__.__name__}')
+        fits_saved = (n_raw - len(candidates)) * self.cross_validator.get_n_splits()
+        GridCompiler.total_fits_saved += fits_saved
+        logger.debug(
+            f'Compiled grid for {self.estimator.__class__.__name__}: {n_raw} -> {len(candidates)} candidates '
+            f'({n_invalid} invalid, {n_raw - n_invalid - len(candidates)} duplicates), {fits_saved} fits saved'
+        )
+
+        return candidates
+
+    def canonicalise(self, params: dict) -> tuple or None:
+        """Return combination without no-op parameters and its equivalence key, None if invalid"""
+        params.pop('warm_start', None)  # every fit inside the grid search starts from a fresh clone
+        unknown = set(params) - self.valid_params
+        if unknown:
+            logger.warning(f'Dropping combination with unknown parameters for {self.estimator}: {unknown}')
+            return None
+
+        key = dict(params)  # values with identical effect are mapped to the same key
+        if isinstance(self.estimator, LogisticRegression):
+            params, key = self.logistic_regression(params, key)
+        elif isinstance(self.estimator, SVC):
+            params, key = self.svm(params, key)
+        elif isinstance(self.estimator, TREE_ENSEMBLES):
+            params, key = self.tree_ensemble(params, key)
+        elif isinstance(self.estimator, OrthogonalMatchingPursuit):
+            params, key = self.omp(params, key)
+        if params is None:
+            return None
+
+        return params, tuple(sorted((name, repr(value)) for name, value in key.items()))
+
+    def logistic_regression(self, params: dict, key: dict) -> tuple:
+        """Penalty/solver compatibility, l1_ratio only used by elasticnet, C not used without penalty"""
+        penalty = params.get('penalty', self.estimator.penalty)
+        solver = params.get('solver', self.estimator.solver)
+        if penalty not in SOLVER_PENALTIES.get(solver, [penalty]):
+            return None, None
+        if penalty == 'elasticnet' and params.get('l1_ratio', self.estimator.l1_ratio) is None:
+            return None, None
+        if penalty != 'elasticnet':
+            params.pop('l1_ratio', None)
+            key.pop('l1_ratio', None)
+        if penalty in ['none', None]:
+            params.pop('C', None)
+            key.pop('C', None)
+        return params, key
+
+    def svm(self, params: dict, key: dict) -> tuple:
+        """Kernel-specific parameters have no effect for other kernels"""
+        kernel = params.get('kernel', self.estimator.kernel)
+        no_ops = []
+        if kernel != 'poly':
+            no_ops.append('degree')
+        if kernel not in ['poly', 'sigmoid']:
+            no_ops.append('coef0')
+        if kernel == 'linear':
+            no_ops.append('gamma')
+        for name in no_ops:
+            params.pop(name, None)
+            key.pop(name, None)
+        return params, key
+
+    def tree_ensemble(self, params: dict, key: dict) -> tuple:
+        """Resolve max_features to the number of features drawn, max_depth beyond reachable depth is unbounded"""
+        if 'max_features' in params:
+            if isinstance(params['max_features'], int) and params['max_features'] > self.n_features:
+                return None, None
+            key['max_features'] = self.resolve_max_features(params['max_features'])
+        if params.get('max_depth') is not None and params['max_depth'] >= self.n_fold_samples - 1:
+            key['max_depth'] = None  # a tree on n samples cannot be deeper than n - 1
+        return params, key
+
+    def omp(self, params: dict, key: dict) -> tuple:
+        """n_nonzero_coefs cannot exceed number of features, None defaults to 10% of the features"""
+        n_nonzero_coefs = params.get('n_nonzero_coefs')
+        if n_nonzero_coefs is None:
+            key['n_nonzero_coefs'] = max(int(0.1 * self.n_features), 1)
+        elif n_nonzero_coefs > self.n_features:
+            return None, None
+        return params, key
+
+    def resolve_max_features(self, max_features) -> int:
+        """Number of features considered per split"""
+        if max_features == 'sqrt':
+            return max(1, int(np.sqrt(self.n_features)))
+        if max_features == 'log2':
+            return max(1, int(np.log2(self.n_features)))
+        if max_features is None:
+            return self.n_features
+        if isinstance(max_features, float):
+            return max(1, int(max_features * self.n_features))
+        return max_features
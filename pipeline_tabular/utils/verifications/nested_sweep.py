@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid
+
+from pipeline_tabular.utils.data_split.fold_cache import FoldCache
+from pipeline_tabular.utils.instrumentation import Instrumentation
+from pipeline_tabular.utils.verifications.grid_compiler import GridCompiler
+
+
+class SweepResult:
+    """Fitted search result for one n_top, exposes the same interface as a fitted GridSearchCV"""
+
+    def __init__(self, best_estimator, best_params: dict, best_score: float, cv_results: dict) -> None:
+        self.best_estimator_ = best_estimator
+        self.best_params_ = best_params
+        self.best_score_ = best_score
+        self.cv_results_ = cv_results
+
+    def __getattr__(self, name):
+        if 'best_estimator_' not in self.__dict__:  # e.g. during unpickling
+            raise AttributeError(name)
+        return getattr(self.best_estimator_, name)  # predict, decision_function, predict_proba, coef_, ...
+
+
+class NestedFeatureSweep:
+    """Warm-started grid search of linear models over nested top-feature prefixes
+
+    The problem with the top k+2 features contains the one with the top k features, so for every fold and
+    hyperparameter combination the prefixes are fitted in increasing order, starting each fit from the previous
+    coefficients padded with zeros for the new features. Converged solutions do not depend on the starting point,
+    hence the chosen best parameters match independent grid searches within solver tolerance.
+    """
+
+    supported_models = ('logistic_regression', 'lasso', 'elastic_net')
+
+    def __init__(
+        self,
+        x_train: pd.DataFrame,
+        y_train: pd.DataFrame,
+        features: list,
+        n_top_features: list,
+        estimator,
+        cross_validator,
+        param_grid: dict,
+        scoring: str,
+        workers: int,
+    ) -> None:
+        self.x_train = x_train
+        self.y_train = y_train
+        self.features = features
+        self.n_top_features = sorted(set(n_top_features))
+        self.estimator = estimator
+        self.cross_validator = cross_validator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.workers = workers
+
+    @classmethod
+    def swept_models(cls, verification) -> tuple:
+        """Models optimised by the sweep, none with a time budget as sweeps are not killable like grid searches"""
+        time_budget = verification.time_budget or {}
+        if not verification.warm_start_sweep or time_budget.get('fit') or time_budget.get('search'):
+            return ()
+        return cls.supported_models
+
+    def __call__(self) -> dict:
+        """Return a fitted SweepResult for each n_top"""
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+        max_features = self.features[: max(self.n_top_features)]
+        compiled_grid = GridCompiler(self.estimator, self.cross_validator)(
+            self.param_grid, self.x_train[max_features], self.y_train
+        )
+        candidates = list(ParameterGrid(compiled_grid))
+        folds = self.fold_arrays(self.x_train[max_features])
+        Instrumentation.count_fits((len(folds) * len(candidates) + 1) * len(self.n_top_features))  # incl. refits
+
+        paths = Parallel(n_jobs=self.workers)(
+            delayed(fit_prefix_path)(
+                self.estimator,
+                params,
+                x_train,
+                y_train,
+                x_val,
+                y_val,
+                self.n_top_features,
+                scorer,
+            )
+            for x_train, y_train, x_val, y_val in folds
+            for params in candidates
+        )
+        test_scores = np.array(paths, dtype=float).reshape(len(folds), len(candidates), len(self.n_top_features))
+        test_scores = test_scores.transpose(2, 1, 0)  # -> n_top x candidate x fold
+
+        return {
+            n_top: self.__refit(n_top, candidates, test_scores[top_index])
+            for top_index, n_top in enumerate(self.n_top_features)
+        }
+
+    def fold_arrays(self, x_train: pd.DataFrame) -> list:
+        """Pre-sliced fold arrays, shared with other searches of the seed if the splitter is a FoldCache"""
+        if isinstance(self.cross_validator, FoldCache):
+            return self.cross_validator.fold_arrays(x_train, self.y_train)
+        x_values, y_values = x_train.to_numpy(), np.asarray(self.y_train)
+        return [
+            (
+                np.asfortranarray(x_values[train_index]),
+                y_values[train_index],
+                np.asfortranarray(x_values[val_index]),
+                y_values[val_index],
+            )
+            for train_index, val_index in self.cross_validator.split(x_train, self.y_train)
+        ]
+
+    def __refit(self, n_top: int, candidates: list, test_scores: np.ndarray) -> SweepResult:
+        """Select best parameters as GridSearchCV would (failed candidates rank last) and refit on all data"""
+        with np.errstate(invalid='ignore'):
+            mean_scores = test_scores.mean(axis=1)
+            std_scores = test_scores.std(axis=1)
+        ranking_scores = np.where(np.isnan(mean_scores), -np.inf, mean_scores)
+        best_index = int(np.argmax(ranking_scores))  # first maximum, same tie-breaking as GridSearchCV
+        best_params = candidates[best_index]
+
+        columns = self.features[:n_top]
+        best_estimator = clone(self.estimator).set_params(**best_params)
+        best_estimator.fit(self.x_train[columns], self.y_train)
+
+        cv_results = {
+            'params': candidates,
+            'mean_test_score': mean_scores,
+            'std_test_score': std_scores,
+            'rank_test_score': (-ranking_scores).argsort().argsort() + 1,
+        }
+        for fold_index in range(test_scores.shape[1]):
+            cv_results[f'split{fold_index}_test_score'] = test_scores[:, fold_index]
+
+        return SweepResult(best_estimator, best_params, mean_scores[best_index], cv_results)
+
+
+def fit_prefix_path(estimator, params, x_train, y_train, x_val, y_val, n_top_features, scorer) -> list:
+    """Fit one fold/parameter combination along all nested prefixes, return the validation score per n_top
+
+    Feature arrays are ordered by rank (column-major), so each prefix is a contiguous column slice.
+    """
+    scores = []
+    path_estimator, prev_n_top = None, None
+    for n_top in n_top_features:
+        if path_estimator is None:  # first prefix -> cold start
+            path_estimator = clone(estimator).set_params(**params, warm_start=True)
+        else:
+            pad_coefficients(path_estimator, n_top - prev_n_top)
+        path_estimator.fit(x_train[:, :n_top], y_train)  # invalid combinations are already pruned -> fail fast
+        scores.append(scorer(path_estimator, x_val[:, :n_top], y_val))
+        prev_n_top = n_top
+
+    return scores
+
+
+def pad_coefficients(estimator, n_new: int) -> None:
+    """Extend the previous solution with zero coefficients for the newly added features"""
+    if n_new > 0 and hasattr(estimator, 'coef_'):
+        pad_width = [(0, 0)] * (estimator.coef_.ndim - 1) + [(0, n_new)]
+        estimator.coef_ = np.pad(estimator.coef_, pad_width)
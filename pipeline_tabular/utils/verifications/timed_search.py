@@ -0,0 +1,163 @@
+import heapq
+import multiprocessing
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid
+
+from pipeline_tabular.utils.instrumentation import Instrumentation
+from pipeline_tabular.utils.verifications.nested_sweep import SweepResult
+
+
+class TimedGridSearch:
+    """Grid search with wall-clock budgets per fit and per search
+
+    Every fold/candidate fit runs in a forked process (the training data is inherited, not pickled), at most workers
+    at a time. A fit exceeding fit_timeout is killed and its candidate is scored as failed, i.e. ranks last, its other
+    running folds are killed and its remaining folds are skipped. Once search_timeout is exceeded, all unfinished
+    candidates are scored as failed. The refit of the best candidate on all data is not budgeted.
+    """
+
+    timeouts = []  # timed out grid points of the run, reported by Run
+
+    def __init__(self, estimator, param_grid, scoring, cv, workers: int, fit_timeout: float, search_timeout: float):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.cv = cv
+        self.workers = max(1, workers)
+        self.fit_timeout = fit_timeout or np.inf
+        self.search_timeout = search_timeout or np.inf
+
+    def fit(self, x_train: pd.DataFrame, y_train: pd.DataFrame) -> SweepResult:
+        """Return a fitted search result, same interface as a fitted GridSearchCV"""
+        candidates = list(ParameterGrid(self.param_grid))
+        folds = list(self.cv.split(x_train, y_train))
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+        test_scores = np.full((len(candidates), len(folds)), np.nan)
+        pending = [
+            (cand_index, fold_index) for cand_index in range(len(candidates)) for fold_index in range(len(folds))
+        ]
+        failed, running = set(), {}
+        free_slots = list(range(self.workers))  # lanes of the trace
+        context = multiprocessing.get_context('fork')
+        search_start = time.monotonic()
+
+        while pending or running:
+            search_over = time.monotonic() - search_start > self.search_timeout
+            while pending and len(running) < self.workers and not search_over:
+                cand_index, fold_index = pending.pop(0)
+                if cand_index in failed:
+                    continue
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=fit_and_score,
+                    args=(self.estimator, candidates[cand_index], x_train, y_train, folds[fold_index], scorer, sender),
+                    daemon=True,
+                )
+                process.start()
+                sender.close()
+                running[(cand_index, fold_index)] = (process, receiver, time.monotonic(), heapq.heappop(free_slots))
+
+            for task, (process, receiver, fit_start, slot) in list(running.items()):
+                if task not in running:  # fold of a candidate that failed meanwhile, already stopped
+                    continue
+                elapsed = time.monotonic() - fit_start
+                alive = process.is_alive()  # before polling: a child that sends its score and exits in between is done
+                if receiver.poll():
+                    test_scores[task] = receiver.recv()
+                    self.stop(running, task, free_slots, 'ok')
+                elif alive and elapsed < self.fit_timeout and not search_over:
+                    continue
+                elif alive:  # over budget -> kill, the other folds of the candidate are futile
+                    if task[0] not in failed:  # report each candidate once per search
+                        self.record_timeout(candidates[task[0]], 'search' if search_over else 'fit', elapsed)
+                    failed.add(task[0])
+                    for other_task in [other_task for other_task in running if other_task[0] == task[0]]:
+                        self.stop(running, other_task, free_slots, 'killed')
+                else:  # fit raised, the traceback is printed by the child -> fail fast as GridSearchCV
+                    for other_process, _, _, _ in running.values():
+                        other_process.kill()
+                    raise RuntimeError(f'Fit of {self.estimator.__class__.__name__} with {candidates[task[0]]} failed')
+            if search_over and pending:
+                for cand_index in sorted({cand_index for cand_index, _ in pending} - failed):
+                    self.record_timeout(candidates[cand_index], 'search', time.monotonic() - search_start)
+                failed.update(cand_index for cand_index, _ in pending)
+                pending = []
+            time.sleep(0.005)
+
+        test_scores[sorted(failed)] = np.nan
+        return self.refit(candidates, test_scores, x_train, y_train)
+
+    @staticmethod
+    def stop(running: dict, task: tuple, free_slots: list, status: str) -> None:
+        """Remove a finished or killed fit from the running fits and free its slot"""
+        process, receiver, fit_start, slot = running.pop(task)
+        if process.is_alive():
+            process.kill()
+        elapsed = time.monotonic() - fit_start
+        Instrumentation.event(
+            'fit',
+            time.time() - elapsed,
+            elapsed,
+            f'{Instrumentation.worker} fit {slot}',
+            candidate=task[0],
+            fold=task[1],
+            status=status,
+        )
+        process.join()
+        receiver.close()
+        heapq.heappush(free_slots, slot)
+
+    def refit(self, candidates: list, test_scores: np.ndarray, x_train, y_train) -> SweepResult:
+        """Select best candidate as GridSearchCV would (failed candidates rank last) and refit on all data"""
+        with np.errstate(invalid='ignore'):
+            mean_scores = test_scores.mean(axis=1)
+            std_scores = test_scores.std(axis=1)
+        if np.isnan(mean_scores).all():
+            raise RuntimeError(f'All candidates of {self.estimator.__class__.__name__} failed or exceeded the budget')
+        ranking_scores = np.where(np.isnan(mean_scores), -np.inf, mean_scores)
+        best_index = int(np.argmax(ranking_scores))
+        best_estimator = clone(self.estimator).set_params(**candidates[best_index])
+        best_estimator.fit(x_train, y_train)
+
+        cv_results = {
+            'params': candidates,
+            'mean_test_score': mean_scores,
+            'std_test_score': std_scores,
+            'rank_test_score': (-ranking_scores).argsort().argsort() + 1,
+        }
+        for fold_index in range(test_scores.shape[1]):
+            cv_results[f'split{fold_index}_test_score'] = test_scores[:, fold_index]
+
+        return SweepResult(best_estimator, candidates[best_index], mean_scores[best_index], cv_results)
+
+    def record_timeout(self, params: dict, reason: str, elapsed: float) -> None:
+        estimator_name = self.estimator.__class__.__name__
+        logger.warning(f'{estimator_name} with {params} exceeded the {reason} budget after {elapsed:.1f}s')
+        TimedGridSearch.timeouts.append(
+            {'estimator': estimator_name, 'params': str(params), 'reason': reason, 'elapsed': round(elapsed, 1)}
+        )
+
+    @classmethod
+    def save_report(cls, out_file: str) -> None:
+        """Summarise timed out grid points, e.g. to prune param_grids"""
+        if not cls.timeouts:
+            return
+        report = pd.DataFrame(cls.timeouts).groupby(['estimator', 'params', 'reason'])['elapsed']
+        report = report.agg(['count', 'max']).rename(columns={'count': 'n_searches', 'max': 'max_elapsed'})
+        report.sort_values('n_searches', ascending=False).to_csv(out_file)
+        logger.info(f'{len(cls.timeouts)} fits exceeded their time budget, see {out_file}')
+
+
+def fit_and_score(estimator, params, x_train, y_train, fold, scorer, sender) -> None:
+    """Fit one candidate on one fold in a child process and send the validation score"""
+    train_index, val_index = fold
+    estimator = clone(estimator).set_params(**params)
+    estimator.fit(x_train.iloc[train_index], y_train.iloc[train_index])
+    sender.send(scorer(estimator, x_train.iloc[val_index], y_train.iloc[val_index]))
+    sender.close()
@@ -1,14 +1,19 @@
 import pandas as pd
 import sklearn.metrics as metrics
-import imblearn.metrics as imb_metrics
 from loguru import logger
 from omegaconf import DictConfig
+from sklearn.base import clone
 from sklearn.ensemble import VotingClassifier, VotingRegressor
 from sklearn.model_selection import GridSearchCV
 from sklearn.preprocessing import LabelEncoder
 
-from pipeline_tabular.utils.helpers import init_estimator
+from pipeline_tabular.utils.helpers import init_estimator, job_name_cleaner, job_steps, translate_param_grid
+from pipeline_tabular.utils.instrumentation import Instrumentation, stage
 from pipeline_tabular.utils.normalisers import Normalisers
+from pipeline_tabular.utils.resources import ResourceManager
+from pipeline_tabular.utils.verifications.grid_compiler import GridCompiler
+from pipeline_tabular.utils.verifications.nested_sweep import NestedFeatureSweep
+from pipeline_tabular.utils.verifications.timed_search import TimedGridSearch
 from pipeline_tabular.data_handler.data_handler import DataHandler, NestedDefaultDict
 
 
@@ -25,25 +30,42 @@ class CrossValidation:
         scoring: str,
         seed: int,
         workers: int,
+        time_budget: dict = None,
     ) -> None:
         self.x_train = x_train
         self.y_train = y_train
         self.estimator = estimator
         self.cross_validator = cross_validator
-        self.param_grid = dict(param_grid)
+        self.param_grid = param_grid
         self.scoring = scoring
         self.seed = seed
         self.workers = workers
+        self.time_budget = time_budget or {}
 
     def __call__(self):
-        selector = GridSearchCV(
-            estimator=self.estimator,
-            param_grid=self.param_grid,
-            scoring=self.scoring,
-            cv=self.cross_validator,
-            n_jobs=self.workers,
-        )
-        selector.fit(self.x_train, self.y_train)
+        param_grid = GridCompiler(self.estimator, self.cross_validator)(self.param_grid, self.x_train, self.y_train)
+        Instrumentation.count_fits(len(param_grid) * self.cross_validator.get_n_splits() + 1)  # incl. refit
+        with stage('grid_search', estimator=self.estimator.__class__.__name__):
+            if self.time_budget.get('fit') or self.time_budget.get('search'):  # fits need to be killable
+                selector = TimedGridSearch(
+                    self.estimator,
+                    param_grid,
+                    self.scoring,
+                    self.cross_validator,
+                    self.workers,
+                    self.time_budget.get('fit'),
+                    self.time_budget.get('search'),
+                )
+                return selector.fit(self.x_train, self.y_train)
+            selector = GridSearchCV(
+                estimator=self.estimator,
+                param_grid=param_grid,
+                scoring=self.scoring,
+                cv=self.cross_validator,
+                n_jobs=self.workers,
+                error_score='raise',  # invalid combinations are already pruned, remaining errors should fail fast
+            )
+            selector.fit(self.x_train, self.y_train)
         return selector
 
 
@@ -53,12 +75,16 @@ class Verification(DataHandler, Normalisers):
     def __init__(self, config: DictConfig) -> None:
         super().__init__()
         self.config = config
-        self.workers = config.meta.workers
+        cpu_layout = ResourceManager(config)()
+        self.workers = cpu_layout['search']
+        self.estimator_workers = cpu_layout['estimator']
         self.learn_task = config.meta.learn_task
         self.target_label = config.meta.target_label
         self.train_scoring = config.selection.scoring
         self.class_weight = config.selection.class_weight
         self.n_top_features = config.verification.use_n_top_features
+        self.swept_models = NestedFeatureSweep.swept_models(config.verification)
+        self.time_budget = config.verification.time_budget
         v_scoring_dict = config.collect_results.metrics_to_collect[self.learn_task]
         self.verif_scoring = [
             v_scoring
@@ -67,12 +93,20 @@ class Verification(DataHandler, Normalisers):
         ]
         models_dict = config.verification.models
         self.param_grids = config.verification.param_grids
+        self.backends = config.verification.backends
         self.models = [model for model in models_dict if models_dict[model]]
         self.ensemble = [model for model in self.models if 'ensemble' in model]  # only ensemble models
         self.models = [model for model in self.models if model not in self.ensemble]
         if len(self.models) < 2:  # ensemble methods need at least two models to combine their results
             self.ensemble = []
         self.best_estimators = NestedDefaultDict()
+        self.swept_estimators = NestedDefaultDict()
+        jobs = job_steps(config.selection.jobs)
+        default_norm = next((step for step in jobs[0] if 'norm' in step), None) if jobs else None
+        self.job_norms = {  # jobs without normalisation use the one of the first job
+            job_name: next((step for step in steps if 'norm' in step), default_norm)
+            for steps, job_name in zip(jobs, job_name_cleaner(config.selection.jobs))
+        }
 
     def __call__(self, seed, boot_iter, job_name, imputer, model=None, n_top_features=None, explain_mode=False):
         """Train classifier to verify final feature importance"""
@@ -82,30 +116,91 @@ class Verification(DataHandler, Normalisers):
         self.models = model if model is not None else self.models  # single model provided by Explain class
         self.explain_mode = explain_mode
 
-        self.train_test_split()
-        top_features = self.get_store('feature', seed, job_name, boot_iter)
-        if not explain_mode:
-            n_top_features = [n for n in self.n_top_features if n <= len(top_features)]
-            if not n_top_features:
-                n_top_features = [len(top_features)]  # ensure that list is not empty
-        for n_top in n_top_features:
-            logger.info(f'Verifying final feature importance for top {n_top} features...')
-            self.top_features = top_features[:n_top]
-            self.train_models(f'{job_name}_{n_top}')  # optimise all models
-            pred_function, estimator = self.evaluate(
-                f'{job_name}_{n_top}'
-            )  # evaluate all optimised models
+        with stage('verification', seed=seed, boot_iter=boot_iter, job=job_name):
+            self.train_test_split(job_name)
+            top_features = self.get_store('feature', seed, job_name, boot_iter)
+            self.swept_estimators = NestedDefaultDict()
+            if not explain_mode:
+                n_top_features = self.valid_n_top(top_features, n_top_features)
+                if not n_top_features:  # e.g. a scheduled task of an n_top above the number of selected features
+                    return None, None, self.x_train, self.x_test
+                self.sweep_models(job_name, top_features, n_top_features)
+            for n_top in n_top_features:
+                logger.info(f'Verifying final feature importance for top {n_top} features...')
+                self.top_features = top_features[:n_top]
+                self.x_train_top = self.executor.publish(self.x_train[self.top_features], seed, f'x_train_{n_top}')
+                self.train_models(f'{job_name}_{n_top}')  # optimise all models
+                pred_function, estimator = self.evaluate(
+                    f'{job_name}_{n_top}'
+                )  # evaluate all optimised models
 
         return pred_function, estimator, self.x_train, self.x_test  # only needed for Explain class
 
-    def train_test_split(self) -> None:
-        """Prepare data for training"""
-        train = self.get_store('frame', self.seed, 'train')
-        test = self.get_store('frame', self.seed, 'test')
+    def valid_n_top(self, top_features: list, n_top_features: list = None) -> list:
+        """Configured n_top not exceeding the number of features, restricted to n_top_features if given (e.g. by a
+        scheduled task), if none is valid all features are used by the task of the smallest configured n_top"""
+        valid = [n for n in self.n_top_features if n <= len(top_features)]
+        if n_top_features is None:
+            return valid or [len(top_features)]  # ensure that list is not empty
+        if not valid and min(self.n_top_features) in n_top_features:
+            return [len(top_features)]
+        return [n for n in n_top_features if n in valid]
+
+    def train_test_split(self, job_name: str) -> None:
+        """Prepare data for training, normalise copies of the stored frames with the normalisation of the job
+
+        The scaler is fit on the whole training frame, the scalers are per column, hence the selected features are
+        normalised as during selection. Sequential and scheduled runs thus verify on the same frames.
+        """
+        train = self.get_store('frame', self.seed, 'train').copy()
+        test = self.get_store('frame', self.seed, 'test').copy()
+        norm = self.job_norms.get(job_name)
+        if norm is not None:
+            train, _ = getattr(self, norm)(train)
         self.x_train, self.y_train, _ = self.split_frame(train)
-        self.x_test, self.y_test, self.x_test_raw = self.split_frame(
-            test, normalise=True
-        )  # test data not yet normalised
+        self.x_train = self.executor.publish(self.x_train, self.seed, 'x_train')
+        self.x_test, self.y_test, self.x_test_raw = self.split_frame(test, normalise=norm is not None)
+
+    def sweep_models(self, job_name, top_features, n_top_features) -> None:
+        """Optimise linear models for all n_top at once, warm-starting along the nested feature prefixes"""
+        for model in self.models:
+            if model not in self.swept_models:
+                continue
+            missing_n_top = []  # only sweep over n_top for which this bootstrap has not yet been evaluated
+            for n_top in n_top_features:
+                try:
+                    scores = self.get_store('score', self.seed, f'{job_name}_{n_top}')[model]
+                except KeyError:  # model not yet stored for this seed/job
+                    scores = {scoring: [] for scoring in self.verif_scoring}
+                if len(scores[self.verif_scoring[0]]) < self.boot_iter + 1 and not scores.get('pruned', False):
+                    missing_n_top.append(n_top)
+            if not missing_n_top:
+                continue
+            logger.info(f'Sweeping {model} model over top {missing_n_top} features...')
+            self.streams.seed_global('sweep', self.seed, self.boot_iter, job_name, model)
+            backend = self.backends.get(model, 'sklearn')
+            estimator, cross_validator, scoring = init_estimator(
+                model,
+                self.learn_task,
+                self.seed,
+                self.train_scoring,
+                self.class_weight,
+                self.estimator_workers,
+                backend,
+            )
+            sweep = NestedFeatureSweep(
+                self.x_train,
+                self.y_train,
+                top_features,
+                missing_n_top,
+                estimator,
+                cross_validator,
+                translate_param_grid(model, self.learn_task, self.param_grids[model], backend),
+                scoring,
+                self.workers,
+            )
+            with stage('sweep', model=model):
+                self.swept_estimators[model] = sweep()
 
     def train_models(self, job_name) -> None:
         """Train classifier to verify feature importance"""
@@ -115,28 +210,40 @@ class Verification(DataHandler, Normalisers):
                 scores = self.get_store('score', self.seed, job_name)[model]
             except KeyError:  # model not yet stored for this seed/job
                 scores = {scoring: [] for scoring in self.verif_scoring}
+            if scores.get('pruned', False) and not self.explain_mode:  # dominated cell, see Racing
+                continue
             if len(scores[self.verif_scoring[0]]) < self.boot_iter + 1 or self.explain_mode:  # bootstraps missing
-                logger.info(f'Training {model} model...')
-                param_grid = self.param_grids[model]
-                estimator, cross_validator, scoring = init_estimator(
-                    model,
-                    self.learn_task,
-                    self.seed,
-                    self.train_scoring,
-                    self.class_weight,
-                    self.workers,
-                )
-                optimiser = CrossValidation(
-                    self.x_train[self.top_features],
-                    self.y_train,
-                    estimator,
-                    cross_validator,
-                    param_grid,
-                    scoring,
-                    self.seed,
-                    self.workers,
-                )
-                best_estimator = optimiser()
+                if len(self.top_features) in self.swept_estimators[model]:  # already optimised during sweep
+                    best_estimator = self.swept_estimators[model][len(self.top_features)]
+                else:
+                    logger.info(f'Training {model} model...')
+                    self.streams.seed_global('verification', self.seed, self.boot_iter, job_name, model)
+                    backend = self.backends.get(model, 'sklearn')
+                    param_grid = translate_param_grid(model, self.learn_task, self.param_grids[model], backend)
+                    estimator, cross_validator, scoring = init_estimator(
+                        model,
+                        self.learn_task,
+                        self.seed,
+                        self.train_scoring,
+                        self.class_weight,
+                        self.estimator_workers,
+                        backend,
+                    )
+                    optimiser = CrossValidation(
+                        self.x_train_top,
+                        self.y_train,
+                        estimator,
+                        cross_validator,
+                        param_grid,
+                        scoring,
+                        self.seed,
+                        self.workers,
+                        self.time_budget,
+                    )
+                    with stage('search', model=model, n_top=len(self.top_features)):
+                        best_estimator = optimiser()
+                if self.needs_probabilities():
+                    self.calibrate(best_estimator)
                 estimators.append((model, best_estimator))
                 self.best_estimators[model] = best_estimator  # store for evaluation later
 
@@ -161,6 +268,22 @@ class Verification(DataHandler, Normalisers):
 
             self.best_estimators[ensemble] = ens_estimator  # store for evaluation later
 
+    def needs_probabilities(self) -> bool:
+        """Whether a consumer of the best estimators relies on predict_proba (Explain or soft voting)"""
+        soft_voting = self.learn_task == 'binary_classification' and any('voting' in ens for ens in self.ensemble)
+        return self.explain_mode or soft_voting
+
+    def calibrate(self, search) -> None:
+        """Refit the best estimator with probability calibration if it was searched without (e.g. SVM)
+
+        Calibration (libsvm's internal 5-fold Platt scaling) is only done once for the final refit instead of for
+        every fit during the search, the decision function is not affected by it.
+        """
+        estimator = search.best_estimator_
+        if not estimator.get_params().get('probability', True):
+            search.best_estimator_ = clone(estimator).set_params(probability=True)
+            search.best_estimator_.fit(self.x_train_top, self.y_train)
+
     def evaluate(self, job_name):
         """Evaluate all optimised models"""
         # pred_func = None
@@ -169,11 +292,14 @@ class Verification(DataHandler, Normalisers):
         for i, model in enumerate(models):
             if model not in scores.keys():
                 scores[model] = {scoring: [] for scoring in self.verif_scoring + ['probas', 'true', 'pred', 'pos_rate']}
+            if scores[model].get('pruned', False) and not self.explain_mode:
+                continue
             if len(scores[model][self.verif_scoring[0]]) < self.boot_iter + 1 or self.explain_mode:
                 logger.info(f'Evaluating {model} model ({i+1}/{len(models)})...')
                 estimator = self.best_estimators[model]
-                y_pred = estimator.predict(self.x_test[self.top_features])
-                pred_func, probas = self.get_predictions(estimator)
+                with stage('evaluate', model=model, n_top=len(self.top_features)):
+                    y_pred = estimator.predict(self.x_test[self.top_features])
+                    pred_func, probas = self.get_predictions(estimator)
                 if self.explain_mode:
                     return pred_func, estimator.best_estimator_
                 for score in self.verif_scoring:  # calculate and store all requested scores
@@ -184,6 +310,8 @@ class Verification(DataHandler, Normalisers):
                     except ValueError:
                         scores[model][score].append(getattr(metrics, score)(self.y_test, y_pred))
                     except AttributeError:  # try imbalanced learn metrics (e.g. for specificity)
+                        import imblearn.metrics as imb_metrics
+
                         try:
                             scores[model][score].append(getattr(imb_metrics, score)(self.y_test, probas))
                         except ValueError:
@@ -205,7 +333,7 @@ class Verification(DataHandler, Normalisers):
         except AttributeError:  # other estimators
             probas = best_estimator.predict_proba(self.x_test[self.top_features])[:, 1]
 
-        pred_func = best_estimator.predict_proba
+        pred_func = getattr(best_estimator, 'predict_proba', None)  # only available if calibrated
         return pred_func, probas
 
     def split_frame(self, frame: pd.DataFrame, normalise=False) -> tuple: